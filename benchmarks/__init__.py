@@ -0,0 +1,30 @@
+"""Benchmarks for den's hot paths.
+
+Each module can be run on its own, e.g. ``python -m benchmarks.lineprotocol``.
+
+"""
+
+from __future__ import absolute_import, print_function
+import os
+import timeit
+
+RESPONSES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "responses.txt")
+"""A small recorded Nest API stream."""
+
+
+def read_responses(path=RESPONSES):
+    """Read the lines of a recorded Nest API stream as bytes."""
+    with open(path, "rb") as f:
+        return [l.rstrip(b"\r\n") for l in f]
+
+
+def bench(name, func, number=100, repeat=5):
+    """Time ``func`` and print the best time per call.
+
+    :rtype: :py:class:`float`
+    :returns: The best number of seconds per call.
+
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("{:<40} {:>12.1f} us".format(name, best * 1e6))
+    return best
@@ -0,0 +1,74 @@
+"""Measure gzip compressed database writes: bytes on the wire against the CPU time spent compressing.
+
+Write bodies are encoded from a synthetic stream, one point per thermostat per second, in batches of several sizes.
+Each is compressed at several levels, and each level is then written through a :py:class:`LineProtocolWriter` to the
+stand-in InfluxDB to count the bytes it receives.
+
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+from influxdb import InfluxDBClient
+
+from den import thermostat
+from den.lineprotocol import LineProtocolWriter, PointBatch, gzip_compress
+from den.sse import Parser
+
+from . import bench, synthetic
+from .influxd import InfluxDB
+
+BATCH_SIZES = (10, 100, 1000, 5000)
+"""The numbers of points per write body."""
+
+LEVELS = (1, 6, 9)
+"""The compression levels compared."""
+
+
+def _get_bodies(batch_size, thermostats=10, count=5):
+    """Encode ``count`` write bodies of ``batch_size`` points from a synthetic stream."""
+    events = (batch_size * count) // (thermostats + 1) + 1
+    parser = Parser()
+    batch = PointBatch()
+    bodies = []
+    for sequence, data in synthetic.generate(events, thermostats, keep_alive_interval=0):
+        for event in parser.feed(data):
+            value = json.loads(event.data.decode("utf-8"))
+            start = len(batch)
+            thermostat._get_structure_points(value, batch=batch)  # pylint: disable=protected-access
+            thermostat._get_thermostat_points(value, batch=batch)  # pylint: disable=protected-access
+            batch.stamp(1500000000 + sequence, start)
+        if len(batch) >= batch_size:
+            bodies.append(batch.encode())
+            batch = PointBatch(encoder=batch.encoder)
+    return bodies[:count]
+
+
+def _write(bodies, gzip_level):
+    """Write ``bodies`` to a stand-in InfluxDB and get the number of bytes it received."""
+    with InfluxDB() as influxdb:
+        db = LineProtocolWriter(InfluxDBClient(port=influxdb.port, database="test"), "test", gzip_level=gzip_level)
+        for body in bodies:
+            db.write(body, "s")
+        return influxdb.wire_bytes
+
+
+def main():
+    """Run the benchmark."""
+    for batch_size in BATCH_SIZES:
+        bodies = _get_bodies(batch_size)
+        size = sum(len(b) for b in bodies)
+        print("{} bodies of about {} points, {} bytes".format(len(bodies), batch_size, size))
+        for level in LEVELS:
+            compressed = sum(len(gzip_compress(b, level)) for b in bodies)
+            compress = lambda: [gzip_compress(b, level) for b in bodies]  # pylint: disable=cell-var-from-loop
+            best = bench("gzip level {}".format(level), compress, 10, 3)
+            print("{:<40} {:>9.1f}x {:>9.1f} MB/s".format(
+                "gzip level {} ratio, speed".format(level), size / float(compressed), size / best / 1e6))
+        received = [_write(bodies, level) for level in (None, ) + LEVELS]
+        print("{:<40} {}".format("bytes received, plain and per level", " ".join(str(r) for r in received)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Compare the installed JSON backends on recorded Nest snapshots."""
+
+from __future__ import absolute_import, print_function
+
+from den import jsonbackend
+from den.sse import Parser
+
+from . import bench, read_responses
+
+
+def main():
+    """Run the benchmark."""
+    parser = Parser()
+    events = parser.feed(b"\n".join(read_responses())) + parser.close()
+    payloads = [e.data for e in events]
+    size = sum(len(p) for p in payloads) // len(payloads)
+    print("Decoding {} snapshots of {} bytes on average".format(len(payloads), size))
+    print("Active backend {}".format(jsonbackend.NAME))
+    baseline = None
+    for name in reversed(jsonbackend.BACKENDS):
+        try:
+            loads = jsonbackend.get_loads(name)
+        except ImportError:
+            print("{:<40} {:>15}".format(name, "not installed"))
+            continue
+        best = bench(name, lambda: [loads(p) for p in payloads])  # pylint: disable=cell-var-from-loop
+        baseline = baseline or best
+        print("{:<40} {:>14.1f}x".format(name + " speedup", baseline / best))
+
+
+if __name__ == "__main__":
+    main()
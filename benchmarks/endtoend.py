@@ -0,0 +1,244 @@
+"""Measure :py:func:`den.thermostat.record` end to end against local stand-ins for the Nest API and InfluxDB.
+
+A synthetic stream is served over HTTP to ``record`` running in a child process, which writes to a stand-in InfluxDB.
+Throughput runs send the stream as fast as possible and report the best events per second.  A latency run then sends
+it at a steady rate and reports the p50 and p99 latency from sending an event to its points arriving at the database.
+The peak resident set size of the child processes is reported too.
+
+Results are appended to a file, ``.benchmarks/endtoend.jsonl`` by default, and compared with the last result of the
+same configuration.  The exit status is ``1`` when a metric regressed by more than the tolerance.
+
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from den import thermostat
+
+from . import synthetic
+from .influxd import InfluxDB
+
+RESULTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".benchmarks", "endtoend.jsonl")
+"""Default file the results are appended to."""
+
+TOLERANCE = 0.1
+"""Default fraction by which a metric may get worse before it is reported as a regression."""
+
+CONFIG = ("events", "structures", "thermostats", "rate", "latency_events", "batch_size", "max_latency", "db_latency")
+"""The keys of a result which must match for it to be compared with another."""
+
+_CONFIG_DEFAULTS = {"structures": 1}
+"""The configuration of results saved before a key was added to it."""
+
+_SEQUENCE = re.compile(synthetic.SEQUENCE_FIELD.encode("ascii") + br"=(\d+)")
+
+
+class _Stream(object):
+    """Serve a synthetic stream to one client, recording when each event is sent."""
+
+    def __init__(self, events, rate):
+        self.events = events
+        self.rate = rate
+        self.sent = {}
+        self._server = HTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.handle_request, name="nestd")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def port(self):
+        """The port the server is listening on."""
+        return self._server.server_address[1]
+
+    def close(self):
+        """Stop serving."""
+        self._thread.join()
+        self._server.server_close()
+
+    def _handler(self):
+        """Get a request handler class which sends the stream."""
+        stream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Send the stream."""
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                """Do not log requests."""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Send every event, then close the connection."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                start = time.time()
+                for i, (sequence, event) in enumerate(stream.events):
+                    if stream.rate:
+                        delay = start + i / stream.rate - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                    self.wfile.write(event)
+                    if sequence is not None:
+                        stream.sent[sequence] = time.time()
+                self.wfile.flush()
+
+        return Handler
+
+
+def _record(port, influxdb_port, batch_size, max_latency):
+    """Run :py:func:`den.thermostat.record` against the stand-ins."""
+    logging.disable(logging.WARNING)
+    thermostat.NEST_API_PROTOCOL = "http"
+    thermostat.NEST_API_LOCATION = "127.0.0.1:%d" % port
+    thermostat.record("benchmark", influxdb_port, False, "TOKEN", batch_size, max_latency)
+
+
+def _run(events, rate, batch_size, max_latency, db_latency=0.0):
+    """Stream ``events`` to ``record`` and get when each was sent and when its points arrived."""
+    arrived = {}
+
+    def on_write(body, now):
+        """Record the first arrival of each event's points."""
+        for sequence in _SEQUENCE.findall(body):
+            arrived.setdefault(int(sequence), now)
+
+    with InfluxDB(on_write=on_write, latency=db_latency) as influxdb:
+        stream = _Stream(events, rate)
+        child = multiprocessing.Process(target=_record, args=(stream.port, influxdb.port, batch_size, max_latency))
+        child.start()
+        child.join()
+        stream.close()
+    if child.exitcode:
+        raise RuntimeError("record exited with %d" % child.exitcode)
+    return stream.sent, arrived
+
+
+def _percentile(values, percentile):
+    """Get the ``percentile`` of ``values``."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile / 100.0))]
+
+
+def _revision():
+    """Get the current git revision, if there is one."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(result, path, tolerance):
+    """Compare ``result`` with the last result of the same configuration saved in ``path``.
+
+    :rtype: :py:class:`list`
+    :returns: The names of the metrics which regressed.
+
+    """
+    last = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                previous = json.loads(line)
+                if all(previous.get(k, _CONFIG_DEFAULTS.get(k)) == result[k] for k in CONFIG):
+                    last = previous
+    if last is None:
+        print("No previous result to compare with")
+        return []
+    regressions = []
+    for name, higher_is_better in (("events_per_sec", True), ("p50_ms", False), ("p99_ms", False),
+                                   ("peak_rss_kb", False)):
+        change = (result[name] - last[name]) / float(last[name]) if last[name] else 0.0
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print("{:<40} {:>+11.1f}% {}".format(name + " vs " + str(last.get("revision")), change * 100, flag))
+    return regressions
+
+
+def _get_parser():
+    """Get a command line argument parser."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000, help="Number of put events.")
+    parser.add_argument("--structures", type=int, default=1, help="Number of structures.")
+    parser.add_argument("--thermostats", type=int, default=2, help="Number of thermostats, spread across structures.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of throughput runs, the best is reported.")
+    parser.add_argument("--rate", type=float, default=200, help="Events per second sent in the latency run.")
+    parser.add_argument("--latency-events", type=int, default=1000, help="Number of events sent in the latency run.")
+    parser.add_argument("--batch-size", type=int, default=thermostat.BATCH_SIZE, help="record batch size.")
+    parser.add_argument("--max-latency", type=float, default=0.1, help="record maximum write latency.")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds the database delays each response by.")
+    parser.add_argument("--save", default=RESULTS, help="File to append results to.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Fraction a metric may get worse by.")
+    return parser
+
+
+def main(argv=None):
+    """Run the benchmark."""
+    args = _get_parser().parse_args(argv)
+    events = list(synthetic.generate(args.events, args.thermostats, structures=args.structures))
+    print("Streaming {} events for {} thermostats in {} structures".format(
+        args.events, args.thermostats, args.structures))
+
+    events_per_sec = 0
+    for _ in range(args.repeat):
+        sent, arrived = _run(events, 0, args.batch_size, args.max_latency, args.db_latency)
+        if len(arrived) != args.events:
+            raise RuntimeError("%d of %d events arrived" % (len(arrived), args.events))
+        events_per_sec = max(events_per_sec, args.events / (max(arrived.values()) - min(sent.values())))
+    print("{:<40} {:>12.0f}".format("events/sec", events_per_sec))
+
+    sent, arrived = _run(events[:args.latency_events], args.rate, args.batch_size, args.max_latency,
+                         args.db_latency)
+    latencies = [arrived[s] - sent[s] for s in sent]
+    p50 = _percentile(latencies, 50) * 1e3
+    p99 = _percentile(latencies, 99) * 1e3
+    print("{:<40} {:>12.1f} ms".format("p50 event to write latency", p50))
+    print("{:<40} {:>12.1f} ms".format("p99 event to write latency", p99))
+
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print("{:<40} {:>12d} KiB".format("peak RSS", peak_rss))
+
+    result = {
+        "time": time.time(),
+        "revision": _revision(),
+        "python": sys.version.split()[0],
+        "events": args.events,
+        "structures": args.structures,
+        "thermostats": args.thermostats,
+        "rate": args.rate,
+        "latency_events": args.latency_events,
+        "batch_size": args.batch_size,
+        "max_latency": args.max_latency,
+        "db_latency": args.db_latency,
+        "events_per_sec": events_per_sec,
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "peak_rss_kb": peak_rss,
+    }
+    regressions = _compare(result, args.save, args.tolerance)
+    directory = os.path.dirname(args.save)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(args.save, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Measure per-event processing latency with synchronous and queued, sampled logging.
+
+Sampling and queueing are measured separately.  Nearly all of the median latency saved comes from sampling payload
+dumps, which skips formatting them.  A :py:class:`logging.handlers.QueueHandler` still formats each record on the
+logging thread before queueing it, so queueing only moves the file writes off that thread.  The p99 depends on disk
+and scheduler noise and varies widely between runs.
+
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import logging.handlers
+import os
+import shutil
+import tempfile
+import time
+
+from den import SampledLogger, thermostat
+from den.sse import Parser
+
+from . import read_responses
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+    import queue
+except ImportError:
+    QueueHandler = QueueListener = None
+
+REPEAT = 200
+"""Number of times the recorded stream is repeated."""
+
+
+def _events():
+    """Get the events of the recorded stream."""
+    parser = Parser()
+    return parser.feed(b"\n".join(read_responses())) + parser.close()
+
+
+def _file_handler(directory):
+    """Get a debug file handler like the den log's."""
+    handler = logging.handlers.RotatingFileHandler(os.path.join(directory, "den.log"), maxBytes=2**20)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(module)s.%(funcName)s %(message)s"))
+    return handler
+
+
+def _process(events, log, debug):
+    """Process ``events`` as :py:func:`den.thermostat.collect` does, returning each event's latency."""
+    latencies = []
+    state = {}
+    for event in events:
+        start = time.time()
+        value = thermostat._handle(state, event)  # pylint: disable=protected-access
+        if value:
+            points = thermostat._get_structure_points(value)  # pylint: disable=protected-access
+            points += thermostat._get_thermostat_points(value)  # pylint: disable=protected-access
+            debug(log, value, points)
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def _report(name, latencies):
+    """Print and get the p50 and p99 of ``latencies``."""
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print("{:<40} p50 {:>8.1f} us  p99 {:>8.1f} us".format(name, p50 * 1e6, p99 * 1e6))
+    return p50, p99
+
+
+def _speedup(name, before, after):
+    """Print the p50 and p99 speedup from ``before`` to ``after``."""
+    print("{:<40} p50 {:>8.1f}x     p99 {:>8.1f}x".format(name, before[0] / after[0], before[1] / after[1]))
+
+
+def main():
+    """Run the benchmark."""
+    events = _events() * REPEAT
+    print("Processing {} events".format(len(events)))
+    directory = tempfile.mkdtemp()
+    try:
+        logger = logging.getLogger("benchmarks.eventlog")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+
+        handler = _file_handler(directory)
+        logger.addHandler(handler)
+
+        def full(log, value, points):
+            """Log every payload, as ``collect`` used to."""
+            log.debug(value)
+            log.debug(points)
+
+        def sample(log, value, points):
+            """Log a sample of payloads, as ``collect`` does."""
+            log.debug("%s %s", value, points)
+
+        synchronous = _report("synchronous, every payload", _process(events, logger, full))
+        sampled = _report("synchronous, sampled payloads", _process(events, SampledLogger(logger), sample))
+        _speedup("speedup of sampling", synchronous, sampled)
+        logger.removeHandler(handler)
+
+        if QueueListener is None:
+            print("Queued logging requires Python 3")
+            return
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        logger.addHandler(QueueHandler(log_queue))
+        queued = _report("queued, sampled payloads", _process(events, SampledLogger(logger), sample))
+        listener.stop()
+        _speedup("speedup of queueing", sampled, queued)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""A stand-in for the InfluxDB HTTP API.
+
+:py:class:`InfluxDB` implements enough of ``/ping``, ``/query`` and ``/write`` for :py:class:`influxdb.InfluxDBClient`
+and den's writers to run against it without a real database.  It counts the writes, points and bytes it accepts,
+passes each accepted write body to an optional callback and can misbehave on purpose.  Writes with a
+``Content-Encoding: gzip`` header are decompressed first, and :py:attr:`InfluxDB.wire_bytes` counts the bytes received
+before decompression.
+
+
+* ``latency`` delays every response.
+* ``error_rate`` fails that fraction of writes with a ``500`` error, and :py:meth:`InfluxDB.fail` fails the next
+  writes with any status.
+* writes with a line that is not valid line protocol are rejected with ``400``, as InfluxDB does.
+* ``throttle`` limits the number of writes per second, rejecting the excess with ``429`` and a ``Retry-After``
+  header.
+
+Run it on its own to point den at it::
+
+    python -m benchmarks.influxd --port 8086 --error-rate 0.1
+
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+VERSION = "1.8.10"
+"""The InfluxDB version reported by the stand-in."""
+
+_LINE = re.compile(br"^(?:[^ ,\\]|\\.)+(?:,(?:[^ ,=\\]|\\.)+=(?:[^ ,\\]|\\.)+)* (?:[^ ,=\\]|\\.)+=\S")
+"""The start of a line protocol line: a measurement, any tags, a space and a field key and value."""
+
+
+def _parse_error(line):
+    """Get the InfluxDB error for the invalid line protocol ``line``."""
+    return "unable to parse '%s': missing fields" % line.decode("utf-8", "replace")
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handle InfluxDB API requests."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log requests."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle ``/ping`` and ``/query``."""
+        self._dispatch(b"")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle ``/write`` and ``/query``."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._dispatch(body, self.headers.get("Content-Encoding"))
+
+    def _dispatch(self, body, encoding=None):
+        """Respond to a request with ``body``."""
+        split = urlsplit(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(split.query).items())
+        influxdb = self.server.influxdb
+        if influxdb.latency:
+            time.sleep(influxdb.latency)
+        if split.path == "/ping":
+            self._respond(204)
+        elif split.path == "/query":
+            if body:
+                params.update((k, v[-1]) for k, v in parse_qs(body.decode("utf-8")).items())
+            self._respond(200, influxdb.query(params.get("q", "")))
+        elif split.path == "/write" and self.command == "POST":
+            code, error, headers = influxdb.write(body, params, encoding)
+            self._respond(code, {"error": error} if error else None, headers)
+        else:
+            self._respond(404, {"error": "not found"})
+
+    def _respond(self, code, body=None, headers=None):
+        """Send a response with an optional JSON ``body``."""
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Influxdb-Version", VERSION)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class InfluxDB(object):
+    """A stand-in InfluxDB server running in a background thread.
+
+    :param int port: (optional) The port to listen on, by default any free port.
+    :param on_write: (optional) A function called with the body of each accepted write and the time it arrived.
+    :param float latency: (optional) The number of seconds to delay every response by.
+    :param float error_rate: (optional) The fraction of writes to fail with a ``500`` error.
+    :param float throttle: (optional) The maximum number of writes per second, by default unlimited.
+    :param int seed: (optional) The random seed of injected errors.
+
+    """
+
+    def __init__(self, port=0, on_write=None, latency=0.0, error_rate=0.0, throttle=None, seed=0):
+        self.on_write = on_write
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.databases = set()
+        self.writes = 0
+        self.points = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.queries = 0
+        self.rejected = {}
+        self._failures = []
+        self._random = random.Random(seed)
+        self._window = (0, 0)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.influxdb = self
+        self._thread = None
+
+    @property
+    def port(self):
+        """The port the server is listening on."""
+        return self._server.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start serving."""
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05, ), name="influxd")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def fail(self, count=1, code=500, error="timeout"):
+        """Fail the next ``count`` writes with the status ``code`` and ``error`` message."""
+        with self._lock:
+            self._failures.extend([(code, error)] * count)
+
+    def query(self, q):
+        """Answer the query ``q``.
+
+        ``CREATE DATABASE``, ``DROP DATABASE`` and ``SHOW DATABASES`` are supported.  Any other query has no results.
+
+        """
+        with self._lock:
+            self.queries += 1
+            words = q.split()
+            statement = " ".join(words[:2]).upper()
+            if statement == "CREATE DATABASE" and len(words) > 2:
+                self.databases.add(words[2].strip('"'))
+            elif statement == "DROP DATABASE" and len(words) > 2:
+                self.databases.discard(words[2].strip('"'))
+            elif statement == "SHOW DATABASES":
+                series = {"name": "databases", "columns": ["name"], "values": [[d] for d in sorted(self.databases)]}
+                return {"results": [{"statement_id": 0, "series": [series]}]}
+        return {"results": [{"statement_id": 0}]}
+
+    def write(self, body, params, encoding=None):
+        """Accept or reject a write of ``body``.
+
+        :param bytes body:
+        :param dict params: The query parameters of the write.
+        :param str encoding: (optional) The ``Content-Encoding`` of ``body``, ``gzip`` or none.
+        :rtype: :py:class:`tuple`
+        :returns: The response status, error message and headers.
+
+        """
+        now = time.time()
+        wire_bytes = len(body)
+        with self._lock:
+            if encoding == "gzip":
+                try:
+                    body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+                except zlib.error as e:
+                    self.rejected[400] = self.rejected.get(400, 0) + 1
+                    return 400, "gzip: %s" % e, None
+            elif encoding not in (None, "identity"):
+                self.rejected[415] = self.rejected.get(415, 0) + 1
+                return 415, "unsupported content encoding '%s'" % encoding, None
+            code, error, headers = self._reject(body, params, now)
+            if code != 204:
+                self.rejected[code] = self.rejected.get(code, 0) + 1
+                return code, error, headers
+            self.writes += 1
+            self.points += len([l for l in body.split(b"\n") if l.strip()])
+            self.bytes += len(body)
+            self.wire_bytes += wire_bytes
+        if self.on_write is not None:
+            self.on_write(body, now)
+        return 204, None, None
+
+    def _reject(self, body, params, now):
+        """Get the status, error and headers of a write, ``204`` unless it should be rejected."""
+        if "db" not in params:
+            return 400, "database is required", None
+        if self.throttle:
+            second, count = self._window
+            if int(now) != second:
+                second, count = int(now), 0
+            self._window = second, count + 1
+            if count >= self.throttle:
+                return 429, "too many requests", {"Retry-After": "1"}
+        if self._failures:
+            code, error = self._failures.pop(0)
+            return code, error, None
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500, "timeout", None
+        for line in body.split(b"\n"):
+            line = line.strip()
+            if line and not line.startswith(b"#") and not _LINE.match(line):
+                return 400, _parse_error(line), None
+        return 204, None, None
+
+
+def main():
+    """Serve until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8086, help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every response by.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of writes to fail with 500.")
+    parser.add_argument("--throttle", type=float, help="Maximum writes per second, the excess fail with 429.")
+    args = parser.parse_args()
+    influxdb = InfluxDB(args.port, latency=args.latency, error_rate=args.error_rate, throttle=args.throttle)
+    print("Listening on port {}".format(influxdb.port))
+    try:
+        influxdb._server.serve_forever()  # pylint: disable=protected-access
+    except KeyboardInterrupt:
+        pass
+    print("{} writes, {} points, {} bytes, {} bytes received, rejected {}".format(
+        influxdb.writes, influxdb.points, influxdb.bytes, influxdb.wire_bytes, influxdb.rejected))
+
+
+if __name__ == "__main__":
+    main()
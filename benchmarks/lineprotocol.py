@@ -0,0 +1,87 @@
+"""Compare den's line protocol encoder with the :py:mod:`influxdb` client's."""
+
+from __future__ import absolute_import, print_function
+import json
+import tracemalloc
+
+from influxdb.line_protocol import make_lines
+
+from den import thermostat
+from den.lineprotocol import Encoder, PointBatch
+from den.sse import Parser
+
+from . import bench, read_responses
+
+
+def _get_points():
+    """Get every point built from the recorded stream, with timestamps."""
+    points = []
+    for value in _get_values():
+        points.extend(thermostat._get_structure_points(value))  # pylint: disable=protected-access
+        points.extend(thermostat._get_thermostat_points(value))  # pylint: disable=protected-access
+    for i, point in enumerate(points):
+        point["time"] = 1500000000 + i
+    return points
+
+
+def _get_values():
+    """Get every data tree of the recorded stream."""
+    parser = Parser()
+    events = parser.feed(b"".join(l + b"\n" for l in read_responses())) + parser.close()
+    values = [json.loads(e.data.decode("utf-8")) for e in events]
+    return [v for v in values if v]
+
+
+def _get_point_list(values):
+    """Build the points of ``values`` as dictionaries."""
+    points = []
+    for value in values:
+        points.extend(thermostat._get_structure_points(value))  # pylint: disable=protected-access
+        points.extend(thermostat._get_thermostat_points(value))  # pylint: disable=protected-access
+    for point in points:
+        point["time"] = 1500000000
+    return points
+
+
+def _get_point_batch(values):
+    """Build the points of ``values`` as a :py:class:`PointBatch`."""
+    batch = PointBatch()
+    for value in values:
+        thermostat._get_structure_points(value, batch=batch)  # pylint: disable=protected-access
+        thermostat._get_thermostat_points(value, batch=batch)  # pylint: disable=protected-access
+    batch.stamp(1500000000)
+    return batch
+
+
+def _measure(name, func):
+    """Print the number of bytes allocated and still held by the result of ``func``."""
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("{:<40} {:>12.1f} KiB".format(name, size / 1024.0))
+    return result
+
+
+def main():
+    """Run the benchmark."""
+    points = _get_points()
+    encoder = Encoder()
+    print("Encoding {} points".format(len(points)))
+    baseline = bench("influxdb.line_protocol.make_lines", lambda: make_lines({"points": points}, "s").encode("utf-8"))
+    actual = bench("den.lineprotocol.Encoder", lambda: encoder.encode_points(points))
+    print("Speedup {:.1f}x".format(baseline / actual))
+
+    values = _get_values()
+    baseline = bench("build and encode dictionaries", lambda: encoder.encode_points(_get_point_list(values)))
+    actual = bench("build and encode PointBatch", lambda: _get_point_batch(values).encode())
+    print("Speedup {:.1f}x".format(baseline / actual))
+
+    values *= 100
+    print("Holding {} points".format(len(_get_point_list(values))))
+    _measure("dictionaries", lambda: _get_point_list(values))
+    _measure("PointBatch", lambda: _get_point_batch(values))
+
+
+if __name__ == "__main__":
+    main()
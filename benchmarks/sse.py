@@ -0,0 +1,90 @@
+"""Compare the SSE parser with line by line stream processing."""
+
+from __future__ import absolute_import, print_function
+
+import io
+import json
+
+import requests
+
+from den import thermostat
+from den.sse import Parser
+
+from . import bench, read_responses
+
+REPEAT = 1000
+"""Number of times the recorded stream is repeated."""
+
+CHUNK_SIZE = thermostat.STREAM_CHUNK_SIZE
+"""Number of bytes read from the stream at a time."""
+
+DELIMITER = ":"
+"""The token which separates line type and line data."""
+
+
+def _response(stream):
+    """Get a :py:class:`requests.Response` which reads ``stream``."""
+    response = requests.Response()
+    response.raw = io.BytesIO(stream)
+    return response
+
+
+def _iter_lines(stream):
+    """Split ``stream`` into lines with :py:meth:`requests.Response.iter_lines`."""
+    return _response(stream).iter_lines(chunk_size=CHUNK_SIZE)
+
+
+def _process_line(line):
+    """Process one line the way ``record`` used to, returning the decoded data of a data line."""
+    if line.startswith("event" + DELIMITER):
+        line.split(DELIMITER, 1)[1].strip()
+    elif line.startswith("data" + DELIMITER):
+        data = line.split(DELIMITER, 1)[1].strip()
+        if data:
+            try:
+                return json.loads(data)
+            except ValueError:
+                pass
+    return None
+
+
+def _process(stream):
+    """Frame and decode ``stream`` the way ``record`` used to."""
+    for l in _iter_lines(stream):
+        if l:
+            _process_line(l.decode("utf-8"))
+
+
+def _frame(stream):
+    """Frame ``stream`` the way ``record`` used to, without decoding JSON."""
+    for l in _iter_lines(stream):
+        if l:
+            line = l.decode("utf-8")
+            if line.startswith("event" + DELIMITER) or line.startswith("data" + DELIMITER):
+                line.split(DELIMITER, 1)[1].strip()
+
+
+def _parse(stream, decode=False):
+    """Parse ``stream`` with a :py:class:`den.sse.Parser`."""
+    parser = Parser()
+    for chunk in _response(stream).iter_content(chunk_size=CHUNK_SIZE):
+        for event in parser.feed(chunk):
+            if decode:
+                json.loads(event.data.decode("utf-8"))
+
+
+def main():
+    """Run the benchmark."""
+    lines = read_responses() * REPEAT
+    stream = b"".join(l + b"\n" for l in lines)
+    print("Parsing {} lines, {} bytes".format(len(lines), len(stream)))
+    framing = bench("iter_lines and line framing", lambda: _frame(stream), number=3, repeat=3)
+    parsing = bench("den.sse.Parser", lambda: _parse(stream), number=3, repeat=3)
+    print("Framing speedup {:.1f}x".format(framing / parsing))
+    processing = bench("iter_lines and line processing", lambda: _process(stream), number=1, repeat=3)
+    decoding = bench("den.sse.Parser and json.loads", lambda: _parse(stream, True), number=1, repeat=3)
+    print("Processing speedup {:.1f}x".format(processing / decoding))
+
+
+if __name__ == "__main__":
+    main()
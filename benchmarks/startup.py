@@ -0,0 +1,50 @@
+"""Measure the start up time of the den command line."""
+
+from __future__ import absolute_import, print_function
+
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    ["--version"],
+    ["test", "thermostat", "--help"],
+    ["test", "weather", "--help"],
+    ["test", "propane", "--help"],
+]
+"""Command lines to time, which exit before any collector does work."""
+
+IMPORTS = {
+    "thermostat": "den.thermostat",
+    "weather": "den.weather",
+    "propane": "den.propane",
+}
+"""The collector module each sub-command imports when it runs."""
+
+REPEAT = 10
+"""Number of times each command is run."""
+
+
+def _time(args):
+    """Get the best wall clock time in seconds of ``REPEAT`` runs of python with ``args``."""
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        subprocess.check_call([sys.executable] + args, stdout=subprocess.PIPE)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    baseline = _time(["-c", "pass"])
+    print("{:<40} {:>12.1f} ms".format("python", baseline * 1e3))
+    for command in COMMANDS:
+        print("{:<40} {:>12.1f} ms".format("den " + " ".join(command), _time(["-m", "den"] + command) * 1e3))
+    for name, module in sorted(IMPORTS.items()):
+        print("{:<40} {:>12.1f} ms".format("den " + name + " imports", _time(["-c", "import " + module]) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
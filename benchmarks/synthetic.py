@@ -0,0 +1,86 @@
+"""Generate synthetic Nest API streams.
+
+Streams are built from the first snapshot of the recorded stream, with as many structures and thermostats as asked
+for, the thermostats spread evenly across the structures.  Every
+event changes each thermostat's temperatures and sets its ``fan_timer_duration`` to the event's sequence number, so
+the points written for an event can be matched to the time it was sent.
+
+"""
+
+from __future__ import absolute_import
+
+import copy
+import json
+import random
+
+from den.sse import Parser
+
+from . import read_responses
+
+SEQUENCE_FIELD = "fan_timer_duration"
+"""The thermostat field which carries each event's sequence number."""
+
+KEEP_ALIVE = b"event: keep-alive\ndata: null\n\n"
+"""A keep-alive event."""
+
+
+def template(thermostats=2, structures=1):
+    """Get a Nest API data tree with ``thermostats`` thermostats spread across ``structures`` structures.
+
+    :param int thermostats:
+    :param int structures: (optional)
+    :rtype: :py:class:`dict`
+
+    """
+    parser = Parser()
+    event = (parser.feed(b"\n".join(read_responses())) + parser.close())[0]
+    data = json.loads(event.data.decode("utf-8"))["data"]
+    structure_model = list(data["structures"].values())[0]
+    model = list(data["devices"]["thermostats"].values())[0]
+    homes = []
+    for i in range(structures):
+        structure = copy.deepcopy(structure_model)
+        structure["structure_id"] = "synthetic-structure-%04d" % i
+        structure["name"] = "Synthetic home %d" % i
+        structure["thermostats"] = []
+        homes.append(structure)
+    devices = {}
+    for i in range(thermostats):
+        structure = homes[i % structures]
+        device = copy.deepcopy(model)
+        device["device_id"] = "synthetic-%04d" % i
+        device["name"] = device["name_long"] = "Synthetic %d" % i
+        device["structure_id"] = structure["structure_id"]
+        structure["thermostats"].append(device["device_id"])
+        devices[device["device_id"]] = device
+    data["devices"]["thermostats"] = devices
+    data["structures"] = dict((s["structure_id"], s) for s in homes)
+    return data
+
+
+def generate(events, thermostats=2, keep_alive_interval=10, seed=0, structures=1):
+    """Generate the events of a synthetic stream.
+
+    :param int events: The number of ``put`` events.
+    :param int thermostats: (optional) The number of thermostats.
+    :param int keep_alive_interval: (optional) The number of ``put`` events between keep-alives, ``0`` for none.
+    :param int seed: (optional) The random seed.
+    :param int structures: (optional) The number of structures the thermostats are spread across.
+    :rtype: :py:class:`collections.Iterator`
+    :returns: ``(sequence, event)`` tuples where ``sequence`` is ``None`` for keep-alives.
+
+    """
+    rand = random.Random(seed)
+    data = template(thermostats, structures)
+    devices = list(data["devices"]["thermostats"].values())
+    for sequence in range(events):
+        for device in devices:
+            temperature = device["ambient_temperature_f"] + rand.choice((-1, 0, 1))
+            device["ambient_temperature_f"] = min(90, max(50, temperature))
+            device["ambient_temperature_c"] = round((device["ambient_temperature_f"] - 32) / 1.8, 1)
+            device["humidity"] = rand.randint(30, 60)
+            device[SEQUENCE_FIELD] = sequence
+        payload = json.dumps({"path": "/", "data": data}, separators=(",", ":")).encode("utf-8")
+        yield sequence, b"event: put\ndata: " + payload + b"\n\n"
+        if keep_alive_interval and sequence % keep_alive_interval == keep_alive_interval - 1:
+            yield None, KEEP_ALIVE
@@ -28,12 +28,18 @@ setup(
     keywords="nest thermostat smoke alarm camera weather propane monitor",
     packages=find_packages("src"),
     package_dir={"": "src"},
-    install_requires=["backoff>=1.3.2", "influxdb>=3.0", "python-forecastio>=1.3.5", "requests>=2.0"],
+    install_requires=[
+        "backoff>=1.3.2", "futures>=3.0; python_version < '3'", "influxdb>=3.0", "python-forecastio>=1.3.5",
+        "requests>=2.0"
+    ],
     extras_require={
         "dev": [
             "tox",
             "yapf",
         ],
+        "fast": ["orjson; python_version >= '3.6'", "ujson; python_version < '3.6'"],
+        "archive": ["zstandard"],
+        "parquet": ["pyarrow"],
         "doc": [
             "Sphinx",
             "alabaster",
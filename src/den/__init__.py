@@ -1,23 +1,43 @@
 """Den is a home for your home's data."""
 
-from pkg_resources import resource_string
 from tempfile import gettempdir
+import atexit
 import logging
 import logging.handlers
 import os
+import time
+try:
+    from logging.handlers import QueueHandler, QueueListener
+    import queue
+except ImportError:
+    QueueHandler = QueueListener = None
 
 __title__ = "den"
-__version__ = resource_string(__name__, "VERSION").decode()
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "VERSION")) as _version_file:
+    __version__ = _version_file.read().strip()
+
+LOG_LEVEL = os.environ.get("DEN_LOG_LEVEL", "DEBUG").upper()
+"""Level of the den log file.  Defaults to environment DEN_LOG_LEVEL value."""
+
+PAYLOAD_LOG_INTERVAL = 60
+"""Minimum number of seconds between logged payloads."""
 
 
 def _configure_logger(name):
+    """Configure the ``name`` logger.
+
+    Records are handed to a queue and written to the console and log file by a listener thread, when the standard
+    library supports it, so that logging never blocks on disk or terminal I/O.  Messages are still formatted by the
+    thread which logs them, before they are queued.
+
+    """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(LOG_LEVEL)
 
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter("%(message)s"))
     console_handler.setLevel(logging.INFO)
-    logger.addHandler(console_handler)
 
     file_handler = logging.handlers.RotatingFileHandler(
         os.path.join(gettempdir(), os.extsep.join([name, "log"])), maxBytes=2**20)
@@ -25,15 +45,54 @@ def _configure_logger(name):
         fmt="%(asctime)s %(name)s %(levelname)s %(module)s.%(funcName)s %(message)s", datefmt="%Y-%m-%dT%H:%M:%S%z")
     file_handler.setFormatter(fmt)
     file_handler.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
+
+    handlers = [console_handler, file_handler]
+    if QueueListener is not None:
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handlers = [QueueHandler(log_queue)]
 
     backoff_logger = logging.getLogger("backoff")
-    backoff_logger.addHandler(console_handler)
-    backoff_logger.addHandler(file_handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+        backoff_logger.addHandler(handler)
     backoff_logger.setLevel(logging.INFO)
 
     return logger
 
 
+class SampledLogger(object):
+    """Log debug messages, such as full payloads, at most once per ``interval`` seconds.
+
+    Messages are neither formatted nor queued when debug logging is disabled or the interval has not passed.
+
+    :param logging.Logger logger:
+    :param float interval: (optional) The minimum number of seconds between logged messages.
+
+    """
+
+    def __init__(self, logger, interval=PAYLOAD_LOG_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self.suppressed = 0
+        self._next = 0
+
+    def debug(self, msg, *args):
+        """Log ``msg % args`` at debug level if the interval has passed."""
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        now = time.time()
+        if now < self._next:
+            self.suppressed += 1
+            return
+        self._next = now + self.interval
+        if self.suppressed:
+            self.logger.debug("%d sampled message(s) suppressed", self.suppressed)
+            self.suppressed = 0
+        self.logger.debug(msg, *args)
+
+
 LOG = _configure_logger(__title__)
 LOG.debug("Version %s", __version__)
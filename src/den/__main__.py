@@ -1,92 +1,616 @@
 #!/usr/bin/env python
-"""Den is a home for your home's data."""
+"""Den is a home for your home's data.
+
+Collectors, and the database, HTTP and weather libraries they depend on, are imported by the sub-command which runs
+them so that each invocation only pays for the imports it uses.
+
+"""
 
 from __future__ import absolute_import
 
 import argparse
+from contextlib import contextmanager
 import os
 import sys
-
-from requests.exceptions import ConnectionError, HTTPError, StreamConsumedError, Timeout
-import backoff
+import threading
+import time
 
 from . import __version__
 from . import LOG
-from . import propane
-from . import thermostat
-from . import weather
+from . import archive
+from . import batch
+from . import delta
+from . import export
+from . import scheduler
+from . import spool
 
+WEATHER_INTERVAL = 600
+"""Default number of seconds between weather runs of ``den run``."""
 
-@backoff.on_exception(backoff.expo, (ConnectionError, HTTPError, Timeout))
-def _thermostat(args):  # noqa
-    """Record Nest thermostat data into the database.
+PROPANE_INTERVAL = 3600
+"""Default number of seconds between propane runs of ``den run``."""
+
+
+def _stream(collect):
+    """Call ``collect`` to stream Nest thermostat data until interrupted.
 
     This function will attempt to recover from various network errors.  It will run indefinitely until interrupted
     from the keyboard or an unexpected exception occurs.
 
     """
-    while True:
-        try:
-            thermostat.record(args.database, args.port, args.ssl, args.access_token)
-        except KeyboardInterrupt as e:
-            LOG.warn("Keyboard interrupt %s", e)
-            return True
-        except StreamConsumedError as e:
-            LOG.warn("Stream consumed %s", e)
-        except ConnectionError as e:
-            LOG.exception("Connection error %s", e)
-            raise e
-        except HTTPError as e:
-            LOG.exception("HTTPError %s", e)
-            raise e
-        except Timeout as e:
-            LOG.exception("Timeout %s", e)
-            raise e
-        except Exception as e:  # pylint: disable=broad-except
-            LOG.critical("Unexpected error %s", e)
-            if e.message == "EOF occurred in violation of protocol":
-                LOG.info("Re-establishing connection")
-            elif e.message == "400: invalid payload":
-                LOG.critical("Could not write response to database")
-            else:
+    from requests.exceptions import ConnectionError, HTTPError, StreamConsumedError, Timeout
+    import backoff
+
+    from . import metrics
+    from . import thermostat
+
+    connections = [0]
+
+    def on_backoff(details):
+        """Count a sleep before retrying."""
+        metrics.BACKOFF_SLEEPS.inc()
+        metrics.BACKOFF_SECONDS.inc(details["wait"])
+
+    @backoff.on_exception(backoff.expo, (ConnectionError, HTTPError, Timeout), on_backoff=on_backoff)
+    def stream():  # noqa
+        """Stream with exponential backoff."""
+        while True:
+            if connections[0]:
+                metrics.RECONNECTS.inc()
+            connections[0] += 1
+            try:
+                collect()
+            except KeyboardInterrupt as e:
+                LOG.warn("Keyboard interrupt %s", e)
+                return True
+            except StreamConsumedError as e:
+                LOG.warn("Stream consumed %s", e)
+            except ConnectionError as e:
+                LOG.exception("Connection error %s", e)
+                raise e
+            except HTTPError as e:
+                LOG.exception("HTTPError %s", e)
+                raise e
+            except Timeout as e:
+                LOG.exception("Timeout %s", e)
+                raise e
+            except thermostat.AuthRevokedError as e:
+                LOG.critical("Access token revoked %s", e)
                 return False
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.critical("Unexpected error %s", e)
+                if str(e) == "EOF occurred in violation of protocol":
+                    LOG.info("Re-establishing connection")
+                else:
+                    return False
+
+    return stream()
+
+
+def _stream_all(streams):
+    """Run each ``(account, collect)`` stream of ``streams`` with :py:func:`_stream` in its own thread.
+
+    Every stream reconnects and backs off on its own.  This function returns when every stream has stopped or when
+    interrupted from the keyboard.  A stream which raised counts as failed.
+
+    :param list streams:
+    :rtype: :py:class:`bool`
+
+    """
+    results = {}
+
+    def run(account, collect):
+        """Stream one account."""
+        results[account] = _stream(collect)
+
+    threads = []
+    for account, collect in streams:
+        thread = threading.Thread(target=run, args=(account, collect), name="thermostat-%s" % account)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt as e:
+        LOG.warning("Keyboard interrupt %s", e)
+        return True
+    return all(results.get(a) for a, _ in streams)
+
+
+def _get_accounts(args):
+    """Get the ``(account, token)`` pairs of the thermostat streams configured by ``args``.
+
+    A lone ``--access-token`` has no account so that its points are written without an account tag, as before.
+
+    :param argparse.Namespace args:
+    :rtype: :py:class:`list`
+
+    """
+    from . import thermostat
+    accounts = []
+    if args.access_tokens:
+        accounts.extend(thermostat.parse_accounts(args.access_tokens))
+    if args.access_token_file:
+        with open(args.access_token_file) as f:
+            accounts.extend(thermostat.parse_accounts(f.read()))
+    if args.access_token:
+        if not accounts:
+            return [(None, args.access_token)]
+        accounts[:0] = thermostat.parse_accounts(args.access_token)
+    return accounts
+
+
+def _stream_thermostats(args, writer, accounts):
+    """Stream the thermostat data of every one of ``accounts`` to one shared ``writer``.
+
+    :param argparse.Namespace args:
+    :param writer: The writer shared by every stream.
+    :param list accounts: ``(account, token)`` pairs from :py:func:`_get_accounts`.
+    :rtype: :py:class:`bool`
+
+    """
+    from . import thermostat
+    if len(set(a for a, _ in accounts)) < len(accounts):
+        LOG.critical("Duplicate thermostat account names")
+        return False
+    collectors = []
+    try:
+        for account, token in accounts:
+            delta_filter = None
+            if args.delta:
+                delta_filter = delta.DeltaFilter(thermostat.DELTA_SERIES_KEYS, args.keyframe_interval)
+            recorder = None
+            if args.record_to:
+                directory = os.path.join(args.record_to, account) if account else args.record_to
+                recorder = archive.StreamRecorder(directory, args.record_interval, args.record_compression)
+            collectors.append(thermostat.Collector(writer, token, delta_filter, recorder, account))
+        if len(collectors) == 1:
+            return _stream(collectors[0].collect)
+        LOG.info("Streaming %d thermostat accounts", len(collectors))
+        return _stream_all([(c.account, c.collect) for c in collectors])
+    finally:
+        for collector in collectors:
+            collector.close()
+            if collector.recorder is not None:
+                collector.recorder.close()
+
+
+def _get_db(args):
+    """Get a :py:class:`den.lineprotocol.LineProtocolWriter` for the database configured by ``args``.
+
+    A :py:class:`den.udp.UDPWriter` is returned instead for the ``udp`` transport, and a
+    :py:class:`den.sinks.FanOut` when sinks other than the database alone are given.
+
+    """
+    specs = getattr(args, "sinks", None) or ["influxdb"]
+    if specs != ["influxdb"]:
+        from . import sinks
+
+        return sinks.FanOut([_get_influxdb(args) if s == "influxdb" else sinks.open_sink(s) for s in specs])
+    return _get_influxdb(args)
+
+
+@contextmanager
+def _database(args):
+    """Get the database writer configured by ``args`` as a context manager which closes it if it can be closed.
+
+    :param argparse.Namespace args:
+
+    """
+    db = _get_db(args)
+    try:
+        yield db
+    finally:
+        close = getattr(db, "close", None)
+        if close is not None:
+            close()
+
+
+def _get_influxdb(args):
+    """Get a writer for the InfluxDB database configured by ``args`` over its configured transport."""
+    if getattr(args, "transport", "http") == "udp":
+        from .udp import UDPWriter
+
+        return UDPWriter(port=args.udp_port, mtu=args.udp_mtu, precision=args.udp_precision)
+
+    from influxdb import client as influxdb
+
+    from .lineprotocol import LineProtocolWriter
+
+    client = influxdb.InfluxDBClient(database=args.database, port=args.port, ssl=args.ssl)
+    return LineProtocolWriter(client, args.database, **_get_gzip_options(args))
+
+
+def _get_gzip_options(args):
+    """Get the database write compression arguments which were given on the command line.
+
+    :param argparse.Namespace args:
+    :rtype: :py:class:`dict`
+
+    """
+    return dict((k, getattr(args, k)) for k in ("gzip_level", "gzip_threshold") if hasattr(args, k))
+
+
+def _thermostat(args):
+    """Record Nest thermostat data into the database.
+
+    This function will attempt to recover from various network errors.  It will run indefinitely until interrupted
+    from the keyboard or an unexpected exception occurs.  Several accounts are streamed at once through one shared
+    writer, each point tagged with its account.  The database connection and Nest API sessions are kept open from one
+    stream to the next.
+
+    """
+    accounts = _get_accounts(args)
+    if not accounts:
+        LOG.critical("No access token configured")
+        return False
+    if not _check_outputs(args):
+        return False
+    _serve_metrics(args)
+    with _database(args) as db, _get_writer(args, db) as db_writer, _rolled_up(args, db_writer) as writer:
+        return _stream_thermostats(args, writer, accounts)
 
 
 def _weather(args):
     """Record weather data into the database. Powered by Dark Sky."""
-    weather.record(args.database, args.port, args.ssl, args.api_key, args.lat, args.lon)
+    from . import weather
+    weather.record(args.database, args.port, args.ssl, args.api_key, args.lat, args.lon, **_get_gzip_options(args))
+
+
+def _get_propane_options(args):
+    """Get the optional propane arguments which were given on the command line.
+
+    Their defaults are left to :py:mod:`den.propane` so that it is only imported when used.
+
+    :param argparse.Namespace args:
+    :rtype: :py:class:`dict`
+
+    """
+    return dict((k, getattr(args, k)) for k in ("workers", "token_cache") if hasattr(args, k))
 
 
 def _propane(args):
     """Record propane data into the database."""
-    propane.record(args.database, args.port, args.ssl, args.username, args.password)
+    from . import propane
+    options = dict(_get_propane_options(args), **_get_gzip_options(args))
+    propane.record(args.database, args.port, args.ssl, args.username, args.password, **options)
 
 
-def _add_thermostat_subparser(subparsers):
-    """Add record subparser.
+@contextmanager
+def _get_jobs(args, writer):
+    """Get the scheduled collector jobs configured by ``args`` as a context manager which closes their sessions.
 
-    :param argparse.ArgumentParser subparsers:
+    :param argparse.Namespace args:
+    :param writer: The writer shared by every collector.
+
+    """
+    jobs = []
+    sessions = []
+    try:
+        if args.api_key:
+            from . import weather
+            jobs.append(
+                scheduler.Job("weather", lambda: weather.collect(writer, args.api_key, args.lat, args.lon),
+                              args.weather_interval, args.weather_jitter, args.weather_missed))
+        if args.username:
+            from . import propane
+            options = _get_propane_options(args)
+            session = propane.get_session(options.get("workers", propane.WORKERS))
+            sessions.append(session)
+            jobs.append(
+                scheduler.Job("propane",
+                              lambda: propane.collect(writer, session, args.username, args.password, **options),
+                              args.propane_interval, args.propane_jitter, args.propane_missed))
+        yield jobs
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def _serve_metrics(args):
+    """Serve metrics from the port configured by ``args``, if any.
+
+    :param argparse.Namespace args:
+    :rtype: :py:const:`None`
+
+    """
+    if args.metrics_port is not None:
+        from . import metrics
+        server = metrics.serve(args.metrics_port, args.metrics_host)
+        LOG.info("Serving metrics on http://%s:%d/metrics", *server.server_address[:2])
+
+
+def _check_outputs(args):
+    """Determine if the spool and sinks configured by ``args`` can be used together, logging why not.
+
+    A :py:class:`den.sinks.FanOut` only queues each write, so a spool drained to one would discard its points whether
+    or not they were written.  ``--spool-dir`` and ``--sink`` are mutually exclusive on the command line, but the
+    spool directory may also come from the environment.
+
+    :param argparse.Namespace args:
+    :rtype: :py:const:`bool`
+
+    """
+    if args.spool_dir and (args.sinks or ["influxdb"]) != ["influxdb"]:
+        LOG.critical("A spool can not be drained to sinks other than the database")
+        return False
+    return True
+
+
+def _get_writer(args, db):
+    """Get the writer configured by ``args``, to be used as a context manager.
+
+    :param argparse.Namespace args:
+    :param db: The :py:class:`den.lineprotocol.LineProtocolWriter` which writes to the database.
+
+    """
+    if args.spool_dir:
+        return spool.spooled(db, args.spool_dir, args.spool_max_size)
+    return batch.BatchWriter(db, args.batch_size, args.max_latency)
+
+
+def _get_rollup_measurements(args):
+    """Get the measurements rolled up for the collectors configured by ``args``.
+
+    :param argparse.Namespace args:
+    :rtype: :py:class:`dict`
+    :returns: Map of measurement name to its rolled up field keys and series tag keys.
+
+    """
+    from . import thermostat
+    measurements = {thermostat.THERMOSTAT_MEASUREMENT: (thermostat.THERMOSTAT_FIELD_KEYS, thermostat.ROLLUP_TAG_KEYS)}
+    if getattr(args, "api_key", None):
+        from . import weather
+        fields = [k for k in weather.FIELD_KEYS if k != "time"]
+        measurements[weather.MEASUREMENT] = (fields, weather.ROLLUP_TAG_KEYS)
+    if getattr(args, "username", None):
+        from . import propane
+        measurements[propane.MEASUREMENT] = (propane.FIELD_KEYS, propane.ROLLUP_TAG_KEYS)
+    return measurements
+
+
+@contextmanager
+def _rolled_up(args, writer):
+    """Wrap ``writer`` in a :py:class:`den.rollup.Rollup` when ``args`` configure one.
+
+    :param argparse.Namespace args:
+    :param writer: The writer the rollup writes to.
+
+    """
+    if not args.rollup_window:
+        yield writer
+        return
+    from . import rollup
+    measurements = _get_rollup_measurements(args)
+    with rollup.Rollup(writer, measurements, args.rollup_window, args.rollup_checkpoint,
+                       not args.rollup_only) as rolled_up:
+        yield rolled_up
+
+
+def _run(args):
+    """Record thermostat, weather and propane data into the database from one process.
+
+    Each collector runs when its credentials are given.  The thermostat stream runs indefinitely while weather and
+    propane data are recorded periodically.  Every collector writes through one shared, batched database connection.
+
+    """
+    accounts = _get_accounts(args)
+    if not _check_outputs(args):
+        return False
+    with _database(args) as db, _get_writer(args, db) as db_writer, _rolled_up(args, db_writer) as writer, \
+            _get_jobs(args, writer) as jobs:
+        if not jobs and not accounts:
+            LOG.critical("No collectors configured")
+            return False
+        LOG.info("Running %s", ", ".join(["thermostat"] * bool(accounts) + [j.name for j in jobs]))
+        _serve_metrics(args)
+        if args.metrics_interval:
+            from . import metrics
+            jobs.append(scheduler.Job("metrics", lambda: metrics.report(writer), args.metrics_interval))
+        runner = scheduler.Scheduler(jobs)
+        if accounts:
+            runner.start()
+            try:
+                return _stream_thermostats(args, writer, accounts)
+            finally:
+                runner.stop()
+        try:
+            runner.run()
+        except KeyboardInterrupt as e:
+            LOG.warning("Keyboard interrupt %s", e)
+        return True
+
+
+def _replay(args):
+    """Backfill the database from archived thermostat streams and snapshots."""
+    from . import replay
+
+    replay.replay(_get_db(args), args.paths, args.workers, args.batch_bytes, args.progress)
+    return True
+
+
+def _export(args):
+    """Export a time range of a measurement to CSV or Parquet in constant memory."""
+    from influxdb import client as influxdb
+
+    client = influxdb.InfluxDBClient(database=args.database, port=args.port, ssl=args.ssl)
+    output_format = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    export.export(client, args.measurement, args.start, args.end, args.output, output_format, args.epoch,
+                  args.workers, args.chunk_size, args.shard_size)
+    return True
+
+
+def _add_thermostat_arguments(parser, changes=None):
+    """Add thermostat arguments.
+
+    :param argparse.ArgumentParser parser:
+    :param changes: (optional) The mutually exclusive group to add ``--delta`` to.
     :rtype: :py:const:`None`
 
     """
-    parser = subparsers.add_parser(
-        "thermostat", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_thermostat.__doc__)
     parser.add_argument(
         "--access-token",
         help="Nest API access token. Defaults to environment DEN_ACCESS_TOKEN value.",
         default=os.environ.get("DEN_ACCESS_TOKEN", ""))
-    parser.set_defaults(func=_thermostat)
+    parser.add_argument(
+        "--access-tokens",
+        help="Comma separated Nest API access tokens, each optionally prefixed with 'account='. Every account is "
+        "streamed at once and its points tagged with the account. Defaults to environment DEN_ACCESS_TOKENS value.",
+        default=os.environ.get("DEN_ACCESS_TOKENS", ""))
+    parser.add_argument(
+        "--access-token-file",
+        help="File of Nest API access tokens, one per line, in the --access-tokens format. Defaults to environment "
+        "DEN_ACCESS_TOKEN_FILE value.",
+        default=os.environ.get("DEN_ACCESS_TOKEN_FILE"))
+    parser.add_argument(
+        "--batch-size", type=int, default=batch.BATCH_SIZE, help="Number of pending points which triggers a write.")
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        default=batch.MAX_LATENCY,
+        help="Maximum number of seconds a point may wait before it is written.")
+    (changes or parser).add_argument(
+        "--delta", action="store_true", help="Only write structures and thermostats which changed.")
+    parser.add_argument(
+        "--keyframe-interval",
+        type=float,
+        default=delta.KEYFRAME_INTERVAL,
+        help="Maximum number of seconds between writes of an unchanged structure or thermostat with --delta.")
+    parser.add_argument("--record-to", help="Archive the raw stream to this directory.")
+    parser.add_argument(
+        "--record-interval",
+        type=float,
+        default=archive.SEGMENT_INTERVAL,
+        help="Number of seconds between archive segments.")
+    parser.add_argument(
+        "--record-compression",
+        choices=archive.COMPRESSIONS,
+        help="Archive compression. Defaults to zstd when the zstandard package is installed and gzip otherwise.")
 
 
-def _add_weather_subparser(subparsers):
-    """Add weather subparser.
+def _add_spool_arguments(parser, outputs=None):
+    """Add spool arguments.
 
-    :param argparse.ArgumentParser subparsers:
+    :param argparse.ArgumentParser parser:
+    :param outputs: (optional) The mutually exclusive group to add ``--spool-dir`` to.
+    :rtype: :py:const:`None`
+
+    """
+    (outputs or parser).add_argument(
+        "--spool-dir",
+        help="Spool points to this directory and drain them to the database, so that collectors keep running while "
+        "the database is unavailable. Can not be combined with --sink. Defaults to environment DEN_SPOOL_DIR value.",
+        default=os.environ.get("DEN_SPOOL_DIR"))
+    parser.add_argument(
+        "--spool-max-size",
+        type=int,
+        default=spool.MAX_SIZE,
+        help="Maximum number of bytes to spool. The oldest points are dropped beyond it.")
+
+
+def _add_transport_arguments(parser):
+    """Add database transport arguments.
+
+    :param argparse.ArgumentParser parser:
+    :rtype: :py:const:`None`
+
+    """
+    parser.add_argument(
+        "--transport",
+        choices=("http", "udp"),
+        default="http",
+        help="Write to the database over HTTP, or send to its UDP listener without waiting for a response.")
+    parser.add_argument("--udp-port", type=int, default=8089, help="Database UDP listener port.")
+    parser.add_argument("--udp-mtu", type=int, default=1500, help="Maximum bytes in a packet sent to the database.")
+    parser.add_argument(
+        "--udp-precision",
+        choices=("n", "u", "ms", "s", "m", "h"),
+        default="n",
+        help="Timestamp precision the database UDP listener is configured with.")
+
+
+def _sink(value):
+    """Check the sink specification ``value``.
+
+    :param str value:
+    :rtype: :py:class:`str`
+    :raises: :exc:`argparse.ArgumentTypeError`: if ``value`` is not a sink.
+
+    """
+    kind, _, path = value.partition(":")
+    if (kind in ("influxdb", "stdout") and not path) or (kind in ("file", "sqlite") and path):
+        return value
+    raise argparse.ArgumentTypeError("invalid sink '%s'" % value)
+
+
+def _add_sink_arguments(parser, outputs=None):
+    """Add output sink arguments.
+
+    :param argparse.ArgumentParser parser:
+    :param outputs: (optional) The mutually exclusive group to add ``--sink`` to.
+    :rtype: :py:const:`None`
+
+    """
+    (outputs or parser).add_argument(
+        "--sink",
+        type=_sink,
+        dest="sinks",
+        action="append",
+        metavar="SINK",
+        help="Where to write points: influxdb, stdout, file:PATH for line protocol or sqlite:PATH. Give more than "
+        "once to write to each from its own queue and thread. Defaults to influxdb.")
+
+
+def _add_rollup_arguments(parser, changes=None):
+    """Add rollup arguments.
+
+    :param argparse.ArgumentParser parser:
+    :param changes: (optional) The mutually exclusive group to add ``--rollup-window`` to.
+    :rtype: :py:const:`None`
+
+    """
+    (changes or parser).add_argument(
+        "--rollup-window",
+        type=int,
+        help="Also write the min, max, mean, last and count of every field in windows of this many seconds to "
+        "<measurement>_rollup measurements. Not rolled up by default. Can not be combined with --delta, which would "
+        "drop points before they are rolled up.")
+    parser.add_argument(
+        "--rollup-checkpoint",
+        help="File to save open rollup windows to, so that a restart does not lose them. Defaults to environment "
+        "DEN_ROLLUP_CHECKPOINT value.",
+        default=os.environ.get("DEN_ROLLUP_CHECKPOINT"))
+    parser.add_argument(
+        "--rollup-only",
+        action="store_true",
+        help="Write only the rollups of rolled up measurements, not their raw points.")
+
+
+def _add_metrics_arguments(parser):
+    """Add metrics arguments.
+
+    :param argparse.ArgumentParser parser:
+    :rtype: :py:const:`None`
+
+    """
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve metrics in the Prometheus text format from this port. Defaults to environment DEN_METRICS_PORT "
+        "value.",
+        default=int(os.environ["DEN_METRICS_PORT"]) if os.environ.get("DEN_METRICS_PORT") else None)
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address to serve metrics from.")
+
+
+def _add_weather_arguments(parser):
+    """Add weather arguments.
+
+    :param argparse.ArgumentParser parser:
     :rtype: :py:const:`None`
 
     """
-    parser = subparsers.add_parser(
-        "weather", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_weather.__doc__)
     parser.add_argument(
         "--api-key",
         help="Weather API key. Defaults to environment DEN_WEATHER_API_KEY value.",
@@ -99,6 +623,85 @@ def _add_weather_subparser(subparsers):
         "--lon",
         help="Longitude. Defaults to environment DEN_LON value.",
         default=float(os.environ.get("DEN_LON", 75.1638)))
+
+
+def _add_propane_arguments(parser):
+    """Add propane arguments.
+
+    :param argparse.ArgumentParser parser:
+    :rtype: :py:const:`None`
+
+    """
+    parser.add_argument("--username", help="Propane API username.", default=os.environ.get("DEN_PROPANE_USERNAME"))
+    parser.add_argument("--password", help="Propane API password.", default=os.environ.get("DEN_PROPANE_PASSWORD"))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=argparse.SUPPRESS,
+        help="Maximum number of concurrent propane API requests. Defaults to 4.")
+    parser.add_argument(
+        "--token-cache",
+        default=argparse.SUPPRESS,
+        help="Propane API token cache path. Defaults to den/propane-tokens.json in the user cache directory.")
+    parser.add_argument(
+        "--no-token-cache",
+        dest="token_cache",
+        action="store_const",
+        const=None,
+        default=argparse.SUPPRESS,
+        help="Do not cache API tokens.")
+
+
+def _add_schedule_arguments(parser, name, interval):
+    """Add arguments which schedule the collector ``name``.
+
+    :param argparse.ArgumentParser parser:
+    :param str name: The collector name.
+    :param float interval: The default number of seconds between runs.
+    :rtype: :py:const:`None`
+
+    """
+    parser.add_argument(
+        "--%s-interval" % name, type=float, default=interval, help="Number of seconds between %s runs." % name)
+    parser.add_argument(
+        "--%s-jitter" % name, type=float, default=0.0, help="Maximum random delay of each %s run in seconds." % name)
+    parser.add_argument(
+        "--%s-missed" % name,
+        choices=scheduler.MISSED_POLICIES,
+        default=scheduler.SKIP,
+        help="Whether to skip missed %s runs or coalesce them into one immediate run." % name)
+
+
+def _add_thermostat_subparser(subparsers):
+    """Add record subparser.
+
+    :param argparse.ArgumentParser subparsers:
+    :rtype: :py:const:`None`
+
+    """
+    parser = subparsers.add_parser(
+        "thermostat", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_thermostat.__doc__)
+    changes = parser.add_mutually_exclusive_group()
+    outputs = parser.add_mutually_exclusive_group()
+    _add_thermostat_arguments(parser, changes)
+    _add_spool_arguments(parser, outputs)
+    _add_transport_arguments(parser)
+    _add_sink_arguments(parser, outputs)
+    _add_rollup_arguments(parser, changes)
+    _add_metrics_arguments(parser)
+    parser.set_defaults(func=_thermostat)
+
+
+def _add_weather_subparser(subparsers):
+    """Add weather subparser.
+
+    :param argparse.ArgumentParser subparsers:
+    :rtype: :py:const:`None`
+
+    """
+    parser = subparsers.add_parser(
+        "weather", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_weather.__doc__)
+    _add_weather_arguments(parser)
     parser.set_defaults(func=_weather)
 
 
@@ -111,11 +714,90 @@ def _add_propane_subparser(subparsers):
     """
     parser = subparsers.add_parser(
         "propane", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_propane.__doc__)
-    parser.add_argument("--username", help="Propane API username.", default=os.environ.get("DEN_PROPANE_USERNAME"))
-    parser.add_argument("--password", help="Propane API password.", default=os.environ.get("DEN_PROPANE_PASSWORD"))
+    _add_propane_arguments(parser)
     parser.set_defaults(func=_propane)
 
 
+def _add_run_subparser(subparsers):
+    """Add run subparser.
+
+    :param argparse.ArgumentParser subparsers:
+    :rtype: :py:const:`None`
+
+    """
+    parser = subparsers.add_parser("run", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_run.__doc__)
+    changes = parser.add_mutually_exclusive_group()
+    outputs = parser.add_mutually_exclusive_group()
+    _add_thermostat_arguments(parser, changes)
+    _add_spool_arguments(parser, outputs)
+    _add_transport_arguments(parser)
+    _add_sink_arguments(parser, outputs)
+    _add_weather_arguments(parser)
+    _add_schedule_arguments(parser, "weather", WEATHER_INTERVAL)
+    _add_propane_arguments(parser)
+    _add_schedule_arguments(parser, "propane", PROPANE_INTERVAL)
+    _add_rollup_arguments(parser, changes)
+    _add_metrics_arguments(parser)
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        help="Number of seconds between writes of metrics to the den_internal measurement. Not written by default.")
+    parser.set_defaults(func=_run)
+
+
+def _add_replay_subparser(subparsers):
+    """Add replay subparser.
+
+    :param argparse.ArgumentParser subparsers:
+    :rtype: :py:const:`None`
+
+    """
+    parser = subparsers.add_parser(
+        "replay", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_replay.__doc__)
+    parser.add_argument(
+        "paths", nargs="+", help="Archive directories, stream files or newline-delimited JSON snapshot files.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of decoding processes, 0 to decode in this process. Defaults to one per CPU.")
+    parser.add_argument(
+        "--batch-bytes", type=int, default=spool.BATCH_BYTES, help="Maximum number of bytes written at once.")
+    parser.add_argument("--progress", help="File to record replayed files in and to resume from.")
+    parser.set_defaults(func=_replay)
+
+
+def _add_export_subparser(subparsers):
+    """Add export subparser.
+
+    :param argparse.ArgumentParser subparsers:
+    :rtype: :py:const:`None`
+
+    """
+    parser = subparsers.add_parser(
+        "export", formatter_class=argparse.ArgumentDefaultsHelpFormatter, help=_export.__doc__)
+    parser.add_argument("measurement", choices=export.MEASUREMENTS, help="Measurement to export.")
+    parser.add_argument(
+        "--start",
+        type=export.parse_time,
+        required=True,
+        help="Start of the time range, in seconds since the epoch or as an ISO 8601 UTC date or date and time.")
+    parser.add_argument(
+        "--end",
+        type=export.parse_time,
+        default=int(time.time()),
+        help="End of the time range, excluded. Defaults to now.")
+    parser.add_argument("--output", "-o", default="-", help="Output file, - for standard output.")
+    parser.add_argument(
+        "--format", choices=export.FORMATS, help="Output format. Defaults to parquet for .parquet files and csv.")
+    parser.add_argument("--epoch", choices=sorted(export.EPOCHS), default="s", help="Timestamp precision.")
+    parser.add_argument("--workers", type=int, default=export.WORKERS, help="Number of concurrent queries.")
+    parser.add_argument(
+        "--chunk-size", type=int, default=export.CHUNK_SIZE, help="Maximum number of rows queried at once.")
+    parser.add_argument(
+        "--shard-size", type=int, default=export.SHARD_SIZE, help="Number of seconds of data queried by one worker.")
+    parser.set_defaults(func=_export)
+
+
 def _get_parser():
     """Get a command line argument parser.
 
@@ -128,10 +810,25 @@ def _get_parser():
     parser.add_argument("database", help="Database name.")
     parser.add_argument("--port", default=8086, help="Database port.")
     parser.add_argument("--ssl", action="store_true", help="Use HTTPS.")
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        choices=range(1, 10),
+        default=argparse.SUPPRESS,
+        metavar="{1-9}",
+        help="Gzip compress database writes at this level. Writes are not compressed by default.")
+    parser.add_argument(
+        "--gzip-threshold",
+        type=int,
+        default=argparse.SUPPRESS,
+        help="Minimum number of bytes in a compressed database write. Defaults to 1024.")
     subparsers = parser.add_subparsers(title="sub-commands")
     _add_thermostat_subparser(subparsers)
     _add_weather_subparser(subparsers)
     _add_propane_subparser(subparsers)
+    _add_run_subparser(subparsers)
+    _add_replay_subparser(subparsers)
+    _add_export_subparser(subparsers)
     return parser
 
 
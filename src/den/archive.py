@@ -0,0 +1,236 @@
+"""Archive the raw Nest API stream in compressed, time-rotated segments.
+
+A :py:class:`StreamRecorder` is given every chunk read from the stream and writes it, unchanged, to the current
+segment file.  A comment line carrying the time it was received, which server-sent event parsers ignore, is written
+before each ``event`` line so that archives can later be replayed with the original timestamps::
+
+    : t=1476302400.123
+    event: put
+    data: {"path": "/", "data": {...}}
+
+A new segment is started at the first event after every ``interval`` seconds, so each segment is a complete stream
+of its own.  The compressor is flushed at the first event after every ``flush_interval`` seconds, so that a crash
+loses at most that much of the current segment rather than all of it.  Segments are compressed with `zstd`_ when the
+``zstandard`` package is installed and with gzip otherwise.  The start time and name of each segment are appended to
+an index file as they are created.
+
+.. _zstd: https://facebook.github.io/zstd/
+
+"""
+
+import gzip
+import os
+import time
+
+from . import LOG
+from .sse import Parser
+
+SEGMENT_INTERVAL = 3600
+"""Default number of seconds between segments."""
+
+FLUSH_INTERVAL = 60
+"""Default number of seconds between flushes of the current segment."""
+
+COMPRESSIONS = ("zstd", "gzip")
+"""Names of the supported compressions in order of preference."""
+
+EXTENSIONS = {"zstd": "sse.zst", "gzip": "sse.gz"}
+"""Segment file name extension of each compression."""
+
+INDEX_FILE = "index.tsv"
+"""Name of the file which lists the start time and name of each segment."""
+
+TIME_COMMENT = b": t="
+"""The start of the comment line which gives the time an event was received."""
+
+_EVENT_FIELD = b"event:"
+
+
+def get_compression(name=None):
+    """Get the compression ``name`` or the best one installed.
+
+    :param str name: (optional) One of :py:data:`COMPRESSIONS`.
+    :rtype: :py:class:`str`
+    :raises: :exc:`ImportError`: if ``zstd`` is requested but ``zstandard`` is not installed.
+
+    """
+    if name not in (None, ) + COMPRESSIONS:
+        raise ValueError("Unknown compression '%s'" % name)
+    if name == "gzip":
+        return name
+    try:
+        import zstandard  # noqa pylint: disable=unused-import
+        return "zstd"
+    except ImportError:
+        if name:
+            raise
+        return "gzip"
+
+
+def open_segment(path, mode="rb"):
+    """Open the segment at ``path``, compressing or decompressing it according to its extension.
+
+    :param str path:
+    :param str mode: (optional) ``rb`` or ``wb``.
+    :rtype: A file object.
+
+    """
+    if path.endswith(os.extsep + "zst"):
+        import zstandard
+        f = open(path, mode)
+        if mode.startswith("w"):
+            return zstandard.ZstdCompressor().stream_writer(f)
+        return zstandard.ZstdDecompressor().stream_reader(f)
+    if path.endswith(os.extsep + "gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def read_index(directory):
+    """Read the index of the archive in ``directory``.
+
+    :param str directory:
+    :rtype: :py:class:`list`
+    :returns: The start time and path of each segment, in order.
+
+    """
+    segments = []
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        for line in f:
+            start, name = line.rstrip("\n").split("\t")
+            segments.append((float(start), os.path.join(directory, name)))
+    return segments
+
+
+class TimedParser(Parser):
+    """A :py:class:`den.sse.Parser` of archived streams which pairs each event with the time it was received.
+
+    Events return ``(time, event)`` tuples rather than :py:class:`den.sse.Event` objects.  Events which precede every
+    time comment, as in a stream which was not recorded by a :py:class:`StreamRecorder`, are given ``start``.
+
+    :param float start: (optional) The time of events without a time comment.
+
+    """
+
+    def __init__(self, start=None):
+        super(TimedParser, self).__init__()
+        self.time = start
+
+    def _parse_line(self, buf, view, start, end):
+        """Parse the line ``buf[start:end]``, reading time comments."""
+        if buf.startswith(TIME_COMMENT, start, end):
+            event = self._dispatch()
+            self.time = float(buf[start + len(TIME_COMMENT):end])
+            return event
+        return super(TimedParser, self)._parse_line(buf, view, start, end)
+
+    def _dispatch(self):
+        """Get the buffered event and its time and reset the buffer."""
+        event = super(TimedParser, self)._dispatch()
+        return None if event is None else (self.time, event)
+
+
+class StreamRecorder(object):
+    """Record the raw bytes of a server-sent event stream.
+
+    :param str directory: The archive directory.  It is created if it does not exist.
+    :param float interval: (optional) The number of seconds between segments.
+    :param str compression: (optional) One of :py:data:`COMPRESSIONS`, by default the best one installed.
+    :param float flush_interval: (optional) The number of seconds between flushes of the current segment.
+
+    """
+
+    def __init__(self, directory, interval=SEGMENT_INTERVAL, compression=None, flush_interval=FLUSH_INTERVAL):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.interval = interval
+        self.compression = get_compression(compression)
+        self.flush_interval = flush_interval
+        self._file = None
+        self._deadline = None
+        self._flush_deadline = None
+        self._line_start = True
+        self._held = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk, now=None):
+        """Record the next ``chunk`` of the stream.
+
+        A chunk which ends with the start of an ``event`` field is held back until the next chunk completes it, so
+        that every event is timestamped.
+
+        :param bytes chunk:
+        :param float now: (optional) The time ``chunk`` was received.
+
+        """
+        now = time.time() if now is None else now
+        if self._held:
+            chunk, self._held = self._held + chunk, b""
+        start = 0
+        end = chunk.find(_EVENT_FIELD)
+        while end >= 0:
+            if (end == 0 and self._line_start) or chunk[end - 1:end] == b"\n":
+                self._write(chunk[start:end])
+                if self._file is None or now >= self._deadline:
+                    self._rotate(now)
+                elif now >= self._flush_deadline:
+                    self._flush(now)
+                self._write(TIME_COMMENT + ("%.3f\n" % now).encode("ascii"))
+                start = end
+            end = chunk.find(_EVENT_FIELD, end + 1)
+        line = chunk.rfind(b"\n") + 1
+        if (line or self._line_start) and 0 < len(chunk) - line < len(_EVENT_FIELD) and \
+                _EVENT_FIELD.startswith(chunk[line:]):
+            self._held = chunk[line:]
+            chunk = chunk[:line]
+        self._write(chunk[start:])
+        if chunk:
+            self._line_start = chunk.endswith(b"\n")
+
+    def new_stream(self):
+        """Mark the start of a new stream, such as after a reconnect.
+
+        A stream which dropped mid-event is ended with a blank line, so that its truncated event is dispatched on its
+        own rather than glued to the first event of the new stream, and that event is timestamped.
+
+        """
+        self._write(self._held + b"\n\n")
+        self._held = b""
+        self._line_start = True
+
+    def close(self):
+        """Close the current segment."""
+        self._write(self._held)
+        self._held = b""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, data):
+        """Write ``data`` to the current segment, if there is one."""
+        if data and self._file is not None:
+            self._file.write(data)
+
+    def _flush(self, now):
+        """Flush the compressed data of every complete event to the current segment."""
+        self._file.flush()
+        self._flush_deadline = now + self.flush_interval
+
+    def _rotate(self, now):
+        """Start a new segment at ``now``."""
+        self.close()
+        timestamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))
+        name = "stream-%s.%03dZ.%s" % (timestamp, now * 1000 % 1000, EXTENSIONS[self.compression])
+        path = os.path.join(self.directory, name)
+        LOG.info("Recording stream to %s", path)
+        self._file = open_segment(path, "wb")
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as f:
+            f.write("%.3f\t%s\n" % (now, name))
+        self._deadline = now + self.interval
+        self._flush_deadline = now + self.flush_interval
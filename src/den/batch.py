@@ -0,0 +1,203 @@
+"""Batch points into fewer, larger InfluxDB writes.
+
+Writing each event's points as soon as they are built costs a synchronous HTTP round trip on the thread which reads
+the Nest stream.  A :py:class:`BatchWriter` instead collects points from many events and writes them from a
+background thread once enough points are pending or the oldest pending point has waited long enough.  A write which
+fails is retried a few times with exponential backoff and then logged and dropped, as is a write the database rejects
+outright, so write errors never reach the collectors.
+
+"""
+
+import threading
+import time
+
+from . import LOG
+from . import metrics
+
+BATCH_SIZE = 5000
+"""Default number of pending points which triggers a write."""
+
+MAX_LATENCY = 1.0
+"""Default number of seconds a pending point may wait before it is written."""
+
+RETRIES = 3
+"""Default number of times a failed write is retried before its batch is dropped."""
+
+RETRY_INTERVAL = 1.0
+"""Default number of seconds before the first retry of a failed write, doubled for each retry after it."""
+
+
+def now(time_precision="s"):
+    """Get the current time as an InfluxDB timestamp of the given ``time_precision``.
+
+    :param str time_precision: One of ``s``, ``ms``, ``u`` or ``n``.
+    :rtype: :py:class:`int`
+
+    """
+    timestamp = time.time()
+    if time_precision == "ms":
+        return int(timestamp * 1e3)
+    if time_precision == "u":
+        return int(timestamp * 1e6)
+    if time_precision == "n":
+        return int(timestamp * 1e9)
+    return int(timestamp)
+
+
+def is_rejected(error):
+    """Determine if ``error`` is a client error which retrying the same write cannot fix.
+
+    Throttling and request timeouts are retried like server errors.
+
+    :param Exception error: An error raised by a write.
+    :rtype: :py:const:`bool`
+
+    """
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and 400 <= code < 500 and code not in (408, 429)
+
+
+def stamp(points, timestamp):
+    """Give each point in ``points`` without a ``time`` the given ``timestamp``.
+
+    Buffered points would otherwise be timestamped by InfluxDB when the batch is written rather than when they were
+    received.
+
+    :param list points: InfluxDB points.
+    :param int timestamp: The timestamp to give points without one.
+    :rtype: :py:class:`list`
+    :returns: ``points``.
+
+    """
+    for point in points:
+        if "time" not in point:
+            point["time"] = timestamp
+    return points
+
+
+class BatchWriter(object):
+    """Write points to InfluxDB in batches from a background thread.
+
+    A batch is written when ``batch_size`` points are pending or ``max_latency`` seconds after the oldest pending
+    point was added, whichever comes first.  Writes happen on a daemon thread so a slow database never blocks the
+    caller.
+
+    :param db: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param int batch_size: The number of pending points which triggers a write.
+    :param float max_latency: The maximum number of seconds a point may wait before it is written.
+    :param str time_precision: The precision of point timestamps.
+    :param int retries: (optional) The number of times a failed write is retried before its batch is dropped.
+    :param float retry_interval: (optional) The number of seconds before the first retry of a failed write.
+
+    """
+
+    def __init__(self, db, batch_size=BATCH_SIZE, max_latency=MAX_LATENCY, time_precision="s", retries=RETRIES,
+                 retry_interval=RETRY_INTERVAL):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.time_precision = time_precision
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self._condition = threading.Condition()
+        self._pending = []
+        self._deadline = None
+        self._flushes = 0
+        self._flushed = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="den-batch-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_points(self, points, time_precision=None):  # pylint: disable=unused-argument
+        """Queue ``points`` to be written with the next batch.
+
+        Points without a ``time`` are stamped with the current time so they keep the time they were received.
+
+        :param list points: InfluxDB points.
+        :param str time_precision: Ignored, every point is written with this writer's ``time_precision``.
+        :rtype: :py:const:`bool`
+        :return: ``True`` once the points are queued.
+
+        """
+        if not points:
+            return True
+        stamp(points, now(self.time_precision))
+        with self._condition:
+            if self._closed:
+                raise ValueError("Write to closed BatchWriter")
+            if not self._pending:
+                self._deadline = time.time() + self.max_latency
+                self._condition.notify_all()
+            self._pending.extend(points)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+        return True
+
+    def flush(self):
+        """Write all pending points and wait until they have been written."""
+        with self._condition:
+            self._flushes += 1
+            flush = self._flushes
+            self._condition.notify_all()
+            while self._flushed < flush and self._thread.is_alive():
+                self._condition.wait()
+
+    def close(self):
+        """Write all pending points and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _is_due(self):
+        """Determine if the pending points should be written now."""
+        return (self._closed or self._flushed < self._flushes or len(self._pending) >= self.batch_size or
+                (self._pending and time.time() >= self._deadline))
+
+    def _run(self):
+        """Write batches until closed."""
+        while True:
+            with self._condition:
+                while not self._is_due():
+                    timeout = self._deadline - time.time() if self._pending else None
+                    self._condition.wait(timeout)
+                pending, self._pending = self._pending, []
+                self._deadline = None
+                flushes = self._flushes
+                closed = self._closed
+            self._write(pending)
+            with self._condition:
+                self._flushed = flushes
+                self._condition.notify_all()
+            if closed:
+                return
+
+    def _write(self, points):
+        """Write ``points`` to the database in chunks of at most ``batch_size`` points."""
+        for i in range(0, len(points), self.batch_size):
+            batch = points[i:i + self.batch_size]
+            metrics.BATCH_POINTS.observe(len(batch))
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """Write ``batch``, retrying failed writes the database did not reject."""
+        delay = self.retry_interval
+        for retry in range(self.retries + 1):
+            try:
+                self.db.write_points(batch, time_precision=self.time_precision)
+                LOG.debug("Wrote batch of %d points", len(batch))
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                if is_rejected(e) or retry == self.retries:
+                    LOG.exception("Could not write batch of %d points, dropped it %s", len(batch), e)
+                    return
+                LOG.warning("Could not write batch of %d points, retrying in %.1f seconds %s", len(batch), delay, e)
+            time.sleep(delay)
+            delay *= 2
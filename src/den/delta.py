@@ -0,0 +1,55 @@
+"""Write only the points whose values have changed.
+
+Every Nest ``put`` event carries the full device tree, so most of the points built from one event repeat the points
+built from the event before it.  A :py:class:`DeltaFilter` remembers the last point written for each series and drops
+points which have not changed.  Every series is still written at least once per keyframe interval so that queries over
+a recent time range always find a value.
+
+"""
+
+import time
+
+KEYFRAME_INTERVAL = 300
+"""Default maximum number of seconds between writes of an unchanged series."""
+
+
+class DeltaFilter(object):
+    """Drop points which repeat the last point written for their series.
+
+    :param dict series_keys: Map of measurement name to the tag keys which identify a series of that measurement.
+                             Points of other measurements are never dropped.
+    :param float keyframe_interval: The maximum number of seconds between writes of an unchanged series.
+
+    """
+
+    def __init__(self, series_keys, keyframe_interval=KEYFRAME_INTERVAL):
+        self.series_keys = series_keys
+        self.keyframe_interval = keyframe_interval
+        self._last = {}
+
+    def filter(self, points, now=None):
+        """Get the points from ``points`` which should be written.
+
+        A point is kept when its tags or fields differ from the last point kept for its series, or when its series
+        has not been written for ``keyframe_interval`` seconds.
+
+        :param list points: InfluxDB points.
+        :param float now: (optional) The current time in seconds since the epoch.
+        :rtype: :py:class:`list`
+
+        """
+        now = time.time() if now is None else now
+        changed = []
+        for point in points:
+            keys = self.series_keys.get(point["measurement"])
+            if keys is None:
+                changed.append(point)
+                continue
+            tags = point["tags"]
+            series = (point["measurement"], ) + tuple(tags.get(k) for k in keys)
+            values = (tags, point["fields"])
+            last = self._last.get(series)
+            if last is None or last[0] != values or now - last[1] >= self.keyframe_interval:
+                self._last[series] = (values, now)
+                changed.append(point)
+        return changed
@@ -0,0 +1,278 @@
+"""Export a time range of a measurement to CSV or Parquet.
+
+Querying a whole measurement with :py:meth:`influxdb.InfluxDBClient.query` holds every row in memory at once.  An
+export instead splits the time range into shards and pages through each shard with ``LIMIT`` and ``OFFSET`` queries
+of at most ``chunk_size`` rows.  Shards are queried in parallel by a pool of threads, each of which spills its pages
+to a temporary file, and the shards are then written to the output in time order one page at a time.  Memory use is
+bounded by a few pages whatever the length of the time range.
+
+The columns are the measurement's time, tag keys and field keys, in that order, as reported by InfluxDB before the
+export starts.  Writing Parquet requires ``pyarrow``, installed with the ``parquet`` extra.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import calendar
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from . import LOG
+from .pool import ordered_map
+
+MEASUREMENTS = ("thermostat", "structure", "weather", "propane")
+"""The measurements which can be exported."""
+
+FORMATS = ("csv", "parquet")
+"""The output formats."""
+
+CHUNK_SIZE = 10000
+"""Default maximum number of rows queried at once."""
+
+SHARD_SIZE = 86400
+"""Default number of seconds of data queried by one worker."""
+
+WORKERS = 4
+"""Default number of concurrent queries."""
+
+EPOCHS = {"s": "s", "ms": "ms", "u": "us", "ns": "ns"}
+"""The supported timestamp precisions and their Parquet timestamp units."""
+
+ROW_GROUP_SIZE = 65536
+"""Number of rows in each Parquet row group."""
+
+_TIME_FORMATS = ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+
+def parse_time(value):
+    """Parse a time given as seconds since the epoch or as an ISO 8601 UTC date or date and time.
+
+    :param str value:
+    :rtype: :py:class:`int`
+    :returns: Seconds since the epoch.
+
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    for time_format in _TIME_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value, time_format))
+        except ValueError:
+            pass
+    raise ValueError("Invalid time '%s'" % value)
+
+
+def get_shards(start, end, shard_size=SHARD_SIZE):
+    """Split the time range from ``start`` up to ``end`` into shards of ``shard_size`` seconds.
+
+    :param int start: Seconds since the epoch.
+    :param int end: Seconds since the epoch.
+    :param int shard_size: (optional)
+    :rtype: :py:class:`list`
+    :returns: ``(start, end)`` tuples.
+
+    """
+    return [(s, min(s + shard_size, end)) for s in range(start, end, shard_size)]
+
+
+def _quote(identifier):
+    """Quote an InfluxQL identifier."""
+    return '"%s"' % identifier.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _get_values(client, query, epoch=None):
+    """Get the ``(columns, values)`` of the first series of the result of ``query``."""
+    series = client.query(query, epoch=epoch).raw.get("series") or [{}]
+    return series[0].get("columns", []), series[0].get("values", [])
+
+
+def get_columns(client, measurement):
+    """Get the columns of ``measurement``.
+
+    :param client: The :py:class:`influxdb.InfluxDBClient` to query.
+    :param str measurement:
+    :rtype: :py:class:`list`
+    :returns: ``(name, type)`` tuples of the time, tag and field columns, where ``type`` is ``time``, ``tag`` or the
+              InfluxDB field type.
+
+    """
+    _, tags = _get_values(client, "SHOW TAG KEYS FROM %s" % _quote(measurement))
+    _, fields = _get_values(client, "SHOW FIELD KEYS FROM %s" % _quote(measurement))
+    return [("time", "time")] + [(t[0], "tag") for t in sorted(tags)] + [(f[0], f[1]) for f in sorted(fields)]
+
+
+def _iter_pages(client, measurement, shard, columns, chunk_size, epoch):
+    """Get each page of rows of ``measurement`` in ``shard``, ordered as ``columns``."""
+    names = [c for c, _ in columns]
+    offset = 0
+    while True:
+        query = "SELECT * FROM %s WHERE time >= %ds AND time < %ds ORDER BY time ASC LIMIT %d OFFSET %d" % (
+            _quote(measurement), shard[0], shard[1], chunk_size, offset)
+        page_columns, values = _get_values(client, query, epoch)
+        if values:
+            if page_columns != names:
+                indices = [page_columns.index(c) if c in page_columns else None for c in names]
+                values = [[v[i] if i is not None else None for i in indices] for v in values]
+            yield values
+        if len(values) < chunk_size:
+            return
+        offset += chunk_size
+
+
+def _spill(client, measurement, shard, columns, chunk_size, epoch, directory):
+    """Query every page of ``shard`` into a temporary file of JSON pages.
+
+    :rtype: :py:class:`tuple`
+    :returns: The path of the file and the number of rows in it.
+
+    """
+    fd, path = tempfile.mkstemp(prefix="%d-" % shard[0], suffix=".jsonl", dir=directory)
+    rows = 0
+    with os.fdopen(fd, "w") as f:
+        for page in _iter_pages(client, measurement, shard, columns, chunk_size, epoch):
+            f.write(json.dumps(page, separators=(",", ":")))
+            f.write("\n")
+            rows += len(page)
+    LOG.debug("Queried %d %s rows from %d to %d", rows, measurement, shard[0], shard[1])
+    return path, rows
+
+
+class CSVWriter(object):
+    """Write rows as CSV with a header.
+
+    :param f: A file opened for writing text.
+    :param list columns: The ``(name, type)`` columns from :py:func:`get_columns`.
+
+    """
+
+    def __init__(self, f, columns):
+        self._writer = csv.writer(f)
+        self._writer.writerow([c for c, _ in columns])
+
+    def write_rows(self, rows):
+        """Write ``rows``."""
+        self._writer.writerows(rows)
+
+    def close(self):
+        """Finish writing."""
+
+
+class ParquetWriter(object):
+    """Write rows to a Parquet file in row groups.
+
+    :param str path:
+    :param list columns: The ``(name, type)`` columns from :py:func:`get_columns`.
+    :param str epoch: (optional) The precision of the timestamps, one of :py:data:`EPOCHS`.
+    :param int row_group_size: (optional) The number of rows in each row group.
+
+    """
+
+    def __init__(self, path, columns, epoch="s", row_group_size=ROW_GROUP_SIZE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing Parquet requires pyarrow. Install the parquet extra to get it.")
+        self._pyarrow = pyarrow
+        types = {
+            "time": pyarrow.timestamp(EPOCHS[epoch], tz="UTC"),
+            "tag": pyarrow.string(),
+            "float": pyarrow.float64(),
+            "integer": pyarrow.int64(),
+            "string": pyarrow.string(),
+            "boolean": pyarrow.bool_(),
+        }
+        self.schema = pyarrow.schema([(name, types.get(kind, pyarrow.string())) for name, kind in columns])
+        self.row_group_size = row_group_size
+        self._rows = []
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_rows(self, rows):
+        """Write ``rows``, buffering up to a row group."""
+        self._rows.extend(rows)
+        while len(self._rows) >= self.row_group_size:
+            self._flush(self._rows[:self.row_group_size])
+            del self._rows[:self.row_group_size]
+
+    def close(self):
+        """Write the last row group and close the file."""
+        if self._rows:
+            self._flush(self._rows)
+            self._rows = []
+        self._writer.close()
+
+    def _flush(self, rows):
+        """Write ``rows`` as one row group."""
+        arrays = [self._pyarrow.array([r[i] for r in rows], type=f.type) for i, f in enumerate(self.schema)]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+
+def export(client,
+           measurement,
+           start,
+           end,
+           output,
+           output_format="csv",
+           epoch="s",
+           workers=WORKERS,
+           chunk_size=CHUNK_SIZE,
+           shard_size=SHARD_SIZE):
+    """Export the rows of ``measurement`` from ``start`` up to ``end`` to ``output``.
+
+    :param client: The :py:class:`influxdb.InfluxDBClient` to query.
+    :param str measurement: One of :py:data:`MEASUREMENTS`.
+    :param int start: Seconds since the epoch.
+    :param int end: Seconds since the epoch.
+    :param str output: The output path, or ``-`` for standard output.
+    :param str output_format: (optional) One of :py:data:`FORMATS`.
+    :param str epoch: (optional) The precision of exported timestamps, one of :py:data:`EPOCHS`.
+    :param int workers: (optional) The number of concurrent queries.
+    :param int chunk_size: (optional) The maximum number of rows queried at once.
+    :param int shard_size: (optional) The number of seconds of data queried by one worker.
+    :rtype: :py:class:`int`
+    :returns: The number of rows exported.
+
+    """
+    if measurement not in MEASUREMENTS:
+        raise ValueError("Unknown measurement '%s'" % measurement)
+    if output_format not in FORMATS:
+        raise ValueError("Unknown format '%s'" % output_format)
+    columns = get_columns(client, measurement)
+    shards = get_shards(start, end, shard_size)
+    LOG.info("Exporting %s in %d shard(s) of %d column(s)", measurement, len(shards), len(columns))
+    directory = tempfile.mkdtemp(prefix="den-export-")
+
+    def spill(shard):
+        """Query one shard."""
+        return _spill(client, measurement, shard, columns, chunk_size, epoch, directory)
+
+    try:
+        if output_format == "parquet":
+            writer = ParquetWriter(output, columns, epoch)
+            f = None
+        else:
+            f = sys.stdout if output == "-" else open(output, "w")
+            writer = CSVWriter(f, columns)
+        total = 0
+        try:
+            with ThreadPoolExecutor(workers) as executor:
+                for path, rows in ordered_map(executor, spill, shards, 2 * workers):
+                    with open(path) as part:
+                        for line in part:
+                            writer.write_rows(json.loads(line))
+                    os.remove(path)
+                    total += rows
+        finally:
+            writer.close()
+            if f is not None and f is not sys.stdout:
+                f.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    LOG.info("Exported %d %s rows", total, measurement)
+    return total
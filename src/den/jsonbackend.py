@@ -0,0 +1,64 @@
+"""Decode JSON with the fastest library installed.
+
+Decoding each multi-kilobyte Nest snapshot is the largest CPU cost of an event.  `orjson`_, `ujson`_ and
+`pysimdjson`_ are all considerably faster than the standard library and are used, in that order of preference, when
+installed.  Every backend decodes :py:class:`bytes`, directly or, with the standard library before Python 3.6, after
+decoding them as UTF-8.  Set the ``DEN_JSON_BACKEND`` environment variable to
+the name of a backend to choose one explicitly.
+
+.. _orjson: https://github.com/ijl/orjson
+.. _ujson: https://github.com/ultrajson/ultrajson
+.. _pysimdjson: https://github.com/TkTech/pysimdjson
+
+"""
+
+import importlib
+import json
+import os
+import sys
+
+from . import LOG
+
+BACKENDS = ("orjson", "ujson", "simdjson", "json")
+"""Names of the supported backends in order of preference."""
+
+_JSON_DECODES_BYTES = sys.version_info >= (3, 6)
+"""Whether the standard library decodes :py:class:`bytes`."""
+
+
+def _json_loads(s):
+    """Decode the JSON document ``s`` with the standard library, decoding :py:class:`bytes` as UTF-8 first."""
+    if isinstance(s, bytes):
+        s = s.decode("utf-8")
+    return json.loads(s)
+
+
+def get_loads(name):
+    """Get the ``loads`` function of the backend ``name``.
+
+    :param str name: One of :py:data:`BACKENDS`.
+    :rtype: :py:class:`collections.Callable`
+    :raises: :exc:`ImportError`: if the backend is not installed.
+
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown JSON backend '%s'" % name)
+    if name == "json" and not _JSON_DECODES_BYTES:
+        return _json_loads
+    return importlib.import_module(name).loads
+
+
+def _select(preferred=None):
+    """Select the first installed backend, starting with ``preferred``."""
+    names = BACKENDS if not preferred else (preferred, ) + BACKENDS
+    for name in names:
+        try:
+            return name, get_loads(name)
+        except (ImportError, ValueError) as e:
+            if name == preferred:
+                LOG.warning("JSON backend '%s' is unavailable %s", name, e)
+    return "json", get_loads("json")
+
+
+NAME, loads = _select(os.environ.get("DEN_JSON_BACKEND"))  # pylint: disable=invalid-name
+"""The name and ``loads`` function of the active backend."""
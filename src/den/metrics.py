@@ -0,0 +1,257 @@
+"""Measure den itself.
+
+Counters, gauges and histograms of den's hot paths are kept in a :py:class:`Registry`.  They can be scraped by
+Prometheus from a local HTTP endpoint started with :py:func:`serve` and written to InfluxDB, as the
+:py:data:`MEASUREMENT` measurement, with :py:func:`report`.
+
+"""
+
+import bisect
+import threading
+import time
+
+MEASUREMENT = "den_internal"
+"""InfluxDB measurement name of den's own metrics."""
+
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Default histogram bucket upper bounds, in seconds."""
+
+SIZE_BUCKETS = (1, 10, 100, 1000, 5000, 10000, 50000, 100000)
+"""Histogram bucket upper bounds of point counts."""
+
+
+def _format(value):
+    """Format a sample value."""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """A value which only increases.
+
+    The type of the initial ``value`` is the type of the InfluxDB field, so a value which is increased by fractions
+    must start at ``0.0``.  InfluxDB rejects a field which changes type.
+
+    :param str name:
+    :param str help: A description of the value.
+    :param value: (optional) The initial value, ``0`` or ``0.0``.
+
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, value=0):  # pylint: disable=redefined-builtin
+        self.name = name
+        self.help = help
+        self.value = value
+        self._float = isinstance(value, float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """Increase the value by ``amount``."""
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        """Get the ``(name, labels, value)`` samples of this metric."""
+        return [(self.name, "", self.value)]
+
+    def fields(self):
+        """Get this metric's InfluxDB fields."""
+        return {self.name: float(self.value) if self._float else self.value}
+
+
+class Gauge(Counter):
+    """A value which may go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value):
+        """Set the value."""
+        self.value = value
+
+
+class Histogram(object):
+    """A distribution of observed values.
+
+    :param str name:
+    :param str help: A description of the values.
+    :param tuple buckets: (optional) The bucket upper bounds.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):  # pylint: disable=redefined-builtin
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record ``value``."""
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.counts):
+                self.counts[i] += 1
+
+    def time(self):
+        """Get a context manager which observes the number of seconds it is active for."""
+        return _Timer(self)
+
+    def samples(self):
+        """Get the ``(name, labels, value)`` samples of this metric."""
+        with self._lock:
+            samples = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", '{le="%s"}' % _format(bound), cumulative))
+            samples.append((self.name + "_bucket", '{le="+Inf"}', self.count))
+            samples.append((self.name + "_sum", "", self.sum))
+            samples.append((self.name + "_count", "", self.count))
+        return samples
+
+    def fields(self):
+        """Get this metric's InfluxDB fields."""
+        with self._lock:
+            return {self.name + "_count": self.count, self.name + "_sum": float(self.sum)}
+
+
+class _Timer(object):
+    """Observe the duration of a ``with`` block."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.time() - self.start)
+
+
+class Registry(object):
+    """A collection of metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, value=0):  # pylint: disable=redefined-builtin
+        """Register a :py:class:`Counter`."""
+        return self._register(Counter(name, help, value))
+
+    def gauge(self, name, help, value=0):  # pylint: disable=redefined-builtin
+        """Register a :py:class:`Gauge`."""
+        return self._register(Gauge(name, help, value))
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS):  # pylint: disable=redefined-builtin
+        """Register a :py:class:`Histogram`."""
+        return self._register(Histogram(name, help, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format.
+
+        :rtype: :py:class:`bytes`
+
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend("%s%s %s" % (name, labels, _format(value)) for name, labels, value in metric.samples())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def points(self, tags=None):
+        """Get every metric as one InfluxDB point.
+
+        :param dict tags: (optional) The point's tags.
+        :rtype: :py:class:`list`
+
+        """
+        fields = {}
+        for metric in self.metrics:
+            fields.update(metric.fields())
+        return [{"measurement": MEASUREMENT, "tags": tags or {}, "fields": fields}]
+
+    def _register(self, metric):
+        """Add ``metric``."""
+        self.metrics.append(metric)
+        return metric
+
+
+REGISTRY = Registry()
+"""den's metrics."""
+
+EVENTS = REGISTRY.counter("den_events_total", "Server-sent events parsed from the Nest stream.")
+KEEP_ALIVES = REGISTRY.counter("den_keep_alives_total", "Keep-alive events received from the Nest stream.")
+DECODE_SECONDS = REGISTRY.histogram("den_decode_seconds", "Seconds spent decoding each JSON payload.")
+POINT_BUILD_SECONDS = REGISTRY.histogram("den_point_build_seconds", "Seconds spent building each set of points.")
+WRITE_SECONDS = REGISTRY.histogram("den_write_seconds", "Seconds each database write took.")
+WRITE_BYTES = REGISTRY.counter("den_write_bytes_total", "Request body bytes sent to the database, after compression.")
+UDP_PACKETS = REGISTRY.counter("den_udp_packets_total", "Packets sent to the InfluxDB UDP listener.")
+SINK_DROPS = REGISTRY.counter("den_sink_drops_total", "Writes dropped because a sink's queue was full.")
+WRITE_ERRORS = REGISTRY.counter("den_write_errors_total", "Database writes which failed.")
+BATCH_POINTS = REGISTRY.histogram("den_batch_points", "Points in each batch written.", SIZE_BUCKETS)
+SPOOL_BYTES = REGISTRY.gauge("den_spool_bytes", "Bytes spooled but not yet drained to the database.")
+RECONNECTS = REGISTRY.counter("den_reconnects_total", "Nest stream reconnections.")
+BACKOFF_SLEEPS = REGISTRY.counter("den_backoff_sleeps_total", "Sleeps before retrying the Nest stream.")
+BACKOFF_SECONDS = REGISTRY.counter("den_backoff_seconds_total", "Seconds slept before retrying the Nest stream.", 0.0)
+TOKEN_REQUESTS = REGISTRY.counter("den_token_requests_total", "Propane API tokens requested.")
+TOKEN_SECONDS = REGISTRY.histogram("den_token_seconds", "Seconds each propane API token request took.")
+
+
+def report(writer, registry=REGISTRY, tags=None):
+    """Write the current value of every metric with ``writer``.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param registry: (optional) The :py:class:`Registry` to write.
+    :param dict tags: (optional) The point's tags.
+
+    """
+    writer.write_points(registry.points(tags), time_precision="s")
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve metrics in the Prometheus text format from a background thread.
+
+    :param int port: The port to listen on, ``0`` for any free port.
+    :param str host: (optional) The address to listen on.
+    :param registry: (optional) The :py:class:`Registry` to serve.
+    :returns: The HTTP server, whose ``server_address`` is the address it listens on.
+
+    """
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        """Serve ``/metrics``."""
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            """Do not log requests."""
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Render the registry."""
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ), name="den-metrics")
+    thread.daemon = True
+    thread.start()
+    return server
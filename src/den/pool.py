@@ -0,0 +1,29 @@
+"""Run units of work on a pool of workers in order.
+
+:py:meth:`concurrent.futures.Executor.map` submits every item before it returns, so mapping over thousands of files or
+shards would queue every result in memory at once.  :py:func:`ordered_map` keeps only a window of items submitted
+ahead of the result being consumed, so a slow consumer holds back the workers rather than piling up their results.
+
+"""
+
+from collections import deque
+
+
+def ordered_map(executor, func, items, window):
+    """Map ``func`` over ``items`` with ``executor``, keeping at most ``window`` results pending.
+
+    :param executor: A :py:class:`concurrent.futures.Executor`.
+    :param func: The function to call with each item.
+    :param items: An iterable of items.
+    :param int window: The maximum number of items submitted ahead of the result being consumed.
+    :rtype: :py:class:`collections.Iterator`
+    :returns: The result of each item, in the order of ``items``.
+
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -1,15 +1,25 @@
 """Record propane data to InfluxDB."""
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 try:
     from urllib.parse import SplitResult, urlencode, urlunsplit
 except ImportError:
     from urllib import urlencode
     from urlparse import SplitResult, urlunsplit
 
+import errno
+import json
+import os
+import time
+
 from influxdb import client as influxdb
 import requests
 
 from . import LOG
+from . import metrics
+from .lineprotocol import GZIP_THRESHOLD, LineProtocolWriter
+from .schema import Schema
 
 PROPANE_API_PROTOCOL = "https"
 PROPANE_API_LOCATION = "data.tankutility.com"
@@ -24,6 +34,25 @@ TAG_KEYS = ["name", "address", "status", "orientation", "fuelType"]
 FIELD_KEYS = ["capacity", "tank", "temperature"]
 """InfluxDB field keys."""
 
+ROLLUP_TAG_KEYS = ("name", "address")
+"""Tag keys which identify a propane tank series when it is rolled up."""
+
+SCHEMA = Schema(MEASUREMENT, TAG_KEYS, FIELD_KEYS, nested_keys=["lastReading"], ignore_keys=["time", "time_iso"])
+"""Projection of device data onto propane points."""
+
+WORKERS = 4
+"""Default maximum number of concurrent propane API requests."""
+
+TOKEN_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "den", "propane-tokens.json")
+"""Default path of the API token cache."""
+
+TOKEN_LIFETIME = 24 * 60 * 60
+"""Number of seconds an API token is valid for."""
+
+TOKEN_RENEWAL_MARGIN = 15 * 60
+"""Number of seconds before an API token expires that it is renewed."""
+
 
 def _get_api_url(token="", path=""):
     """Get an API URL for the given path.
@@ -41,85 +70,224 @@ def _get_api_url(token="", path=""):
     return urlunsplit(split)
 
 
-def _get_token(username, password):
+def get_session(workers=WORKERS):
+    """Get a session which pools connections to the propane API.
+
+    :param int workers: (optional) The number of connections to keep open.
+    :rtype: :py:class:`requests.Session`
+
+    """
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    session.verify = False
+    return session
+
+
+def _get_token(session, username, password):
     """Get an API token.
 
     Unfortunately, the Tank Utility API only offers basic authentication and expires each API token after 24 hours.
 
+    :param requests.Session session:
     :param str username:
     :param str password:
     :rtype: :py:class:`str`
     :returns: An API token
 
     """
-    r = requests.get(_get_api_url(path="getToken"),
-                     auth=requests.auth.HTTPBasicAuth(username, password),
-                     verify=False)
+    metrics.TOKEN_REQUESTS.inc()
+    with metrics.TOKEN_SECONDS.time():
+        r = session.get(_get_api_url(path="getToken"), auth=requests.auth.HTTPBasicAuth(username, password))
     LOG.debug("[%d] URL: %s", r.status_code, r.url)
     r.raise_for_status()
     return r.json()["token"]
 
 
-def _get_devices(token):
+def _read_token_cache(path, username):
+    """Get the cached API token of ``username``.
+
+    :param str path: The path of the token cache.
+    :param str username:
+    :rtype: :py:class:`dict`
+    :returns: The cached ``token`` and its ``expires`` time or ``None``.
+
+    """
+    try:
+        with open(path) as f:
+            return json.load(f).get(username)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            LOG.warning("Could not read token cache %s %s", path, e)
+    except (AttributeError, ValueError) as e:
+        LOG.warning("Invalid token cache %s %s", path, e)
+    return None
+
+
+def _write_token_cache(path, username, token, expires):
+    """Cache the API token of ``username``.
+
+    The cache is readable by its owner only and is replaced atomically so that concurrent runs never read a partially
+    written cache.
+
+    :param str path: The path of the token cache.
+    :param str username:
+    :param str token:
+    :param float expires: The time the token expires in seconds since the epoch.
+
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            cache = {}
+    except (IOError, OSError, ValueError):
+        cache = {}
+    cache[username] = {"token": token, "expires": expires}
+    directory = os.path.dirname(path)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(cache, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        LOG.warning("Could not write token cache %s %s", path, e)
+
+
+def _get_cached_token(session, username, password, cache=TOKEN_CACHE, renew=False):
+    """Get an API token, from ``cache`` while it is valid.
+
+    A cached token is renewed :py:data:`TOKEN_RENEWAL_MARGIN` seconds before it expires.
+
+    :param requests.Session session:
+    :param str username:
+    :param str password:
+    :param str cache: (optional) The path of the token cache or ``None`` not to cache tokens.
+    :param bool renew: (optional) Whether or not to get a new token regardless of the cache.
+    :rtype: :py:class:`str`
+    :returns: An API token
+
+    """
+    now = time.time()
+    if cache and not renew:
+        cached = _read_token_cache(cache, username)
+        if cached and cached.get("expires", 0) - TOKEN_RENEWAL_MARGIN > now:
+            LOG.debug("Using cached token for %s", username)
+            return cached["token"]
+    token = _get_token(session, username, password)
+    if cache:
+        _write_token_cache(cache, username, token, now + TOKEN_LIFETIME)
+    return token
+
+
+def _get_devices(session, token):
     """Get devices currently associated with ``api_key``.
 
+    :param requests.Session session:
     :param str token:
     :rtype: :py:class:`list`
 
     """
-    r = requests.get(_get_api_url(token=token, path="devices"), verify=False)
+    r = session.get(_get_api_url(token=token, path="devices"))
     LOG.debug("[%d] URL: %s", r.status_code, r.url)
     r.raise_for_status()
     return r.json()["devices"]
 
 
-def _get_data(token, device):
+def _get_data(session, token, device):
     """Get current data from ``device``.
 
+    :param requests.Session session:
     :param str token:
     :param str device: Device id
     :rtype: :py:class:`dict`
 
     """
     path = "/".join(["devices", device])
-    r = requests.get(_get_api_url(token=token, path=path), verify=False)
+    r = session.get(_get_api_url(token=token, path=path))
     LOG.debug("[%d] URL: %s", r.status_code, r.url)
     r.raise_for_status()
     return r.json()
 
 
-def _get_points(token, device):
-    """Get data prepared for InfluxDB insertion.
+def _get_point(session, token, device):
+    """Get the current data of ``device`` prepared for InfluxDB insertion.
 
+    :param requests.Session session:
     :param str token:
     :param str device: Device id
+    :rtype: :py:class:`dict`
+
+    """
+    data = _get_data(session, token, device)
+    LOG.debug("dict: %s", data)
+    point = SCHEMA.project(data["device"], {"device": device})
+    LOG.debug("Point: %s", point)
+    return point
+
+
+def _get_points(session, token, devices, workers=WORKERS, batch=None):
+    """Get data prepared for InfluxDB insertion.
+
+    The data of each device is requested concurrently by up to ``workers`` threads.
+
+    :param requests.Session session:
+    :param str token:
+    :param list devices: Device ids
+    :param int workers: (optional) The maximum number of concurrent requests.
+    :param batch: (optional) A :py:class:`~den.lineprotocol.PointBatch` to append the points to.
     :rtype: :py:class:`list`
-    :returns: The current data prepared for insertion into InfluxDB.
+    :returns: The current data prepared for insertion into InfluxDB, or ``batch`` when one is given.
+
+    """
+    if not devices:
+        return [] if batch is None else batch
+    with ThreadPoolExecutor(max_workers=min(workers, len(devices))) as executor:
+        if batch is None:
+            return list(executor.map(lambda device: _get_point(session, token, device), devices))
+        data = list(executor.map(lambda device: _get_data(session, token, device), devices))
+    for device, device_data in zip(devices, data):
+        SCHEMA.append(batch, device_data["device"], {"device": device})
+    return batch
+
+
+def collect(writer, session, username, password, workers=WORKERS, token_cache=TOKEN_CACHE):
+    """Write current propane data with ``writer``.
+
+    API tokens are cached in ``token_cache`` until shortly before they expire.  A cached token which the API rejects
+    is renewed once.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param requests.Session session: A session from :py:func:`get_session`.
+    :param str username:
+    :param str password:
+    :param int workers: (optional) The maximum number of concurrent propane API requests.
+    :param str token_cache: (optional) The path of the API token cache or ``None`` not to cache tokens.
+    :rtype: :py:const:`None`
 
     """
-    devices = _get_devices(token)
-    points = []
-    for device in devices:
-        data = _get_data(token, device)
-        LOG.debug("dict: %s", data)
-        point = {"measurement": MEASUREMENT, "tags": {"device": device}, "fields": {}}
-        for k, v in data["device"].items():
-            if k in TAG_KEYS:
-                point["tags"][k] = v
-            elif k == "lastReading":
-                for k, v in data["device"]["lastReading"].items():
-                    if k in FIELD_KEYS:
-                        point["fields"][k] = float(v)
-            elif k in FIELD_KEYS:
-                point["fields"][k] = float(v)
-            else:
-                LOG.warning("Unknown property: '%s': '%s'", k, v)
-        points.append(point)
-        LOG.debug("Point: %s", point)
-    return points
-
-
-def record(database, port, ssl, username, password):
+    token = _get_cached_token(session, username, password, token_cache)
+    try:
+        points = _get_points(session, token, _get_devices(session, token), workers)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        LOG.info("Renewing rejected token for %s", username)
+        token = _get_cached_token(session, username, password, token_cache, renew=True)
+        points = _get_points(session, token, _get_devices(session, token), workers)
+    writer.write_points(points, time_precision="s")
+
+
+def record(database,
+           port,
+           ssl,
+           username,
+           password,
+           workers=WORKERS,
+           token_cache=TOKEN_CACHE,
+           gzip_level=None,
+           gzip_threshold=GZIP_THRESHOLD):
     """Record current propane data into the database.
 
     .. note::
@@ -131,11 +299,16 @@ def record(database, port, ssl, username, password):
     :param bool ssl: Whether or not to use SSL to communicate with the database.
     :param str username:
     :param str password:
+    :param int workers: (optional) The maximum number of concurrent propane API requests.
+    :param str token_cache: (optional) The path of the API token cache or ``None`` not to cache tokens.
+    :param int gzip_level: (optional) The gzip compression level of database writes, by default they are not
+                           compressed.
+    :param int gzip_threshold: (optional) The minimum number of bytes in a compressed database write.
     :rtype: :py:const:`None`
     :return: When the current propane data has been written to the database.
 
     """
-    db = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
-    token = _get_token(username, password)
-    for device in _get_devices(token):
-        db.write_points(_get_points(token, device), time_precision="s")
+    client = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
+    db = LineProtocolWriter(client, database, gzip_level=gzip_level, gzip_threshold=gzip_threshold)
+    with closing(get_session(workers)) as session:
+        collect(db, session, username, password, workers, token_cache)
@@ -0,0 +1,297 @@
+"""Backfill InfluxDB from archived thermostat streams.
+
+Archives are replayed through the same event handlers and point builders as the live stream, but as fast as the
+database accepts them rather than as fast as the Nest API sends them.  Two formats are read:
+
+* server-sent event streams, such as the segments written by :py:class:`den.archive.StreamRecorder`, compressed or
+  not.  Each event is written with the time of the ``: t=`` comment before it, or with the segment's start time
+  when the stream has none.
+* newline-delimited JSON snapshots, with a ``.ndjson`` or ``.jsonl`` extension.  Each line is either a ``put``
+  payload, ``{"path": "/", "data": {...}}``, or the data tree itself and must have a ``time`` member giving the time
+  of the snapshot in seconds since the epoch.
+
+Files are decoded in parallel by a pool of processes.  Large uncompressed snapshot files are memory-mapped and split
+into shards at line boundaries so that they are decoded in parallel too.  Event streams carry state from one event
+to the next, so each stream file is one unit of work.  Each unit's points are encoded as line protocol by its worker
+and written in large batches.  When a progress file is given, every unit is recorded there once its points are
+written, and a later replay with the same progress file skips it.  A compressed file which ends early, such as the
+segment being written when the recorder crashed, is replayed up to where it ends.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import multiprocessing
+import os
+
+from . import LOG
+from . import jsonbackend
+from . import thermostat
+from .archive import EXTENSIONS, INDEX_FILE, TimedParser, open_segment, read_index
+from .lineprotocol import PointBatch
+from .pool import ordered_map
+from .spool import BATCH_BYTES
+
+try:
+    from zstandard import ZstdError
+    _TRUNCATED_ERRORS = (EOFError, ZstdError)
+except ImportError:
+    _TRUNCATED_ERRORS = (EOFError, )
+
+SHARD_SIZE = 2**26
+"""Default number of bytes of a snapshot file decoded by one worker."""
+
+READ_SIZE = 2**20
+"""Number of bytes of a stream read at a time."""
+
+SNAPSHOT_EXTENSIONS = ("ndjson", "jsonl")
+"""File name extensions of newline-delimited JSON snapshots, before any compression extension."""
+
+TIME_PRECISION = "s"
+"""The precision of replayed timestamps, the same as the live stream's."""
+
+
+def _is_compressed(path):
+    """Determine if the file at ``path`` is compressed."""
+    return path.endswith(tuple(os.extsep + e.rsplit(os.extsep, 1)[1] for e in EXTENSIONS.values()))
+
+
+def _is_snapshots(path):
+    """Determine if the file at ``path`` holds newline-delimited JSON snapshots."""
+    name = os.path.basename(path)
+    if _is_compressed(name):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[1][1:] in SNAPSHOT_EXTENSIONS
+
+
+def get_units(paths, shard_size=SHARD_SIZE):
+    """Get the units of work which replay ``paths``.
+
+    Directories are replayed in the order of their archive index or, without one, of their file names.
+
+    :param list paths: Archive files and directories.
+    :param int shard_size: (optional) The number of bytes of a snapshot file in one unit.
+    :rtype: :py:class:`list`
+    :returns: ``(path, start, end, time)`` tuples, where ``start`` and ``end`` are the byte offsets of a shard of
+              an uncompressed snapshot file and ``time`` is the start time of the file.
+
+    """
+    units = []
+    for path in paths:
+        if os.path.isdir(path):
+            if os.path.exists(os.path.join(path, INDEX_FILE)):
+                files = read_index(path)
+            else:
+                files = [(None, os.path.join(path, n)) for n in sorted(os.listdir(path))
+                         if n != INDEX_FILE and not n.startswith(".")]
+        else:
+            files = [(None, path)]
+        for start_time, f in files:
+            if start_time is None:
+                start_time = os.path.getmtime(f)
+            if _is_snapshots(f) and not _is_compressed(f):
+                units.extend((f, start, end, start_time) for start, end in _shard(f, shard_size))
+            else:
+                units.append((f, 0, None, start_time))
+    return units
+
+
+def _shard(path, shard_size):
+    """Split the file at ``path`` into byte ranges of about ``shard_size`` bytes which end at line boundaries."""
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    shards = []
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", min(start + shard_size, size) - 1) + 1 or size
+                shards.append((start, end))
+                start = end
+        finally:
+            mm.close()
+    return shards
+
+
+def _get_points(value, timestamp, batch):
+    """Append the points of the data tree ``value`` at ``timestamp`` to ``batch``."""
+    start = len(batch)
+    thermostat._get_structure_points(value, batch=batch)  # pylint: disable=protected-access
+    thermostat._get_thermostat_points(value, batch=batch)  # pylint: disable=protected-access
+    batch.stamp(int(timestamp), start)
+
+
+def _load_stream_points(path, start_time, batch):
+    """Append the points of each event of the stream at ``path`` to ``batch``."""
+    parser = TimedParser(start_time)
+    state = {}
+    with open_segment(path) as f:
+        read = getattr(f, "read1", f.read)
+        try:
+            for chunk in iter(lambda: read(READ_SIZE), b""):
+                for timestamp, event in parser.feed(chunk):
+                    value = _handle(state, event)
+                    if value:
+                        _get_points(value, timestamp, batch)
+        except _TRUNCATED_ERRORS as e:
+            LOG.warning("Skipping the rest of truncated %s %s", path, e)
+            return
+    for timestamp, event in parser.close():
+        value = _handle(state, event)
+        if value:
+            _get_points(value, timestamp, batch)
+
+
+def _handle(state, event):
+    """Handle a replayed event, logging rather than raising errors."""
+    try:
+        return thermostat._handle(state, event)  # pylint: disable=protected-access
+    except thermostat.AuthRevokedError as e:
+        LOG.warning("Access token revoked %s", e)
+        return None
+
+
+def _get_snapshot_points(line, path, batch):
+    """Append the points of the snapshot ``line`` of the file at ``path`` to ``batch``."""
+    try:
+        snapshot = jsonbackend.loads(line)
+    except ValueError as e:
+        LOG.error("Error processing snapshot: '%s', '%s'", line, e)
+        return
+    if "time" not in snapshot:
+        LOG.warning("Skipping snapshot without time in %s", path)
+        return
+    timestamp = snapshot.pop("time")
+    _get_points(snapshot if "data" in snapshot else {"path": "/", "data": snapshot}, timestamp, batch)
+
+
+def _load_snapshot_points(path, start, end, batch):
+    """Append the points of each snapshot between the byte offsets ``start`` and ``end`` of the file at ``path``.
+
+    Compressed files, which have no ``end``, are read as a stream.
+
+    """
+    if end is None:
+        with open_segment(path) as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        _get_snapshot_points(line, path, batch)
+            except _TRUNCATED_ERRORS as e:
+                LOG.warning("Skipping the rest of truncated %s %s", path, e)
+        return
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            while start < end:
+                line_end = mm.find(b"\n", start, end)
+                if line_end < 0:
+                    line_end = end
+                line = mm[start:line_end]
+                start = line_end + 1
+                if line.strip():
+                    _get_snapshot_points(line, path, batch)
+        finally:
+            mm.close()
+
+
+def load(unit):
+    """Decode and encode the points of one unit of work.
+
+    :param tuple unit: One of the units returned by :py:func:`get_units`.
+    :rtype: :py:class:`tuple`
+    :returns: ``unit``, the number of points and their line protocol.
+
+    """
+    path, start, end, start_time = unit
+    batch = PointBatch()
+    if _is_snapshots(path):
+        _load_snapshot_points(path, start, end, batch)
+    else:
+        _load_stream_points(path, start_time, batch)
+    return unit, len(batch), batch.encode()
+
+
+def _split(data, size):
+    """Split line protocol ``data`` into chunks of at most ``size`` bytes, unless a single line is longer."""
+    start = 0
+    while start < len(data):
+        end = start + size
+        if end < len(data):
+            end = data.rfind(b"\n", start, end) + 1 or data.find(b"\n", end) + 1 or len(data)
+        yield data[start:end]
+        start = end
+
+
+class Progress(object):
+    """Record replayed units of work in an append-only file.
+
+    :param str path: The progress file path or ``None`` to not record progress.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = set(tuple(l.rstrip("\n").rsplit("\t", 1)) for l in f if l.strip())
+
+    def is_done(self, unit):
+        """Determine if ``unit`` has already been replayed."""
+        return self._key(unit) in self.done
+
+    def add(self, unit):
+        """Record that ``unit`` has been replayed."""
+        key = self._key(unit)
+        self.done.add(key)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write("\t".join(key) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _key(unit):
+        """Get the key of ``unit``."""
+        return os.path.abspath(unit[0]), str(unit[1])
+
+
+def replay(db, paths, workers=None, batch_bytes=BATCH_BYTES, progress=None, shard_size=SHARD_SIZE):
+    """Replay the archives at ``paths`` into the database.
+
+    :param db: Anything with a :py:meth:`den.lineprotocol.LineProtocolWriter.write` compatible method.
+    :param list paths: Archive files and directories.
+    :param int workers: (optional) The number of decoding processes, by default one per CPU.  ``0`` decodes in
+                        this process.
+    :param int batch_bytes: (optional) The maximum number of bytes written at once.
+    :param str progress: (optional) The progress file to resume from and record to.
+    :param int shard_size: (optional) The number of bytes of a snapshot file decoded by one worker.
+    :rtype: :py:class:`int`
+    :returns: The number of points written.
+
+    """
+    done = Progress(progress)
+    units = [u for u in get_units(paths, shard_size) if not done.is_done(u)]
+    LOG.info("Replaying %d unit(s) of %d file(s)", len(units), len(set(u[0] for u in units)))
+    total = 0
+    if workers == 0:
+        results = (load(u) for u in units)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(workers)
+        results = ordered_map(executor, load, units, 2 * (workers or multiprocessing.cpu_count()))
+    try:
+        for unit, count, data in results:
+            for batch in _split(data, batch_bytes):
+                db.write(batch, TIME_PRECISION)
+            done.add(unit)
+            total += count
+            LOG.debug("Replayed %d points from %s", count, unit[0])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    LOG.info("Replayed %d points", total)
+    return total
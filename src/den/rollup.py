@@ -0,0 +1,215 @@
+"""Roll points up into fixed time windows before they are written.
+
+Dashboards mostly chart per-minute or per-hour values, which InfluxDB otherwise aggregates from every raw point on
+every query.  A :py:class:`Rollup` sits between the collectors and the writer and keeps the ``min``, ``max``,
+``mean``, ``last`` and ``count`` of each numeric field of each series in the current window.  When a window closes its
+aggregates are written as one point of a separate rollup measurement, named after the raw measurement with
+:py:data:`SUFFIX`, timestamped with the start of the window.  A field ``temperature`` is rolled up into the fields
+``temperature_min``, ``temperature_max``, ``temperature_mean``, ``temperature_last`` and ``temperature_count``.
+
+A window closes when the first point at or after its end is written.  The open windows are saved to a checkpoint file
+periodically and on close, and loaded again on start, so a restart does not lose a partial window.
+
+"""
+
+from numbers import Number
+import errno
+import json
+import os
+import threading
+import time
+
+from . import LOG
+from .batch import now
+
+WINDOW = 60
+"""Default number of seconds in a window."""
+
+SUFFIX = "_rollup"
+"""Appended to a measurement name to get the name of its rollup measurement."""
+
+CHECKPOINT_INTERVAL = 10.0
+"""Default number of seconds between checkpoints."""
+
+
+def _aggregate(aggregates, value):
+    """Add ``value`` to the ``[min, max, sum, count, last]`` list ``aggregates``."""
+    if value < aggregates[0]:
+        aggregates[0] = value
+    if value > aggregates[1]:
+        aggregates[1] = value
+    aggregates[2] += value
+    aggregates[3] += 1
+    aggregates[4] = value
+
+
+class Rollup(object):
+    """Aggregate points into windows and write each closed window.
+
+    Points are also passed through to ``writer`` unless ``raw`` is false, in which case only the points of
+    measurements which are not rolled up are.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param dict measurements: Map of measurement name to the field keys rolled up and the tag keys which identify a
+                              series, or ``None`` to identify a series by all of its tags.
+    :param int window: (optional) The number of seconds in a window.
+    :param str checkpoint: (optional) The path of the checkpoint file.
+    :param bool raw: (optional) Whether or not to write the raw points of rolled up measurements too.
+    :param float checkpoint_interval: (optional) The number of seconds between checkpoints.
+
+    """
+
+    def __init__(self,
+                 writer,
+                 measurements,
+                 window=WINDOW,
+                 checkpoint=None,
+                 raw=True,
+                 checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.writer = writer
+        self.measurements = dict((m, (frozenset(f), t)) for m, (f, t) in measurements.items())
+        self.window = int(window)
+        self.checkpoint = checkpoint
+        self.raw = raw
+        self.checkpoint_interval = checkpoint_interval
+        self._windows = {}
+        self._closed = []
+        self._next_close = None
+        self._next_checkpoint = time.time() + checkpoint_interval
+        self._lock = threading.Lock()
+        if checkpoint:
+            self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_points(self, points, time_precision=None):
+        """Aggregate ``points`` and write them and any windows they close.
+
+        Points without a ``time`` are stamped with the current time, so they are aggregated into the window they were
+        received in.
+
+        :param list points: InfluxDB points with timestamps in seconds.
+        :param str time_precision: (optional) The precision of point timestamps, which must be ``s``.
+
+        """
+        if time_precision not in (None, "s"):
+            raise ValueError("Only points with timestamps in seconds can be rolled up")
+        timestamp = now()
+        passed = []
+        with self._lock:
+            for point in points:
+                if "time" not in point:
+                    point["time"] = timestamp
+                if point["measurement"] in self.measurements:
+                    self._add(point)
+                    if self.raw:
+                        passed.append(point)
+                else:
+                    passed.append(point)
+            closed = self._close(timestamp)
+            checkpoint = self.checkpoint and time.time() >= self._next_checkpoint
+            if checkpoint:
+                self._save()
+        if passed or closed:
+            self.writer.write_points(passed + closed, time_precision="s")
+
+    def close(self):
+        """Write every window which has ended and checkpoint the rest."""
+        with self._lock:
+            closed = self._close(now())
+            if self.checkpoint:
+                self._save()
+        if closed:
+            self.writer.write_points(closed, time_precision="s")
+
+    def _add(self, point):
+        """Add ``point`` to the window of its series."""
+        fields, tag_keys = self.measurements[point["measurement"]]
+        tags = point["tags"]
+        if tag_keys is not None:
+            tags = dict((k, tags[k]) for k in tag_keys if k in tags)
+        key = (point["measurement"], tuple(sorted(tags.items())))
+        start = int(point["time"]) // self.window * self.window
+        series = self._windows.get(key)
+        if series is not None and start != series[0]:
+            if start < series[0]:
+                LOG.debug("Not rolling up %s point from before its window", point["measurement"])
+                return
+            self._closed.append(self._point(key, series))
+            series = None
+        if series is None:
+            series = self._windows[key] = [start, {}]
+            end = start + self.window
+            if self._next_close is None or end < self._next_close:
+                self._next_close = end
+        aggregates = series[1]
+        for k, v in point["fields"].items():
+            if k in fields and isinstance(v, Number) and not isinstance(v, bool):
+                if k in aggregates:
+                    _aggregate(aggregates[k], v)
+                else:
+                    aggregates[k] = [v, v, v, 1, v]
+
+    def _close(self, timestamp):
+        """Close the windows which ended by ``timestamp`` and get their points and those already pending."""
+        closed, self._closed = self._closed, []
+        if self._next_close is None or timestamp < self._next_close:
+            return closed
+        self._next_close = None
+        for key, series in list(self._windows.items()):
+            end = series[0] + self.window
+            if end <= timestamp:
+                closed.append(self._point(key, series))
+                del self._windows[key]
+            elif self._next_close is None or end < self._next_close:
+                self._next_close = end
+        return [p for p in closed if p["fields"]]
+
+    def _point(self, key, series):
+        """Get the rollup point of the window ``series`` of the series ``key``."""
+        measurement, tags = key
+        fields = {}
+        for k, (low, high, total, count, last) in series[1].items():
+            fields[k + "_min"] = float(low)
+            fields[k + "_max"] = float(high)
+            fields[k + "_mean"] = total / float(count)
+            fields[k + "_last"] = float(last)
+            fields[k + "_count"] = count
+        return {"measurement": measurement + SUFFIX, "tags": dict(tags), "fields": fields, "time": series[0]}
+
+    def _save(self):
+        """Write the open windows to the checkpoint file, replacing it atomically."""
+        state = {
+            "window": self.window,
+            "series": [[m, list(t), s[0], s[1]] for (m, t), s in self._windows.items()],
+        }
+        tmp_path = self.checkpoint + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.checkpoint)
+        self._next_checkpoint = time.time() + self.checkpoint_interval
+
+    def _load(self):
+        """Read the open windows from the checkpoint file."""
+        try:
+            with open(self.checkpoint) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            if getattr(e, "errno", None) != errno.ENOENT:
+                LOG.warning("Could not read rollup checkpoint %s", e)
+            return
+        if state.get("window") != self.window:
+            LOG.warning("Ignoring rollup checkpoint of %s second windows", state.get("window"))
+            return
+        for measurement, tags, start, aggregates in state["series"]:
+            self._windows[(measurement, tuple(tuple(t) for t in tags))] = [start, aggregates]
+            end = start + self.window
+            if self._next_close is None or end < self._next_close:
+                self._next_close = end
+        LOG.info("Resumed %d rollup window(s)", len(self._windows))
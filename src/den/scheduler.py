@@ -0,0 +1,115 @@
+"""Run periodic collectors in one process.
+
+A :py:class:`Scheduler` runs each :py:class:`Job` every ``interval`` seconds on a fixed grid which starts when the
+scheduler starts.  Each run may be delayed by up to ``jitter`` random seconds so that collectors sharing an interval
+do not hit their APIs at the same instant.  When a run takes longer than its interval, or the process is suspended,
+ticks are missed and the job's ``missed`` policy decides whether to :py:data:`SKIP` them or :py:data:`COALESCE` them
+into one immediate run.
+
+"""
+
+import random
+import threading
+import time
+
+from . import LOG
+
+SKIP = "skip"
+"""Skip missed ticks and wait for the next one."""
+
+COALESCE = "coalesce"
+"""Run once, immediately, for any number of missed ticks."""
+
+MISSED_POLICIES = (SKIP, COALESCE)
+"""Missed tick policies."""
+
+
+class Job(object):
+    """A function to run periodically.
+
+    :param str name: The name of the job, for logging.
+    :param func: The function to run, without arguments.
+    :param float interval: The number of seconds between runs.
+    :param float jitter: (optional) The maximum number of random seconds to delay each run by.
+    :param str missed: (optional) The missed tick policy, one of :py:data:`MISSED_POLICIES`.
+
+    """
+
+    def __init__(self, name, func, interval, jitter=0.0, missed=SKIP):
+        if missed not in MISSED_POLICIES:
+            raise ValueError("Unknown missed tick policy '%s'" % missed)
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.missed = missed
+        self.tick = None
+        self.due = None
+
+    def start(self, now):
+        """Schedule the first run at ``now``."""
+        self.tick = now
+        self.due = now + random.uniform(0, self.jitter)
+
+    def schedule(self, now):
+        """Schedule the next run after a run which finished at ``now``."""
+        self.tick += self.interval
+        if self.tick <= now:
+            missed = int((now - self.tick) // self.interval) + 1
+            if self.missed == SKIP:
+                LOG.warning("%s missed %d tick(s), skipping", self.name, missed)
+                self.tick += missed * self.interval
+            else:
+                LOG.warning("%s missed %d tick(s), running now", self.name, missed)
+                self.tick += (missed - 1) * self.interval
+        self.due = self.tick + random.uniform(0, self.jitter)
+
+    def run(self):
+        """Run the job, logging rather than raising any error."""
+        LOG.debug("Running %s", self.name)
+        try:
+            self.func()
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.exception("%s failed %s", self.name, e)
+
+
+class Scheduler(object):
+    """Run jobs periodically until stopped.
+
+    :param list jobs: The :py:class:`Job` objects to run.
+
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        """Run jobs in the current thread until :py:meth:`stop` is called."""
+        if not self.jobs:
+            self._stop.wait()
+            return
+        now = time.time()
+        for job in self.jobs:
+            job.start(now)
+        while not self._stop.is_set():
+            job = min(self.jobs, key=lambda j: j.due)
+            delay = job.due - time.time()
+            if delay > 0:
+                self._stop.wait(delay)
+                continue
+            job.run()
+            job.schedule(time.time())
+
+    def start(self):
+        """Run jobs in a background thread."""
+        self._thread = threading.Thread(target=self.run, name="den-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop running jobs, waiting for a running job to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,107 @@
+"""Project API payloads onto InfluxDB points.
+
+Each measurement's tag keys, field keys, field renames and field converters are compiled into a single lookup table
+once, when the measurement's :py:class:`Schema` is created.  Projecting a payload is then one dictionary lookup per
+payload key rather than a scan of every tag and field key list.
+
+Unknown keys and values which cannot be converted are logged and skipped rather than raised so that one bad value
+never costs the rest of a batch.
+
+"""
+
+from . import LOG
+
+
+class Schema(object):
+    """A compiled projection of payload dictionaries onto points of one measurement.
+
+    :param str measurement: The InfluxDB measurement name.
+    :param tag_keys: Payload keys written as tags.
+    :param field_keys: Payload keys written as fields.
+    :param dict renames: (optional) Map of payload key to field key, for fields written under another name.
+    :param dict converters: (optional) Map of payload key to a function converting its value to a field value.
+                            Fields are converted with :py:func:`float` by default.
+    :param nested_keys: (optional) Payload keys whose dictionary values are projected along with the payload.
+    :param bool report_unknown: (optional) Whether or not to log payload keys the schema does not know about.
+    :param ignore_keys: (optional) Payload keys never to log as unknown.
+
+    """
+
+    def __init__(self,
+                 measurement,
+                 tag_keys,
+                 field_keys,
+                 renames=None,
+                 converters=None,
+                 nested_keys=(),
+                 report_unknown=True,
+                 ignore_keys=()):
+        self.measurement = measurement
+        self.report_unknown = report_unknown
+        renames = renames or {}
+        converters = converters or {}
+        projection = {}
+        for k in tag_keys:
+            projection[k] = (k, None, None, False)
+        for k in field_keys:
+            tag = projection[k][0] if k in projection else None
+            projection[k] = (tag, renames.get(k, k), converters.get(k, float), False)
+        for k in nested_keys:
+            projection[k] = (None, None, None, True)
+        self._projection = projection
+        self._ignore_keys = frozenset(ignore_keys)
+
+    def project(self, data, tags=None):
+        """Project ``data`` onto a point.
+
+        :param dict data: A payload dictionary.
+        :param dict tags: (optional) Tags to add to the point.
+        :rtype: :py:class:`dict`
+        :returns: A point in the :py:meth:`influxdb.InfluxDBClient.write_points` format.
+
+        """
+        point = {"measurement": self.measurement, "tags": dict(tags) if tags else {}, "fields": {}}
+        self._project(data, point["tags"], point["fields"])
+        return point
+
+    def append(self, batch, data, tags=None, timestamp=None):
+        """Project ``data`` straight into a :py:class:`~den.lineprotocol.PointBatch`.
+
+        :param batch: The :py:class:`~den.lineprotocol.PointBatch` to append the point to.
+        :param dict data: A payload dictionary.
+        :param dict tags: (optional) Tags to add to the point.
+        :param int timestamp: (optional) The point's timestamp, by default the current time.
+
+        """
+        tags = dict(tags) if tags else {}
+        batch.append(self.measurement, tags, self._iter_fields(data, tags), timestamp)
+
+    def _project(self, data, tags, fields):
+        """Project ``data`` into ``tags`` and ``fields``."""
+        fields.update(self._iter_fields(data, tags))
+
+    def _iter_fields(self, data, tags):
+        """Project ``data`` into ``tags`` and get its ``(field, value)`` pairs."""
+        projection = self._projection
+        for k, v in data.items():
+            entry = projection.get(k)
+            if entry is None:
+                if self.report_unknown and k not in self._ignore_keys:
+                    LOG.warning("%s unknown property: '%s': '%s'", self.measurement, k, v)
+                continue
+            tag, field, converter, nested = entry
+            if tag is not None:
+                tags[tag] = v
+            if field is not None:
+                try:
+                    value = converter(v)
+                except (TypeError, ValueError) as e:
+                    LOG.warning("%s invalid property: '%s': '%s' %s", self.measurement, k, v, e)
+                else:
+                    yield field, value
+            if nested:
+                if isinstance(v, dict):
+                    for item in self._iter_fields(v, tags):
+                        yield item
+                else:
+                    LOG.warning("%s invalid property: '%s': '%s'", self.measurement, k, v)
@@ -0,0 +1,227 @@
+"""Write points to several destinations at once.
+
+A sink is anything with a :py:meth:`den.lineprotocol.LineProtocolWriter.write` compatible method, which takes a body
+of encoded line protocol.  :py:class:`~den.lineprotocol.LineProtocolWriter` and :py:class:`~den.udp.UDPWriter` write
+to InfluxDB, :py:class:`FileSink` appends to a file or standard output and :py:class:`SQLiteSink` inserts into a
+SQLite database.
+
+A :py:class:`FanOut` encodes each write once and queues it for every sink.  Each sink has its own bounded queue and
+worker thread, so a slow or unavailable sink neither delays the others nor the collectors.  A write which finds a
+sink's queue full is dropped for that sink rather than waiting for it.  A write which a sink fails is retried from the
+sink's own thread with exponential backoff, like a :py:class:`~den.batch.BatchWriter` write, and logged and dropped
+once the retries run out or at once if the sink rejects it.  Since a :py:class:`FanOut` only queues each write, it
+never reports a failed write to its caller and can not be drained from a :py:class:`~den.spool.Spool`.
+
+"""
+
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    from queue import Full, Queue
+except ImportError:
+    from Queue import Full, Queue
+
+from . import LOG
+from . import metrics
+from .batch import RETRIES, RETRY_INTERVAL, is_rejected, now, stamp
+from .lineprotocol import Encoder, PointBatch
+
+QUEUE_SIZE = 1000
+"""Default maximum number of writes waiting for each sink."""
+
+_MEASUREMENT = re.compile(br"^(?:[^ ,\\]|\\.)+")
+"""The escaped measurement at the start of a line of line protocol."""
+
+
+class FileSink(object):
+    """Append line protocol to a file.
+
+    :param str path: The file path, or ``-`` for standard output.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = getattr(sys.stdout, "buffer", sys.stdout) if path == "-" else open(path, "ab")
+
+    def write(self, data, time_precision=None):  # pylint: disable=unused-argument
+        """Append ``data`` and flush it.
+
+        :param bytes data: Line protocol.
+        :param str time_precision: (optional) Ignored, timestamps are written as they are.
+        :rtype: :py:const:`bool`
+
+        """
+        self._file.write(data)
+        self._file.flush()
+        return True
+
+    def close(self):
+        """Close the file, unless it is standard output."""
+        if self.path != "-":
+            self._file.close()
+
+
+class SQLiteSink(object):
+    """Insert line protocol into a ``points`` table of a SQLite database.
+
+    Each line is a row of its measurement, its timestamp and the precision of the timestamp, and the line itself.
+
+    :param str path: The database path.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS points "
+                                 "(measurement TEXT NOT NULL, time INTEGER, precision TEXT, line TEXT NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS points_time ON points (measurement, time)")
+        self._connection.commit()
+
+    def write(self, data, time_precision=None):
+        """Insert the lines of ``data`` in one transaction.
+
+        :param bytes data: Line protocol.
+        :param str time_precision: (optional) The precision of the timestamps in ``data``.
+        :rtype: :py:const:`bool`
+
+        """
+        rows = []
+        for line in data.split(b"\n"):
+            if not line:
+                continue
+            match = _MEASUREMENT.match(line)
+            timestamp = line.rsplit(b" ", 1)[-1]
+            rows.append((match.group(0).decode("utf-8") if match else "",
+                         int(timestamp) if timestamp.isdigit() else None, time_precision, line.decode("utf-8")))
+        with self._connection:
+            self._connection.executemany("INSERT INTO points VALUES (?, ?, ?, ?)", rows)
+        return True
+
+    def close(self):
+        """Close the database."""
+        self._connection.close()
+
+
+def open_sink(spec):
+    """Open a local sink from its command line ``spec``.
+
+    :param str spec: ``stdout``, ``file:PATH`` or ``sqlite:PATH``.
+    :raises: :exc:`ValueError`: if ``spec`` is not a local sink.
+
+    """
+    kind, _, path = spec.partition(":")
+    if kind == "stdout" and not path:
+        return FileSink("-")
+    if kind == "file" and path:
+        return FileSink(path)
+    if kind == "sqlite" and path:
+        return SQLiteSink(path)
+    raise ValueError("Unknown sink '%s'" % spec)
+
+
+class FanOut(object):
+    """Write points to every one of several sinks from a worker thread per sink.
+
+    A drop in replacement for :py:class:`den.lineprotocol.LineProtocolWriter`.  Points without a ``time`` are stamped
+    with the current time, so every sink gets the same timestamps.
+
+    :param list sinks: The sinks to write to.
+    :param int queue_size: (optional) The maximum number of writes waiting for each sink.
+    :param encoder: (optional) The :py:class:`den.lineprotocol.Encoder` to use.
+    :param int retries: (optional) The number of times a failed write is retried before it is dropped.
+    :param float retry_interval: (optional) The number of seconds before the first retry of a failed write.
+
+    """
+
+    def __init__(self, sinks, queue_size=QUEUE_SIZE, encoder=None, retries=RETRIES, retry_interval=RETRY_INTERVAL):
+        self.sinks = list(sinks)
+        self.encoder = encoder or Encoder()
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self._queues = [Queue(queue_size) for _ in self.sinks]
+        self._threads = []
+        for sink, queue in zip(self.sinks, self._queues):
+            thread = threading.Thread(target=self._run, args=(sink, queue), name="sink-%s" % type(sink).__name__)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_points(self, points, time_precision=None):
+        """Encode ``points`` once and queue them for every sink.
+
+        :param points: A list of points or a :py:class:`den.lineprotocol.PointBatch`.
+        :param str time_precision: (optional) The precision of point timestamps.
+        :rtype: :py:const:`bool`
+
+        """
+        if not points:
+            return True
+        if not isinstance(points, PointBatch):
+            stamp(points, now(time_precision or "n"))
+        return self.write(self.encoder.encode_points(points), time_precision)
+
+    def write(self, data, time_precision=None):
+        """Queue already encoded line protocol ``data`` for every sink.
+
+        :param bytes data:
+        :param str time_precision: (optional) The precision of the timestamps in ``data``.
+        :rtype: :py:const:`bool`
+        :returns: ``True``, whether or not every sink had room for ``data``.
+
+        """
+        if not data:
+            return True
+        for sink, queue in zip(self.sinks, self._queues):
+            try:
+                queue.put_nowait((data, time_precision))
+            except Full:
+                metrics.SINK_DROPS.inc()
+                LOG.warning("Dropped write of %d bytes to the full %s queue", len(data), type(sink).__name__)
+        return True
+
+    def close(self):
+        """Write every queued write, stop the workers and close the sinks."""
+        for queue in self._queues:
+            queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        for sink in self.sinks:
+            close = getattr(sink, "close", None)
+            if close is not None:
+                close()
+
+    def _run(self, sink, queue):
+        """Write the writes queued for ``sink`` until closed."""
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            self._write(sink, *item)
+
+    def _write(self, sink, data, time_precision):
+        """Write ``data`` to ``sink``, retrying failed writes the sink did not reject."""
+        name = type(sink).__name__
+        delay = self.retry_interval
+        for retry in range(self.retries + 1):
+            try:
+                sink.write(data, time_precision)
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                if is_rejected(e) or retry == self.retries:
+                    LOG.exception("Could not write %d bytes to %s, dropped them %s", len(data), name, e)
+                    return
+                LOG.warning("Could not write %d bytes to %s, retrying in %.1f seconds %s", len(data), name, delay, e)
+            time.sleep(delay)
+            delay *= 2
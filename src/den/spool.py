@@ -0,0 +1,352 @@
+"""Spool points to disk so that collectors keep running while InfluxDB is unavailable.
+
+A :py:class:`Spool` appends each write to the newest of a directory of numbered segment files as line protocol and
+returns immediately, whatever the state of the database.  A :py:class:`Drainer` reads the spool from its committed
+offset in large batches, writes them to InfluxDB and commits the offset after each successful write, so a crash
+replays at most one batch.  InfluxDB overwrites a point with the same series and timestamp, so a replayed batch does
+not duplicate data.  Segments are deleted once drained and, when the spool grows beyond ``max_size`` during a long
+outage, the oldest segments are evicted to make room for new data.
+
+"""
+
+from contextlib import contextmanager
+import errno
+import os
+import threading
+
+from . import LOG
+from . import metrics
+from .batch import MAX_LATENCY, is_rejected, now, stamp
+from .lineprotocol import Encoder, PointBatch
+
+SEGMENT_SIZE = 2**24
+"""Default number of bytes after which a new segment is started."""
+
+MAX_SIZE = 2**30
+"""Default maximum number of bytes kept in the spool."""
+
+BATCH_BYTES = 2**22
+"""Default maximum number of bytes drained in one write."""
+
+RETRY_INTERVAL = 1.0
+"""Default number of seconds to wait before retrying a failed write."""
+
+MAX_RETRY_INTERVAL = 60.0
+"""Maximum number of seconds to wait before retrying a failed write."""
+
+SEGMENT_EXTENSION = "lp"
+"""Segment file name extension."""
+
+OFFSET_FILE = "offset"
+"""Name of the file which records the drained position."""
+
+QUARANTINE_FILE = "quarantine" + os.extsep + SEGMENT_EXTENSION
+"""Name of the file which keeps the batches the database rejected."""
+
+
+def _fsync(f):
+    """Flush ``f`` to disk."""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class Spool(object):
+    """An append-only, segmented spool of line protocol.
+
+    Each write is flushed to the operating system before it returns, so it survives the process crashing.  Segments
+    are synced to disk when they are completed.
+
+    :param str directory: The spool directory.  It is created if it does not exist.
+    :param int max_size: (optional) The maximum number of bytes to keep.  The oldest segments are evicted beyond it.
+    :param int segment_size: (optional) The number of bytes after which a new segment is started.
+    :param str time_precision: (optional) The precision of point timestamps.
+    :param encoder: (optional) The :py:class:`den.lineprotocol.Encoder` to use.
+
+    """
+
+    def __init__(self, directory, max_size=MAX_SIZE, segment_size=SEGMENT_SIZE, time_precision="s", encoder=None):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.time_precision = time_precision
+        self.encoder = encoder or Encoder()
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._sizes = self._scan()
+        self.position = self._read_offset()
+        self._segment = max([self.position[0]] + list(self._sizes)) + 1
+        self._sizes[self._segment] = 0
+        self._file = open(self._path(self._segment), "ab")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def size(self):
+        """The number of bytes in the spool, drained or not."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def write_points(self, points, time_precision=None):  # pylint: disable=unused-argument
+        """Append ``points`` to the spool.
+
+        Points without a ``time`` are stamped with the current time so they keep the time they were received.
+
+        :param points: InfluxDB points or a :py:class:`~den.lineprotocol.PointBatch`.
+        :param str time_precision: Ignored, every point is written with this spool's ``time_precision``.
+        :rtype: :py:const:`bool`
+        :return: ``True`` once the points are spooled.
+
+        """
+        if not points:
+            return True
+        if not isinstance(points, PointBatch):
+            stamp(points, now(self.time_precision))
+        data = self.encoder.encode_points(points)
+        if data:
+            self.write(data)
+        return True
+
+    def write(self, data):
+        """Append already encoded line protocol ``data``, which must end with a newline.
+
+        :param bytes data:
+
+        """
+        with self._lock:
+            if self._file is None:
+                raise ValueError("Write to closed Spool")
+            self._file.write(data)
+            self._file.flush()
+            self._sizes[self._segment] += len(data)
+            if self._sizes[self._segment] >= self.segment_size:
+                self._roll()
+            self._evict()
+            metrics.SPOOL_BYTES.set(self._depth())
+
+    def read(self, position, size):
+        """Read complete lines from ``position``.
+
+        :param tuple position: The segment number and byte offset to read from.
+        :param int size: The maximum number of bytes to read, unless a single line is longer.
+        :rtype: :py:class:`tuple`
+        :returns: The lines read and the position after them.
+
+        """
+        segment, offset = position
+        while True:
+            with self._lock:
+                current = self._segment
+                if segment not in self._sizes:
+                    segment, offset = min(s for s in self._sizes if s > segment), 0
+            try:
+                data = self._read(segment, offset, size)
+            except (IOError, OSError) as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                LOG.debug("Segment %d was evicted while being read", segment)
+                continue
+            if data:
+                return data, (segment, offset + len(data))
+            if segment == current:
+                return b"", (segment, offset)
+            segment, offset = segment + 1, 0
+
+    def commit(self, position):
+        """Record that everything before ``position`` has been drained and delete drained segments.
+
+        The offset is written to a temporary file which replaces the last one, so a crash never leaves a partial
+        offset behind.
+
+        :param tuple position: The segment number and byte offset drained up to.
+
+        """
+        path = os.path.join(self.directory, OFFSET_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("%d %d\n" % position)
+            _fsync(f)
+        os.rename(tmp_path, path)
+        with self._lock:
+            self.position = position
+            for segment in [s for s in self._sizes if s < position[0]]:
+                self._remove(segment)
+            metrics.SPOOL_BYTES.set(self._depth())
+
+    def close(self):
+        """Sync and close the current segment."""
+        with self._lock:
+            if self._file is not None:
+                _fsync(self._file)
+                self._file.close()
+                self._file = None
+
+    def _depth(self):
+        """Get the number of bytes which have not been drained."""
+        segment, offset = self.position
+        depth = sum(size for s, size in self._sizes.items() if s >= segment)
+        return depth - offset if segment in self._sizes else depth
+
+    def _path(self, segment):
+        """Get the path of ``segment``."""
+        return os.path.join(self.directory, "%010d%s%s" % (segment, os.extsep, SEGMENT_EXTENSION))
+
+    def _scan(self):
+        """Get the size of each existing segment."""
+        sizes = {}
+        for name in os.listdir(self.directory):
+            base, ext = os.path.splitext(name)
+            if ext == os.extsep + SEGMENT_EXTENSION and base.isdigit():
+                sizes[int(base)] = os.path.getsize(os.path.join(self.directory, name))
+        return sizes
+
+    def _read_offset(self):
+        """Read the committed position or the start of the oldest segment."""
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                segment, offset = f.read().split()
+            return int(segment), int(offset)
+        except (IOError, OSError, ValueError) as e:
+            if getattr(e, "errno", None) != errno.ENOENT:
+                LOG.warning("Could not read spool offset %s", e)
+            return min(self._sizes) if self._sizes else 0, 0
+
+    def _read(self, segment, offset, size):
+        """Read complete lines of ``segment`` from ``offset``."""
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            data = chunk = f.read(size)
+            end = data.rfind(b"\n") + 1
+            while not end and len(chunk) == size:
+                chunk = f.read(size)
+                data += chunk
+                end = data.rfind(b"\n") + 1
+        return data[:end]
+
+    def _roll(self):
+        """Complete the current segment and start the next."""
+        _fsync(self._file)
+        self._file.close()
+        self._segment += 1
+        self._sizes[self._segment] = 0
+        self._file = open(self._path(self._segment), "ab")
+
+    def _evict(self):
+        """Remove the oldest completed segments while the spool is larger than ``max_size``."""
+        while sum(self._sizes.values()) > self.max_size and len(self._sizes) > 1:
+            segment = min(self._sizes)
+            LOG.warning("Spool is full, evicting %d bytes of segment %d", self._sizes[segment], segment)
+            self.evicted += self._sizes[segment]
+            self._remove(segment)
+
+    def _remove(self, segment):
+        """Delete ``segment``."""
+        del self._sizes[segment]
+        try:
+            os.remove(self._path(segment))
+        except OSError as e:
+            LOG.warning("Could not remove spool segment %d %s", segment, e)
+
+
+class Drainer(object):
+    """Write the contents of a :py:class:`Spool` to InfluxDB from a background thread.
+
+    Failed writes are retried, with exponential backoff, from the last committed position.  A batch the database
+    rejects with a client error, such as a line it cannot parse or a field type conflict, would fail forever and block
+    everything spooled after it, so it is appended to the :py:data:`QUARANTINE_FILE` of the spool directory and
+    skipped instead.
+
+    :param spool: The :py:class:`Spool` to drain.
+    :param db: Anything with a :py:meth:`den.lineprotocol.LineProtocolWriter.write` compatible method.
+    :param int batch_bytes: (optional) The maximum number of bytes to write at once.
+    :param float max_latency: (optional) The number of seconds to wait for more data once the spool is drained.
+    :param float retry_interval: (optional) The number of seconds to wait before the first retry of a failed write.
+
+    """
+
+    def __init__(self, spool, db, batch_bytes=BATCH_BYTES, max_latency=MAX_LATENCY, retry_interval=RETRY_INTERVAL):
+        self.spool = spool
+        self.db = db
+        self.batch_bytes = batch_bytes
+        self.max_latency = max_latency
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="den-spool-drainer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def drain(self):
+        """Write the next batch of spooled data.
+
+        :rtype: :py:class:`int`
+        :returns: The number of bytes written, ``0`` once the spool is drained.
+        :raises: :exc:`Exception`: if the write fails and should be retried.
+
+        """
+        data, position = self.spool.read(self.spool.position, self.batch_bytes)
+        if data:
+            try:
+                self.db.write(data, self.spool.time_precision)
+            except Exception as e:  # pylint: disable=broad-except
+                if not is_rejected(e):
+                    raise
+                self._quarantine(data, e)
+            else:
+                LOG.debug("Drained %d bytes of spool", len(data))
+        if position != self.spool.position:
+            self.spool.commit(position)
+        return len(data)
+
+    def _quarantine(self, data, error):
+        """Keep the rejected batch ``data`` in the quarantine file."""
+        path = os.path.join(self.spool.directory, QUARANTINE_FILE)
+        LOG.error("Database rejected %d bytes of spool, moved them to %s %s", len(data), path, error)
+        with open(path, "ab") as f:
+            f.write(data)
+            _fsync(f)
+
+    def close(self):
+        """Stop draining, leaving undrained data in the spool."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        """Drain until closed."""
+        delay = self.retry_interval
+        while not self._stop.is_set():
+            try:
+                written = self.drain()
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.exception("Could not drain spool, retrying in %.0f seconds %s", delay, e)
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_INTERVAL)
+                continue
+            delay = self.retry_interval
+            if not written:
+                self._stop.wait(self.max_latency)
+
+
+@contextmanager
+def spooled(db, directory, max_size=MAX_SIZE, time_precision="s"):
+    """Get a :py:class:`Spool` of ``directory`` which is drained to ``db`` until the context exits.
+
+    :param db: Anything with a :py:meth:`den.lineprotocol.LineProtocolWriter.write` compatible method.
+    :param str directory: The spool directory.
+    :param int max_size: (optional) The maximum number of bytes to keep.
+    :param str time_precision: (optional) The precision of point timestamps.
+
+    """
+    with Spool(directory, max_size, time_precision=time_precision) as spool:
+        with Drainer(spool, db):
+            yield spool
@@ -0,0 +1,129 @@
+"""Parse `server-sent events <https://html.spec.whatwg.org/multipage/server-sent-events.html>`_.
+
+The Nest streaming API sends its data as a server-sent event stream::
+
+    event: put
+    data: {"path": "/", "data": {...}}
+
+A :py:class:`Parser` is fed the raw bytes of the stream as they arrive, in chunks of any size, and returns each
+complete :py:class:`Event`.  Lines are located in the received bytes rather than copied out of them and ``data``
+values are kept as :py:class:`memoryview` slices until their event is dispatched, so each payload is copied once.
+
+"""
+
+from collections import namedtuple
+
+Event = namedtuple("Event", ["event", "data"])
+"""A server-sent event.
+
+``event`` is the event type, ``message`` when the stream does not name one, and ``data`` is the event's ``data`` lines
+joined by newlines, as :py:class:`bytes`.
+
+"""
+
+DEFAULT_EVENT = "message"
+"""The type of events which do not name one."""
+
+
+class Parser(object):
+    """An incremental server-sent event stream parser.
+
+    Besides the blank line which ends every event, an ``event`` line which follows ``data`` lines also ends the event
+    before it.  Streams recorded without blank lines, like the ``tests/responses.txt`` fixture, parse the same as
+    live ones.
+
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._event = None
+        self._data = []
+
+    def feed(self, chunk):
+        """Parse the next ``chunk`` of the stream.
+
+        Partial lines are kept until the chunk which completes them arrives, so a long line split across many
+        chunks is joined once.
+
+        :param bytes chunk:
+        :rtype: :py:class:`list`
+        :returns: The :py:class:`Event` objects completed by ``chunk``.
+
+        """
+        end = chunk.find(b"\n")
+        if end < 0:
+            if chunk:
+                self._pending.append(chunk)
+            return []
+        if self._pending:
+            end += sum(len(c) for c in self._pending)
+            self._pending.append(chunk)
+            buf = b"".join(self._pending)
+        else:
+            buf = chunk
+        events = []
+        view = memoryview(buf)
+        start = 0
+        while end >= 0:
+            line_end = end - 1 if end > start and buf[end - 1:end] == b"\r" else end
+            event = self._parse_line(buf, view, start, line_end)
+            if event is not None:
+                events.append(event)
+            start = end + 1
+            end = buf.find(b"\n", start)
+        self._pending = [buf[start:]] if start < len(buf) else []
+        return events
+
+    def feed_line(self, line):
+        """Parse one ``line`` of the stream, without its line terminator.
+
+        :param bytes line:
+        :rtype: :py:class:`Event`
+        :returns: The event completed by ``line`` or ``None``.
+
+        """
+        return self._parse_line(line, memoryview(line), 0, len(line))
+
+    def close(self):
+        """End the stream.
+
+        :rtype: :py:class:`list`
+        :returns: The last :py:class:`Event` if the stream ended without a final blank line.
+
+        """
+        events = self.feed(b"\n") if self._pending else []
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _parse_line(self, buf, view, start, end):
+        """Parse the line ``buf[start:end]``."""
+        if start == end:
+            return self._dispatch()
+        colon = buf.find(b":", start, end)
+        if colon == start:
+            return None
+        if colon < 0:
+            colon = value = end
+        else:
+            value = colon + 2 if buf.startswith(b" ", colon + 1, end) else colon + 1
+        length = colon - start
+        if length == 4 and buf.startswith(b"data", start):
+            self._data.append(view[value:end])
+        elif length == 5 and buf.startswith(b"event", start):
+            event = self._dispatch()
+            self._event = buf[value:end].decode("utf-8")
+            return event
+        return None
+
+    def _dispatch(self):
+        """Get the buffered event and reset the buffer."""
+        if not self._data:
+            self._event = None
+            return None
+        data = b"\n".join(v.tobytes() for v in self._data) if len(self._data) > 1 else self._data[0].tobytes()
+        event = Event(self._event or DEFAULT_EVENT, data)
+        self._event = None
+        self._data = []
+        return event
@@ -11,12 +11,26 @@ except ImportError:
     from urllib import urlencode
     from urlparse import SplitResult, urlunsplit
 
-import json
+import hashlib
+import re
 
 from influxdb import client as influxdb
 import requests
 
 from . import LOG
+from . import SampledLogger
+from . import jsonbackend
+from . import metrics
+from .archive import SEGMENT_INTERVAL, StreamRecorder
+from .batch import BATCH_SIZE, MAX_LATENCY, BatchWriter
+from .delta import KEYFRAME_INTERVAL, DeltaFilter
+from .lineprotocol import GZIP_THRESHOLD, LineProtocolWriter
+from .schema import Schema
+from .spool import MAX_SIZE, spooled
+from .sse import Parser
+
+PAYLOAD_LOG = SampledLogger(LOG)
+"""Logs a sample of the stream's payloads and points."""
 
 STRUCTURE_MEASUREMENT = "structure"
 """InfluxDB measurement name."""
@@ -55,12 +69,69 @@ THERMOSTAT_FIELD_KEYS = [
 ]
 """InfluxDB field keys."""
 
+DELTA_SERIES_KEYS = {
+    STRUCTURE_MEASUREMENT: ("structure_id", "thermostat_id"),
+    THERMOSTAT_MEASUREMENT: ("device_id", ),
+}
+"""Tag keys which identify a structure or thermostat series when only changed points are written."""
+
+ROLLUP_TAG_KEYS = ("account", "device_id", "name", "structure_id")
+"""Tag keys which identify a thermostat series when it is rolled up."""
+
+
+def _is_away(away):
+    """Get the ``is_away`` field value of a structure ``away`` value."""
+    return 1 if "away" in away else 0
+
+
+STRUCTURE_SCHEMA = Schema(
+    STRUCTURE_MEASUREMENT,
+    STRUCTURE_TAG_KEYS,
+    STRUCTURE_FIELD_KEYS,
+    renames={"away": "is_away"},
+    converters={"away": _is_away},
+    report_unknown=False)
+"""Projection of structure data onto structure points."""
+
+THERMOSTAT_SCHEMA = Schema(THERMOSTAT_MEASUREMENT, THERMOSTAT_TAG_KEYS, THERMOSTAT_FIELD_KEYS, report_unknown=False)
+"""Projection of thermostat data onto thermostat points."""
+
 NEST_API_PROTOCOL = "https"
 NEST_API_LOCATION = "developer-api.nest.com"
 """The base location of the Nest API."""
 
-STREAM_DELIMITER = ":"
-"""The token which separates line type and line data in the Nest streaming API response."""
+ACCOUNT_TAG = "account"
+"""InfluxDB tag key of the account a point was streamed from, when streaming several accounts."""
+
+STREAM_CHUNK_SIZE = 512
+"""The number of bytes to read from the Nest streaming API response at a time."""
+
+
+class AuthRevokedError(Exception):
+    """The Nest API access token has been revoked and the stream closed."""
+
+
+def parse_accounts(text):
+    """Parse a list of Nest API access tokens.
+
+    Entries are separated by commas or new lines and are either ``account=token`` or a bare token, which is named
+    after a short hash of itself so that the token does not end up in the database.  Blank entries and lines starting
+    with ``#`` are ignored.
+
+    :param str text:
+    :rtype: :py:class:`list`
+    :returns: ``(account, token)`` tuples.
+
+    """
+    accounts = []
+    for entry in re.split(r"[,\n]", text):
+        entry = entry.strip()
+        if not entry or entry.startswith("#"):
+            continue
+        account, _, token = entry.partition("=") if "=" in entry else ("", "", entry)
+        account = account.strip() or hashlib.sha256(token.strip().encode("utf-8")).hexdigest()[:8]
+        accounts.append((account, token.strip()))
+    return accounts
 
 
 def _get_api_url(nest_api_access_token, path=""):
@@ -71,10 +142,21 @@ def _get_api_url(nest_api_access_token, path=""):
     return urlunsplit(split)
 
 
-def _get_stream(nest_api_access_token, path=""):
+def get_session():
+    """Get a session which keeps connections to the Nest API open from one stream to the next.
+
+    :rtype: :py:class:`requests.Session`
+
+    """
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=1))
+    return session
+
+
+def _get_stream(nest_api_access_token, path="", session=None):
     """Make a GET request to the Nest REST stream API and return the response object."""
     url = _get_api_url(nest_api_access_token, path)
-    r = requests.get(url, headers={"Accept": "text/event-stream"}, stream=True, timeout=TIMEOUT)
+    r = (session or requests).get(url, headers={"Accept": "text/event-stream"}, stream=True, timeout=TIMEOUT)
     for h in r.history:
         LOG.debug("[%d] Redirect: %s", h.status_code, h.url)
     LOG.debug("[%d] URL: %s", r.status_code, r.url)
@@ -82,115 +164,290 @@ def _get_stream(nest_api_access_token, path=""):
     return r
 
 
-def _is_event(line):
-    """Determine if ``line`` represents an event."""
-    return line.startswith("event" + STREAM_DELIMITER)
+def _decode(data):
+    """Decode the JSON ``data`` of a stream event."""
+    try:
+        with metrics.DECODE_SECONDS.time():
+            return jsonbackend.loads(data)
+    except ValueError as e:
+        LOG.error("Error processing data: '%s', '%s'", data, e)
+        return None
+
+
+def _update(state, value, patch=False):
+    """Put or patch the ``data`` of the event ``value`` at its ``path`` in the ``state`` tree."""
+    keys = ["data"] + [k for k in value["path"].split("/") if k]
+    node = state
+    for k in keys[:-1]:
+        child = node.get(k)
+        if not isinstance(child, dict):
+            child = node[k] = {}
+        node = child
+    if patch and isinstance(node.get(keys[-1]), dict) and isinstance(value["data"], dict):
+        node[keys[-1]].update(value["data"])
+    else:
+        node[keys[-1]] = value["data"]
+
+
+def _on_put(state, event):
+    """Replace the data at the event path."""
+    value = _decode(event.data)
+    if value:
+        _update(state, value)
+        return state
+    return None
+
+
+def _on_patch(state, event):
+    """Update the data at the event path."""
+    value = _decode(event.data)
+    if value:
+        _update(state, value, patch=True)
+        return state
+    return None
+
+
+def _on_keep_alive(state, event):  # pylint: disable=unused-argument
+    """Count a keep-alive."""
+    metrics.KEEP_ALIVES.inc()
+    return None
 
 
-def _is_data(line):
-    """Determine if ``line`` represents data."""
-    return line.startswith("data" + STREAM_DELIMITER)
+def _on_auth_revoked(state, event):  # pylint: disable=unused-argument
+    """Stop streaming with a revoked access token."""
+    raise AuthRevokedError(event.data.decode("utf-8"))
 
 
-def _process_event(line):
-    """Process the given event line."""
-    event = None
-    if STREAM_DELIMITER in line:
-        _, event = line.split(STREAM_DELIMITER, 1)
-        event = event.strip()
-        if event:
-            LOG.debug(event)
-            if event == "keep-alive":
-                event = None
-        else:
-            event = None
-    return event
+def _on_error(state, event):  # pylint: disable=unused-argument
+    """Log an error sent by the Nest API."""
+    LOG.error("Stream error: %s", event.data.decode("utf-8"))
 
 
-def _process_data(line):
-    """Process the given data line."""
-    data = None
-    if STREAM_DELIMITER in line:
-        _, data_str = line.split(STREAM_DELIMITER, 1)
-        data_str = data_str.strip()
-        if data_str:
-            try:
-                data = json.loads(data_str)
-            except ValueError as e:
-                LOG.error("Error processing data line: '%s', '%s'", line, e)
-                data = None
-    return data
+EVENT_HANDLERS = {
+    "put": _on_put,
+    "patch": _on_patch,
+    "keep-alive": _on_keep_alive,
+    "auth_revoked": _on_auth_revoked,
+    "error": _on_error
+}
+"""Nest streaming API event handlers by event type.
 
+Each handler is called with the current data tree and the :py:class:`den.sse.Event`.  Handlers which change the tree
+return it so that its points are written.
+
+"""
+
+
+def _iter_events(stream, recorder=None):
+    """Parse the events of a Nest API ``stream`` response as they arrive.
+
+    :param stream: A :py:class:`requests.Response` opened by :py:func:`_get_stream`.
+    :param recorder: (optional) A :py:class:`den.archive.StreamRecorder` to record the raw stream with.
+    :rtype: :py:class:`collections.Iterator`
+
+    """
+    parser = Parser()
+    if recorder is not None:
+        recorder.new_stream()
+    for chunk in stream.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        if recorder is not None:
+            recorder.write(chunk)
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+def _handle(state, event):
+    """Dispatch ``event`` to its handler.
+
+    :param dict state: The data tree built from the events handled so far.
+    :param event: A :py:class:`den.sse.Event`.
+    :rtype: :py:class:`dict`
+    :returns: The data tree if ``event`` changed it or ``None``.
+
+    """
+    LOG.debug(event.event)
+    metrics.EVENTS.inc()
+    handler = EVENT_HANDLERS.get(event.event)
+    if handler is None:
+        LOG.warning("Unknown event: '%s'", event.event)
+        return None
+    return handler(state, event)
 
-def _process(line):
-    """Process the given line."""
-    if _is_event(line):
-        _process_event(line)
-    return _process_data(line) if _is_data(line) else None
 
+def _get_structure_points(data, tags=None, batch=None):
+    """Get structure points to write to InfluxDB, with optional extra ``tags``.
 
-def _get_structure_points(data):
-    """Get structure points to write to InfluxDB."""
+    The points are appended to ``batch`` and it is returned instead when a :py:class:`~den.lineprotocol.PointBatch`
+    is given.
+
+    """
     points = []
-    for structure_data in data["data"]["structures"].values():
+    for structure_data in data["data"].get("structures", {}).values():
         for thermostat_id in structure_data["thermostats"]:
-            point = {"measurement": STRUCTURE_MEASUREMENT, "tags": {"thermostat_id": thermostat_id}, "fields": {}}
-            for k, v in structure_data.items():
-                if k in STRUCTURE_TAG_KEYS:
-                    point["tags"][k] = v
-                if k in STRUCTURE_FIELD_KEYS:
-                    if k == "away":
-                        point["fields"]["is_away"] = 1 if "away" in v else 0
-                    else:
-                        point["fields"][k] = v
-            points.append(point)
-    return points
-
-
-def _get_thermostat_points(value):
-    """Get thermostat points to write to InfluxDB."""
-    points = []
-    for thermostat_data in value["data"]["devices"]["thermostats"].values():
-        point = {"measurement": THERMOSTAT_MEASUREMENT, "tags": {}, "fields": {}}
-        for k, v in thermostat_data.items():
-            if k in THERMOSTAT_TAG_KEYS:
-                point["tags"][k] = v
-            elif k in THERMOSTAT_FIELD_KEYS:
-                point["fields"][k] = float(v)
-        points.append(point)
-    return points
-
-
-def record(database, port, ssl, nest_api_access_token):
-    """Stream results from the Nest API and record them in the database.
+            point_tags = dict(tags or {}, thermostat_id=thermostat_id)
+            if batch is None:
+                points.append(STRUCTURE_SCHEMA.project(structure_data, point_tags))
+            else:
+                STRUCTURE_SCHEMA.append(batch, structure_data, point_tags)
+    return points if batch is None else batch
 
-    :param str database: The name of the database.
-    :param int port: The port number the database is listening on.
-    :param bool ssl: Whether or not to use SSL to communicate with the database.
+
+def _get_thermostat_points(value, tags=None, batch=None):
+    """Get thermostat points to write to InfluxDB, with optional extra ``tags``.
+
+    The points are appended to ``batch`` and it is returned instead when a :py:class:`~den.lineprotocol.PointBatch`
+    is given.
+
+    """
+    thermostats = value["data"].get("devices", {}).get("thermostats", {})
+    if batch is None:
+        return [THERMOSTAT_SCHEMA.project(d, tags) for d in thermostats.values()]
+    for d in thermostats.values():
+        THERMOSTAT_SCHEMA.append(batch, d, tags)
+    return batch
+
+
+def collect(writer, nest_api_access_token, delta_filter=None, recorder=None, account=None, session=None):
+    """Stream results from the Nest API and write them with ``writer``.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method, usually a
+                   :py:class:`den.batch.BatchWriter`.
     :param str nest_api_access_token: Nest API access token.
+    :param delta_filter: (optional) A :py:class:`den.delta.DeltaFilter` to drop unchanged points with.
+    :param recorder: (optional) A :py:class:`den.archive.StreamRecorder` to record the raw stream with.
+    :param str account: (optional) The account name to tag every point with.
+    :param session: (optional) The :py:class:`requests.Session` to open the stream with.
     :rtype: :py:const:`None`
     :return: When the stream opened to the Nest API has been consumed.
     :raises: :exc:`requests.exceptions.StreamConsumedError`: if the stream has been consumed.
     :raises: :exc:`requests.exceptions.ConnectionError`: if the Nest API cannot be reached.
     :raises: :exc:`requests.exceptions.HTTPError`: if an invalid response is returned from the Nest API.
     :raises: :exc:`requests.exceptions.Timeout`: if the request to the Nest API takes too long to respond.
+    :raises: :exc:`AuthRevokedError`: if the Nest API access token is revoked.
 
     """
-    db = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
-    with closing(_get_stream(nest_api_access_token)) as stream:
+    tags = {ACCOUNT_TAG: account} if account else None
+    with closing(_get_stream(nest_api_access_token, session=session)) as stream:
         LOG.info("[%d] Streaming %s", stream.status_code, stream.url)
-        for l in stream.iter_lines():
-            if l:
-                value = _process(l.decode("utf-8"))
-                if value:
-                    LOG.debug(value)
+        LOG.info("Decoding with JSON backend %s", jsonbackend.NAME)
+        state = {}
+        for event in _iter_events(stream, recorder):
+            value = _handle(state, event)
+            if value:
+                with metrics.POINT_BUILD_SECONDS.time():
+                    points = _get_structure_points(value, tags) + _get_thermostat_points(value, tags)
+                if delta_filter:
+                    points = delta_filter.filter(points)
+                PAYLOAD_LOG.debug("%s %s", value, points)
+                writer.write_points(points, time_precision="s")
 
-                    structure_points = _get_structure_points(value)
-                    LOG.debug(structure_points)
-                    db.write_points(structure_points, time_precision="s")
+        LOG.info("[%d] Streaming complete %s", stream.status_code, stream.url)
 
-                    thermostat_points = _get_thermostat_points(value)
-                    LOG.debug(thermostat_points)
-                    db.write_points(thermostat_points, time_precision="s")
 
-        LOG.info("[%d] Streaming complete %s", stream.status_code, stream.url)
+class Collector(object):
+    """Stream one account's thermostat data again and again over long-lived connections.
+
+    A collector outlives the streams it opens.  Its session keeps connections to the Nest API open between streams,
+    so reconnecting after a stream drops does not start from a new connection to every host on the way, and it writes
+    to one ``writer`` whose database connection is kept open too.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param str nest_api_access_token: Nest API access token.
+    :param delta_filter: (optional) A :py:class:`den.delta.DeltaFilter` to drop unchanged points with.
+    :param recorder: (optional) A :py:class:`den.archive.StreamRecorder` to record the raw stream with.
+    :param str account: (optional) The account name to tag every point with.
+    :param session: (optional) The :py:class:`requests.Session` to stream with, by default one from
+                    :py:func:`get_session` which is closed with the collector.
+
+    """
+
+    def __init__(self, writer, nest_api_access_token, delta_filter=None, recorder=None, account=None, session=None):
+        self.writer = writer
+        self.nest_api_access_token = nest_api_access_token
+        self.delta_filter = delta_filter
+        self.recorder = recorder
+        self.account = account
+        self._owns_session = session is None
+        self.session = get_session() if session is None else session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def collect(self):
+        """Stream until the stream ends, as :py:func:`collect` does."""
+        collect(self.writer, self.nest_api_access_token, self.delta_filter, self.recorder, self.account,
+                session=self.session)
+
+    def close(self):
+        """Close the session, if the collector opened it."""
+        if self._owns_session:
+            self.session.close()
+
+
+def record(database,
+           port,
+           ssl,
+           nest_api_access_token,
+           batch_size=BATCH_SIZE,
+           max_latency=MAX_LATENCY,
+           delta=False,
+           keyframe_interval=KEYFRAME_INTERVAL,
+           spool_dir=None,
+           spool_max_size=MAX_SIZE,
+           record_to=None,
+           record_interval=SEGMENT_INTERVAL,
+           record_compression=None,
+           gzip_level=None,
+           gzip_threshold=GZIP_THRESHOLD):
+    """Stream results from the Nest API and record them in the database.
+
+    Points are written in batches from a background thread so that a slow database does not stall the stream.  When
+    ``delta`` is set only structures and thermostats whose values have changed are written, along with a keyframe of
+    each at least every ``keyframe_interval`` seconds.  When ``spool_dir`` is set points are spooled to disk first and
+    drained to the database, so the stream keeps running while the database is unavailable.  When ``record_to`` is
+    set the raw stream is also archived there.
+
+    :param str database: The name of the database.
+    :param int port: The port number the database is listening on.
+    :param bool ssl: Whether or not to use SSL to communicate with the database.
+    :param str nest_api_access_token: Nest API access token.
+    :param int batch_size: (optional) The number of pending points which triggers a database write.
+    :param float max_latency: (optional) The maximum number of seconds a point may wait before it is written.
+    :param bool delta: (optional) Whether or not to write only changed points.
+    :param float keyframe_interval: (optional) The maximum number of seconds between writes of an unchanged point.
+    :param str spool_dir: (optional) The directory to spool points to.
+    :param int spool_max_size: (optional) The maximum number of bytes to spool.
+    :param str record_to: (optional) The directory to archive the raw stream to.
+    :param float record_interval: (optional) The number of seconds between archive segments.
+    :param str record_compression: (optional) The archive compression, by default the best one installed.
+    :param int gzip_level: (optional) The gzip compression level of database writes, by default they are not
+                           compressed.
+    :param int gzip_threshold: (optional) The minimum number of bytes in a compressed database write.
+    :rtype: :py:const:`None`
+    :return: When the stream opened to the Nest API has been consumed.
+    :raises: :exc:`requests.exceptions.StreamConsumedError`: if the stream has been consumed.
+    :raises: :exc:`requests.exceptions.ConnectionError`: if the Nest API cannot be reached.
+    :raises: :exc:`requests.exceptions.HTTPError`: if an invalid response is returned from the Nest API.
+    :raises: :exc:`requests.exceptions.Timeout`: if the request to the Nest API takes too long to respond.
+    :raises: :exc:`AuthRevokedError`: if the Nest API access token is revoked.
+
+    """
+    client = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
+    db = LineProtocolWriter(client, database, gzip_level=gzip_level, gzip_threshold=gzip_threshold)
+    delta_filter = DeltaFilter(DELTA_SERIES_KEYS, keyframe_interval) if delta else None
+    if spool_dir:
+        writer = spooled(db, spool_dir, spool_max_size)
+    else:
+        writer = BatchWriter(db, batch_size, max_latency)
+    recorder = StreamRecorder(record_to, record_interval, record_compression) if record_to else None
+    try:
+        with writer as w, Collector(w, nest_api_access_token, delta_filter, recorder) as collector:
+            collector.collect()
+    finally:
+        if recorder is not None:
+            recorder.close()
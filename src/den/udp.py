@@ -0,0 +1,154 @@
+"""Write points to the InfluxDB UDP listener.
+
+A :py:class:`UDPWriter` sends line protocol as UDP datagrams and returns as soon as they are handed to the kernel.
+There is no response, so a write never waits on the database, but nothing tells den whether a point arrived either:
+a packet lost on the network, or sent while InfluxDB is down, is gone.  Lines are packed into as few packets as fit in
+the MTU so that no packet is fragmented.
+
+The UDP listener has no per write timestamp precision.  It reads every timestamp at the ``precision`` it is configured
+with, nanoseconds by default, so timestamps written at another precision are scaled to it before they are sent.
+
+"""
+
+import errno
+import socket
+
+from . import LOG
+from . import metrics
+from .batch import now, stamp
+from .lineprotocol import Encoder, PointBatch
+
+PORT = 8089
+"""The default port of the InfluxDB UDP listener."""
+
+MTU = 1500
+"""Default maximum number of bytes in an IP packet."""
+
+PRECISION = "n"
+"""The default timestamp precision of the InfluxDB UDP listener."""
+
+_HEADER_SIZE = 28
+"""The number of bytes of IPv4 and UDP headers in each packet."""
+
+_NANOSECONDS = {"n": 1, "u": 10**3, "ms": 10**6, "s": 10**9, "m": 60 * 10**9, "h": 3600 * 10**9}
+"""The number of nanoseconds in each timestamp precision."""
+
+
+def pack(lines, size):
+    """Pack ``lines`` into packets of at most ``size`` bytes.
+
+    A line longer than ``size`` is sent in a packet of its own.
+
+    :param list lines: Lines of line protocol without their newlines.
+    :param int size: The maximum number of bytes in a packet.
+    :rtype: :py:class:`list`
+    :returns: The packets, each a :py:class:`bytes` of newline terminated lines.
+
+    """
+    packets = []
+    packet = []
+    packet_size = 0
+    for line in lines:
+        if packet and packet_size + len(line) + 1 > size:
+            packets.append(b"\n".join(packet) + b"\n")
+            packet = []
+            packet_size = 0
+        packet.append(line)
+        packet_size += len(line) + 1
+    if packet:
+        packets.append(b"\n".join(packet) + b"\n")
+    return packets
+
+
+def _rescale(lines, numerator, denominator):
+    """Multiply the timestamp of each of ``lines`` by ``numerator`` and divide it by ``denominator``."""
+    rescaled = []
+    for line in lines:
+        rest, timestamp = line.rsplit(b" ", 1)
+        rescaled.append(rest + b" " + str(int(timestamp) * numerator // denominator).encode("ascii"))
+    return rescaled
+
+
+class UDPWriter(object):
+    """Send points to the InfluxDB UDP listener without waiting for them to be written.
+
+    A drop in replacement for :py:class:`den.lineprotocol.LineProtocolWriter`.  Send errors are logged and the points
+    dropped rather than raised.  The number of packets sent is counted in :py:attr:`packets` and the
+    ``den_udp_packets_total`` metric.
+
+    :param str host: (optional) The InfluxDB host.
+    :param int port: (optional) The port of the InfluxDB UDP listener.
+    :param int mtu: (optional) The maximum number of bytes in an IP packet on the way to the host.
+    :param str precision: (optional) The timestamp precision the UDP listener is configured with.
+    :param encoder: (optional) The :py:class:`den.lineprotocol.Encoder` to use.
+
+    """
+
+    def __init__(self, host="localhost", port=PORT, mtu=MTU, precision=PRECISION, encoder=None):
+        self.host = host
+        self.port = port
+        self.packet_size = mtu - _HEADER_SIZE
+        self.precision = precision
+        self.encoder = encoder or Encoder()
+        self.packets = 0
+        family, kind, proto, _, address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+        self._socket = socket.socket(family, kind, proto)
+        self._socket.setblocking(False)
+        self._socket.connect(address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the socket."""
+        LOG.debug("Sent %d packets to %s:%d", self.packets, self.host, self.port)
+        self._socket.close()
+
+    def write_points(self, points, time_precision=None):
+        """Encode and send ``points``.
+
+        Points without a ``time`` are stamped with the current time, since the listener would otherwise stamp them
+        with the time they arrive.
+
+        :param points: A list of points or a :py:class:`den.lineprotocol.PointBatch`.
+        :param str time_precision: (optional) The precision of point timestamps, by default nanoseconds.
+        :rtype: :py:const:`bool`
+
+        """
+        if not points:
+            return True
+        if not isinstance(points, PointBatch):
+            stamp(points, now(time_precision or "n"))
+        return self.write(self.encoder.encode_points(points), time_precision)
+
+    def write(self, data, time_precision=None):
+        """Send already encoded line protocol ``data``, every line of which must have a timestamp.
+
+        :param bytes data:
+        :param str time_precision: (optional) The precision of the timestamps in ``data``, by default nanoseconds.
+        :rtype: :py:const:`bool`
+        :returns: ``True``, whether or not every packet was sent.
+
+        """
+        lines = [l for l in data.split(b"\n") if l]
+        if not lines:
+            return True
+        numerator = _NANOSECONDS[time_precision or "n"]
+        denominator = _NANOSECONDS[self.precision]
+        if numerator != denominator:
+            lines = _rescale(lines, numerator, denominator)
+        for packet in pack(lines, self.packet_size):
+            try:
+                self._socket.send(packet)
+            except (IOError, OSError) as e:
+                metrics.WRITE_ERRORS.inc()
+                log = LOG.debug if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED) else LOG.warning
+                log("Dropped packet to %s:%d %s", self.host, self.port, e)
+                continue
+            self.packets += 1
+            metrics.UDP_PACKETS.inc()
+            metrics.WRITE_BYTES.inc(len(packet))
+        return True
@@ -4,6 +4,8 @@ from influxdb import client as influxdb
 import forecastio
 
 from . import LOG
+from .lineprotocol import GZIP_THRESHOLD, LineProtocolWriter
+from .schema import Schema
 
 MEASUREMENT = "weather"
 """InfluxDB measurement value."""
@@ -18,34 +20,50 @@ FIELD_KEYS = [
 ]
 """InfluxDB field keys."""
 
+ROLLUP_TAG_KEYS = ()
+"""Tag keys which identify a weather series when it is rolled up, none as the weather is of one location."""
 
-def _get_weather_points(api_key, lat, lon):
+SCHEMA = Schema(MEASUREMENT, TAG_KEYS, FIELD_KEYS)
+"""Projection of current weather data onto weather points."""
+
+
+def _get_weather_points(api_key, lat, lon, batch=None):
     """Get data prepared for InfluxDB insertion.
 
     :param str api_key:
     :param float lat: Latitude
     :param float lon: Longitude
+    :param batch: (optional) A :py:class:`~den.lineprotocol.PointBatch` to append the point to.
     :rtype: :py:class:`list`
-    :returns: The current weather data prepared for insertion into InfluxDB.
+    :returns: The current weather data prepared for insertion into InfluxDB, or ``batch`` when one is given.
 
     """
     forecast = forecastio.load_forecast(api_key, lat, lon)
     currently = forecast.currently()
     current_data = currently.d
     LOG.debug("Weather dict: %s", current_data)
-    point = {"measurement": MEASUREMENT, "tags": {}, "fields": {}}
-    for k, v in current_data.items():
-        if k in TAG_KEYS:
-            point["tags"][k] = v
-        elif k in FIELD_KEYS:
-            point["fields"][k] = float(v)
-        else:
-            LOG.warning("Weather unknown property: '%s': '%s'", k, v)
+    if batch is not None:
+        SCHEMA.append(batch, current_data)
+        return batch
+    point = SCHEMA.project(current_data)
     LOG.debug("Weather point: %s", point)
     return [point]
 
 
-def record(database, port, ssl, api_key, lat, lon):
+def collect(writer, api_key, lat, lon):
+    """Write current weather data with ``writer``.
+
+    :param writer: Anything with an :py:meth:`influxdb.InfluxDBClient.write_points` compatible method.
+    :param str api_key:
+    :param float lat: Latitude
+    :param float lon: Longitude
+    :rtype: :py:const:`None`
+
+    """
+    writer.write_points(_get_weather_points(api_key, lat, lon), time_precision="s")
+
+
+def record(database, port, ssl, api_key, lat, lon, gzip_level=None, gzip_threshold=GZIP_THRESHOLD):
     """Record current weather data into the database.
 
     .. note::
@@ -58,9 +76,13 @@ def record(database, port, ssl, api_key, lat, lon):
     :param str api_key:
     :param float lat: Latitude
     :param float lon: Longitude
+    :param int gzip_level: (optional) The gzip compression level of database writes, by default they are not
+                           compressed.
+    :param int gzip_threshold: (optional) The minimum number of bytes in a compressed database write.
     :rtype: :py:const:`None`
     :return: When the current weather data has been written to the database.
 
     """
-    db = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
-    db.write_points(_get_weather_points(api_key, lat, lon), time_precision="s")
+    client = influxdb.InfluxDBClient(database=database, port=port, ssl=ssl)
+    db = LineProtocolWriter(client, database, gzip_level=gzip_level, gzip_threshold=gzip_threshold)
+    collect(db, api_key, lat, lon)
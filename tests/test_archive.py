@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from den import archive
+from den.sse import Parser
+
+STREAM = b"event: put\ndata: {\"a\": 1}\n\nevent: keep-alive\ndata: null\n\nevent: put\ndata: {\"a\": 2}\n\n"
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, path):
+        with archive.open_segment(path) as f:
+            return f.read()
+
+    def test_get_compression(self):
+        self.assertIn(archive.get_compression(), archive.COMPRESSIONS)
+        self.assertEqual("gzip", archive.get_compression("gzip"))
+        self.assertRaises(ValueError, archive.get_compression, "lzma")
+
+    def test_record(self):
+        with archive.StreamRecorder(self.directory, compression="gzip") as recorder:
+            for i in range(0, len(STREAM), 7):
+                recorder.write(STREAM[i:i + 7], 100.0 + i)
+        index = archive.read_index(self.directory)
+        self.assertEqual(1, len(index))
+        start, path = index[0]
+        self.assertEqual(100.0, start)
+        self.assertTrue(path.endswith(".sse.gz"))
+        data = self._read(path)
+        self.assertEqual(STREAM, b"".join(l for l in data.splitlines(True) if not l.startswith(archive.TIME_COMMENT)))
+        self.assertEqual(3, data.count(archive.TIME_COMMENT))
+        self.assertTrue(data.startswith(b": t=100.000\nevent: put\n"))
+        parser = Parser()
+        events = parser.feed(data) + parser.close()
+        self.assertEqual(["put", "keep-alive", "put"], [e.event for e in events])
+
+    def test_record_rotates_at_events(self):
+        with archive.StreamRecorder(self.directory, interval=10, compression="gzip") as recorder:
+            recorder.write(STREAM[:30], 100.0)
+            recorder.write(STREAM[30:], 115.0)
+        index = archive.read_index(self.directory)
+        self.assertEqual([100.0, 115.0], [start for start, _ in index])
+        first, second = [self._read(path) for _, path in index]
+        self.assertTrue(first.endswith(b"\n\n"))
+        self.assertTrue(second.startswith(b": t=115.000\nevent: keep-alive\n"))
+
+    def test_record_flushes_at_events(self):
+        recorder = archive.StreamRecorder(self.directory, compression="gzip", flush_interval=10)
+        try:
+            recorder.write(STREAM[:30], 100.0)
+            recorder.write(STREAM[30:], 115.0)
+            with open(archive.read_index(self.directory)[0][1], "rb") as f:
+                data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(f.read())
+        finally:
+            recorder.close()
+        self.assertEqual(b": t=100.000\n" + STREAM[:27], data)
+
+    def test_record_new_stream(self):
+        with archive.StreamRecorder(self.directory, compression="gzip") as recorder:
+            recorder.new_stream()
+            recorder.write(STREAM[:20], 100.0)
+            recorder.new_stream()
+            recorder.write(STREAM, 110.0)
+        data = self._read(archive.read_index(self.directory)[0][1])
+        parser = archive.TimedParser()
+        events = parser.feed(data) + parser.close()
+        self.assertEqual([(100.0, b'{"a'), (110.0, b'{"a": 1}'), (110.0, b"null"), (110.0, b'{"a": 2}')],
+                         [(t, e.data) for t, e in events])
+
+    def test_timed_parser(self):
+        parser = archive.TimedParser(50.0)
+        data = b"event: put\ndata: 0\n: t=100.000\nevent: put\ndata: 1\n\n: t=101.500\nevent: put\ndata: 2\n"
+        events = parser.feed(data) + parser.close()
+        self.assertEqual([50.0, 100.0, 101.5], [t for t, _ in events])
+        self.assertEqual([b"0", b"1", b"2"], [e.data for _, e in events])
+
+    def test_open_segment_uncompressed(self):
+        path = os.path.join(self.directory, "stream.sse")
+        with open(path, "wb") as f:
+            f.write(STREAM)
+        self.assertEqual(STREAM, self._read(path))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
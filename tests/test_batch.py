@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import time
+import unittest
+
+from influxdb.exceptions import InfluxDBClientError
+from mock import MagicMock, patch
+
+from den import batch
+
+
+def _points(n):
+    return [{"measurement": "test", "tags": {}, "fields": {"value": float(i)}} for i in range(n)]
+
+
+class BatchWriterTestCase(unittest.TestCase):
+    def test_stamp(self):
+        points = _points(2)
+        points[1]["time"] = 1
+        self.assertIs(points, batch.stamp(points, 10))
+        self.assertEqual([10, 1], [p["time"] for p in points])
+
+    def test_write_points_stamps_time(self):
+        db = MagicMock()
+        with batch.BatchWriter(db) as writer:
+            points = _points(1)
+            points.append({"measurement": "test", "tags": {}, "fields": {}, "time": 1})
+            writer.write_points(points)
+        written = db.write_points.call_args[0][0]
+        self.assertIsInstance(written[0]["time"], int)
+        self.assertEqual(1, written[1]["time"])
+
+    def test_close_writes_pending_points(self):
+        db = MagicMock()
+        with batch.BatchWriter(db, batch_size=100, max_latency=60) as writer:
+            writer.write_points(_points(3))
+            writer.write_points(_points(4))
+            self.assertEqual(0, db.write_points.call_count)
+        db.write_points.assert_called_once_with(db.write_points.call_args[0][0], time_precision="s")
+        self.assertEqual(7, len(db.write_points.call_args[0][0]))
+
+    def test_batch_size_triggers_write(self):
+        db = MagicMock()
+        with batch.BatchWriter(db, batch_size=5, max_latency=60) as writer:
+            writer.write_points(_points(12))
+            writer.flush()
+            self.assertEqual([5, 5, 2], [len(c[0][0]) for c in db.write_points.call_args_list])
+
+    def test_max_latency_triggers_write(self):
+        db = MagicMock()
+        with batch.BatchWriter(db, batch_size=100, max_latency=0.01) as writer:
+            writer.write_points(_points(1))
+            deadline = time.time() + 5
+            while not db.write_points.called and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(1, db.write_points.call_count)
+
+    def test_write_error_does_not_stop_writer(self):
+        db = MagicMock()
+        db.write_points.side_effect = [InfluxDBClientError("invalid payload", 400), True]
+        with patch("den.batch.LOG"), batch.BatchWriter(db, batch_size=100, max_latency=60) as writer:
+            writer.write_points(_points(1))
+            writer.flush()
+            writer.write_points(_points(1))
+        self.assertEqual(2, db.write_points.call_count)
+
+    def test_write_error_is_retried(self):
+        db = MagicMock()
+        db.write_points.side_effect = [IOError("down"), InfluxDBClientError("unavailable", 503), True]
+        with patch("den.batch.LOG") as log_mock, patch("den.batch.time.sleep") as sleep_mock:
+            with batch.BatchWriter(db, batch_size=100, max_latency=60, retry_interval=0.5) as writer:
+                writer.write_points(_points(2))
+            self.assertEqual(2, log_mock.warning.call_count)
+            self.assertFalse(log_mock.exception.called)
+        self.assertEqual([((0.5, ), {}), ((1.0, ), {})], sleep_mock.call_args_list)
+        self.assertEqual(3, db.write_points.call_count)
+
+    def test_write_error_is_dropped_after_retries(self):
+        db = MagicMock()
+        db.write_points.side_effect = IOError("down")
+        with patch("den.batch.LOG") as log_mock, patch("den.batch.time.sleep"):
+            with batch.BatchWriter(db, retries=2) as writer:
+                writer.write_points(_points(1))
+            self.assertTrue(log_mock.exception.called)
+        self.assertEqual(3, db.write_points.call_count)
+
+    def test_write_after_close_raises(self):
+        writer = batch.BatchWriter(MagicMock())
+        writer.close()
+        self.assertRaises(ValueError, writer.write_points, _points(1))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
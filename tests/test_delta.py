@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import unittest
+
+from den import delta
+
+
+def _point(device_id, temperature, measurement="thermostat", hvac_state="off"):
+    return {
+        "measurement": measurement,
+        "tags": {"device_id": device_id, "hvac_state": hvac_state},
+        "fields": {"ambient_temperature_f": temperature}
+    }
+
+
+class DeltaFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.delta_filter = delta.DeltaFilter({"thermostat": ("device_id", )}, keyframe_interval=60)
+
+    def test_filter_drops_unchanged_points(self):
+        self.assertEqual(2, len(self.delta_filter.filter([_point("a", 70.0), _point("b", 68.0)], now=0)))
+        actual = self.delta_filter.filter([_point("a", 70.0), _point("b", 69.0)], now=1)
+        self.assertEqual([_point("b", 69.0)], actual)
+
+    def test_filter_keeps_changed_tags(self):
+        self.delta_filter.filter([_point("a", 70.0)], now=0)
+        actual = self.delta_filter.filter([_point("a", 70.0, hvac_state="heating")], now=1)
+        self.assertEqual(1, len(actual))
+
+    def test_filter_keeps_keyframes(self):
+        self.delta_filter.filter([_point("a", 70.0)], now=0)
+        self.assertEqual([], self.delta_filter.filter([_point("a", 70.0)], now=59))
+        self.assertEqual(1, len(self.delta_filter.filter([_point("a", 70.0)], now=60)))
+        self.assertEqual([], self.delta_filter.filter([_point("a", 70.0)], now=61))
+
+    def test_filter_keeps_unknown_measurements(self):
+        points = [_point("a", 70.0, measurement="other")]
+        self.assertEqual(points, self.delta_filter.filter(points, now=0))
+        self.assertEqual(points, self.delta_filter.filter(points, now=1))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
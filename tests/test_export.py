@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import csv
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from den import export
+
+_SELECT = re.compile(r"time >= (\d+)s AND time < (\d+)s .* LIMIT (\d+) OFFSET (\d+)")
+
+
+class FakeInfluxDB(object):
+    """Answer export queries from a list of ``(time, device_id, humidity)`` rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def query(self, query, epoch=None):  # pylint: disable=unused-argument
+        with self._lock:
+            self.queries.append(query)
+        result = MagicMock()
+        if query.startswith("SHOW TAG KEYS"):
+            series = {"columns": ["tagKey"], "values": [["device_id"]]}
+        elif query.startswith("SHOW FIELD KEYS"):
+            series = {"columns": ["fieldKey", "fieldType"], "values": [["humidity", "float"], ["label", "string"]]}
+        else:
+            start, end, limit, offset = [int(g) for g in _SELECT.search(query).groups()]
+            values = [[t, h, d] for t, d, h in self.rows if start <= t < end][offset:offset + limit]
+            series = {"columns": ["time", "humidity", "device_id"], "values": values}
+        result.raw = {"series": [series]} if series["values"] else {}
+        return result
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, "out.csv")
+        self.rows = [(t, "d%d" % (t % 3), float(t)) for t in range(0, 1000, 7)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_time(self):
+        self.assertEqual(1483228800, export.parse_time("1483228800"))
+        self.assertEqual(1483228800, export.parse_time("2017-01-01"))
+        self.assertEqual(1483232400, export.parse_time("2017-01-01T01:00:00Z"))
+        self.assertRaises(ValueError, export.parse_time, "yesterday")
+
+    def test_get_shards(self):
+        self.assertEqual([(0, 100), (100, 200), (200, 250)], export.get_shards(0, 250, 100))
+        self.assertEqual([], export.get_shards(10, 10, 100))
+
+    def test_get_columns(self):
+        self.assertEqual([("time", "time"), ("device_id", "tag"), ("humidity", "float"), ("label", "string")],
+                         export.get_columns(FakeInfluxDB([]), "thermostat"))
+
+    def test_export_csv(self):
+        client = FakeInfluxDB(self.rows)
+        spill = os.path.join(self.directory, "spill")
+        os.mkdir(spill)
+        with patch("den.export.tempfile.mkdtemp", return_value=spill):
+            self.assertEqual(len(self.rows), export.export(client, "thermostat", 0, 1000, self.output, workers=3,
+                                                           chunk_size=4, shard_size=100))
+        self.assertFalse(os.path.exists(spill))
+        with open(self.output) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(["time", "device_id", "humidity", "label"], rows[0])
+        self.assertEqual([[str(t), d, repr(h), ""] for t, d, h in self.rows], rows[1:])
+        self.assertTrue(all("LIMIT 4 " in q for q in client.queries if q.startswith("SELECT")))
+
+    def test_export_unknown_measurement(self):
+        self.assertRaises(ValueError, export.export, FakeInfluxDB([]), "smoke", 0, 1, self.output)
+
+    def test_export_parquet(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        output = os.path.join(self.directory, "out.parquet")
+        export.export(FakeInfluxDB(self.rows), "thermostat", 0, 1000, output, "parquet", chunk_size=10, shard_size=50)
+        table = pyarrow.parquet.read_table(output)
+        self.assertEqual(len(self.rows), table.num_rows)
+        self.assertEqual([h for _, _, h in self.rows], table.column("humidity").to_pylist())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import shutil
+import tempfile
+import time
+import unittest
+
+from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+
+from benchmarks.influxd import InfluxDB
+from den.lineprotocol import LineProtocolWriter
+from den import spool
+
+POINTS = [{"measurement": "test", "tags": {"name": "a b"}, "fields": {"value": 1.0}, "time": 1}]
+
+
+class InfluxDBTestCase(unittest.TestCase):
+    def _client(self, influxdb):
+        return InfluxDBClient(port=influxdb.port, database="test", retries=1)
+
+    def test_write_points(self):
+        received = []
+        with InfluxDB(on_write=lambda body, now: received.append(body)) as influxdb:
+            client = self._client(influxdb)
+            self.assertTrue(client.ping())
+            self.assertTrue(client.write_points(POINTS * 3))
+            self.assertEqual(1, influxdb.writes)
+            self.assertEqual(3, influxdb.points)
+            self.assertEqual(len(received[0]), influxdb.bytes)
+
+    def test_line_protocol_writer(self):
+        with InfluxDB() as influxdb:
+            db = LineProtocolWriter(self._client(influxdb), "test")
+            self.assertTrue(db.write_points(POINTS, time_precision="s"))
+            self.assertEqual(1, influxdb.points)
+
+    def test_gzip_write(self):
+        received = []
+        with InfluxDB(on_write=lambda body, now: received.append(body)) as influxdb:
+            db = LineProtocolWriter(self._client(influxdb), "test", gzip_level=6, gzip_threshold=0)
+            self.assertTrue(db.write_points(POINTS * 100, time_precision="s"))
+            self.assertEqual(100, influxdb.points)
+            self.assertEqual(len(received[0]), influxdb.bytes)
+            self.assertLess(influxdb.wire_bytes * 10, influxdb.bytes)
+            with self.assertRaises(InfluxDBClientError) as context:
+                self._client(influxdb).request(
+                    "write", "POST", {"db": "test"}, b"test value=1\n", headers={"Content-Encoding": "gzip"})
+            self.assertEqual(400, context.exception.code)
+
+    def test_query(self):
+        with InfluxDB() as influxdb:
+            client = self._client(influxdb)
+            client.create_database("test")
+            client.create_database("other")
+            self.assertEqual([{"name": "other"}, {"name": "test"}], client.get_list_database())
+            client.drop_database("other")
+            self.assertEqual([{"name": "test"}], client.get_list_database())
+            self.assertEqual([], list(client.query("SELECT * FROM test").get_points()))
+
+    def test_invalid_payload(self):
+        with InfluxDB() as influxdb:
+            db = LineProtocolWriter(self._client(influxdb), "test")
+            with self.assertRaises(InfluxDBClientError) as context:
+                db.write(b"test value=1\ntest\n")
+            self.assertEqual(400, context.exception.code)
+            self.assertEqual({400: 1}, influxdb.rejected)
+            self.assertEqual(0, influxdb.points)
+
+    def test_fail(self):
+        with InfluxDB() as influxdb:
+            influxdb.fail(2)
+            client = self._client(influxdb)
+            self.assertRaises(InfluxDBServerError, client.write_points, POINTS)
+            self.assertRaises(InfluxDBServerError, client.write_points, POINTS)
+            self.assertTrue(client.write_points(POINTS))
+            self.assertEqual({500: 2}, influxdb.rejected)
+
+    def test_error_rate(self):
+        with InfluxDB(error_rate=0.5) as influxdb:
+            db = LineProtocolWriter(self._client(influxdb), "test")
+            for _ in range(20):
+                try:
+                    db.write_points(POINTS)
+                except InfluxDBServerError:
+                    pass
+            self.assertEqual(20, influxdb.writes + influxdb.rejected[500])
+            self.assertGreater(influxdb.writes, 0)
+            self.assertGreater(influxdb.rejected[500], 0)
+
+    def test_throttle(self):
+        with InfluxDB(throttle=2) as influxdb:
+            db = LineProtocolWriter(self._client(influxdb), "test")
+            while int(time.time() + 0.1) != int(time.time()):
+                time.sleep(0.1)
+            db.write_points(POINTS)
+            db.write_points(POINTS)
+            with self.assertRaises(InfluxDBClientError) as context:
+                db.write_points(POINTS)
+            self.assertEqual(429, context.exception.code)
+
+    def test_latency(self):
+        with InfluxDB(latency=0.1) as influxdb:
+            start = time.time()
+            self._client(influxdb).write_points(POINTS)
+            self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_drainer_recovers(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with InfluxDB() as influxdb:
+                influxdb.fail(2)
+                db = LineProtocolWriter(self._client(influxdb), "test")
+                with spool.Spool(directory) as s:
+                    s.write_points([dict(POINTS[0], time=i) for i in range(10)])
+                    with spool.Drainer(s, db, max_latency=0.01, retry_interval=0.01):
+                        for _ in range(500):
+                            if influxdb.points == 10:
+                                break
+                            time.sleep(0.01)
+                self.assertEqual(10, influxdb.points)
+                self.assertEqual({500: 2}, influxdb.rejected)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import logging
+import unittest
+
+from mock import MagicMock, patch
+
+import den
+
+
+class SampledLoggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.logger = MagicMock()
+        self.logger.isEnabledFor.return_value = True
+        self.log = den.SampledLogger(self.logger, 60)
+
+    @patch("den.time.time")
+    def test_debug(self, time):
+        time.return_value = 100.0
+        self.log.debug("%s", "a")
+        self.logger.debug.assert_called_once_with("%s", "a")
+
+    @patch("den.time.time")
+    def test_debug_within_interval(self, time):
+        time.return_value = 100.0
+        self.log.debug("%s", "a")
+        time.return_value = 159.0
+        self.log.debug("%s", "b")
+        self.logger.debug.assert_called_once_with("%s", "a")
+        self.assertEqual(1, self.log.suppressed)
+
+    @patch("den.time.time")
+    def test_debug_after_interval(self, time):
+        time.return_value = 100.0
+        self.log.debug("%s", "a")
+        self.log.debug("%s", "b")
+        time.return_value = 160.0
+        self.log.debug("%s", "c")
+        self.logger.debug.assert_any_call("%d sampled message(s) suppressed", 1)
+        self.logger.debug.assert_called_with("%s", "c")
+        self.assertEqual(0, self.log.suppressed)
+
+    def test_debug_disabled(self):
+        self.logger.isEnabledFor.return_value = False
+        self.log.debug("%s", "a")
+        self.logger.isEnabledFor.assert_called_once_with(logging.DEBUG)
+        self.logger.debug.assert_not_called()
+        self.assertEqual(0, self.log.suppressed)
+
+
+class ConfigureLoggerTestCase(unittest.TestCase):
+    @unittest.skipIf(den.QueueHandler is None, "requires logging.handlers.QueueHandler")
+    def test_queued(self):
+        logger = logging.getLogger(den.__title__)
+        self.assertEqual([den.QueueHandler], [type(h) for h in logger.handlers])
+        self.assertEqual(logger.handlers, logging.getLogger("backoff").handlers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import json
+import unittest
+
+from mock import patch
+
+from den import jsonbackend
+
+
+class JSONBackendTestCase(unittest.TestCase):
+    def test_active_backend_decodes_bytes(self):
+        self.assertIn(jsonbackend.NAME, jsonbackend.BACKENDS)
+        self.assertEqual({"path": "/", "data": [1.5, None]}, jsonbackend.loads(b'{"path": "/", "data": [1.5, null]}'))
+
+    def test_active_backend_raises_value_error(self):
+        self.assertRaises(ValueError, jsonbackend.loads, b"not JSON")
+
+    def test_get_loads(self):
+        self.assertIs(json.loads, jsonbackend.get_loads("json"))
+        self.assertRaises(ValueError, jsonbackend.get_loads, "pickle")
+
+    def test_json_decodes_bytes_before_python_3_6(self):
+        with patch("den.jsonbackend._JSON_DECODES_BYTES", False):
+            name, loads = jsonbackend._select("json")
+        self.assertEqual("json", name)
+        self.assertIs(jsonbackend._json_loads, loads)
+        self.assertEqual({"name": u"H\xe4ll"}, loads(u'{"name": "H\xe4ll"}'.encode("utf-8")))
+        self.assertEqual({"name": u"H\xe4ll"}, loads(u'{"name": "H\xe4ll"}'))
+        self.assertRaises(ValueError, loads, b"not JSON")
+
+    def test_select_prefers_installed_backend(self):
+        self.assertEqual(("json", json.loads), jsonbackend._select("json"))
+        self.assertIn(jsonbackend._select("missing")[0], jsonbackend.BACKENDS)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import unittest
+import zlib
+
+from influxdb.line_protocol import make_lines
+from mock import MagicMock, patch
+
+from den import lineprotocol
+
+
+class LineProtocolTestCase(unittest.TestCase):
+    def test_escape_key(self):
+        self.assertEqual("a\\ b\\,c\\=d\\\\", lineprotocol.escape_key("a b,c=d\\"))
+
+    def test_escape_tag_value_trailing_backslash(self):
+        self.assertEqual("a\\\\ ", lineprotocol.escape_tag_value("a\\"))
+
+    def test_format_field_value(self):
+        self.assertEqual("1.5", lineprotocol.format_field_value(1.5))
+        self.assertEqual("1i", lineprotocol.format_field_value(1))
+        self.assertEqual("true", lineprotocol.format_field_value(True))
+        self.assertEqual('"a \\"b\\""', lineprotocol.format_field_value('a "b"'))
+        self.assertIsNone(lineprotocol.format_field_value(float("nan")))
+        self.assertIsNone(lineprotocol.format_field_value(None))
+
+    def test_encode(self):
+        encoder = lineprotocol.Encoder()
+        actual = encoder.encode("thermostat", {"name": "Family Room", "b": "", "a": 1}, {"humidity": 40.0}, 10)
+        self.assertEqual("thermostat,a=1,name=Family\\ Room humidity=40.0 10", actual)
+        self.assertIsNone(encoder.encode("thermostat", {}, {"humidity": None}))
+
+    def test_encode_points_matches_influxdb(self):
+        points = [{
+            "measurement": "thermostat",
+            "tags": {"device_id": "d0", "label": "Up stairs", "locale": "en-US"},
+            "fields": {"humidity": 40.0, "ambient_temperature_f": 68.0},
+            "time": 1500000000
+        }, {
+            "measurement": "structure",
+            "tags": {"away": "home", "name": "Home,Sweet=Home"},
+            "fields": {"is_away": 0}
+        }]
+        expected = make_lines({"points": points}, "s").encode("utf-8")
+        self.assertEqual(expected, lineprotocol.Encoder().encode_points(points))
+
+    def test_prefix_cache(self):
+        encoder = lineprotocol.Encoder(cache_size=1)
+        self.assertEqual("m,a=1", encoder.prefix("m", {"a": "1"}))
+        self.assertEqual("m,a=1", encoder.prefix("m", {"a": "1"}))
+        self.assertEqual(1, len(encoder._prefixes))
+        self.assertEqual("m,a=2", encoder.prefix("m", {"a": "2"}))
+        self.assertEqual(1, len(encoder._prefixes))
+
+    def test_writer_posts_encoded_points(self):
+        db = MagicMock()
+        writer = lineprotocol.LineProtocolWriter(db, "den_test")
+        self.assertTrue(writer.write_points([{"measurement": "m", "tags": {}, "fields": {"v": 1.0}}], "s"))
+        db.request.assert_called_once_with(
+            url="write",
+            method="POST",
+            params={"db": "den_test", "precision": "s"},
+            data=b"m v=1.0\n",
+            expected_response_code=204,
+            headers={"Content-Type": "application/octet-stream"})
+
+    def test_point_batch_matches_encoder(self):
+        points = [{
+            "measurement": "thermostat",
+            "tags": {"device_id": "d0", "label": "Up stairs"},
+            "fields": {"humidity": 40.0, "fan_timer_active": True, "name": 'a "b"', "bad": float("nan")},
+            "time": 1500000000
+        }, {
+            "measurement": "structure",
+            "tags": {"name": "Home,Sweet=Home"},
+            "fields": {"is_away": 0},
+            "time": 1500000001
+        }, {
+            "measurement": "thermostat",
+            "tags": {"label": "Up stairs", "device_id": "d0"},
+            "fields": {"humidity": 41.5},
+            "time": 1500000002
+        }]
+        batch = lineprotocol.PointBatch()
+        batch.extend(points)
+        self.assertEqual(3, len(batch))
+        self.assertEqual(2, len(batch._prefixes))
+        self.assertEqual("d", batch._columns["humidity"].kind)
+        self.assertEqual(lineprotocol.Encoder().encode_points(points), batch.encode())
+        self.assertEqual(batch.encode(), lineprotocol.Encoder().encode_points(batch))
+
+    def test_point_batch_mixed_types(self):
+        batch = lineprotocol.PointBatch()
+        batch.append("m", {}, {"v": True}, 1)
+        batch.append("m", {}, {"w": 2}, 2)
+        batch.append("m", {}, {"v": "on"}, 3)
+        self.assertIsNone(batch._columns["v"].kind)
+        self.assertEqual(b'm v=true 1\nm w=2i 2\nm v="on" 3\n', batch.encode())
+        self.assertEqual([{"v": True}, {"w": 2}, {"v": "on"}], [p["fields"] for p in batch])
+
+    @patch("den.lineprotocol.now", return_value=100)
+    def test_point_batch_stamp(self, _):
+        batch = lineprotocol.PointBatch()
+        batch.append("m", None, {"v": 1.0})
+        batch.append("m", None, {})
+        batch.append("m", None, [("v", 2.0)])
+        self.assertEqual([100, 100, 100], list(batch.times))
+        batch.stamp(200, 1)
+        self.assertEqual(b"m v=1.0 100\nm v=2.0 200\n", batch.encode())
+
+    def test_point_batch_failed_append(self):
+        def fields():
+            yield "v", 1.0
+            raise ValueError()
+
+        batch = lineprotocol.PointBatch()
+        self.assertRaises(ValueError, batch.append, "m", {}, fields(), 1)
+        batch.append("m", {}, {"w": 2.0}, 2)
+        self.assertEqual(b"m w=2.0 2\n", batch.encode())
+
+    def test_writer_compresses_large_writes(self):
+        db = MagicMock()
+        writer = lineprotocol.LineProtocolWriter(db, "den_test", gzip_level=1, gzip_threshold=20)
+        writer.write(b"m v=1.0 1\n", "s")
+        self.assertEqual(b"m v=1.0 1\n", db.request.call_args[1]["data"])
+        self.assertNotIn("Content-Encoding", db.request.call_args[1]["headers"])
+        data = b"m v=1.0 1\n" * 10
+        writer.write(data, "s")
+        self.assertEqual("gzip", db.request.call_args[1]["headers"]["Content-Encoding"])
+        self.assertEqual(data, zlib.decompress(db.request.call_args[1]["data"], 16 + zlib.MAX_WBITS))
+
+    def test_writer_skips_empty_writes(self):
+        db = MagicMock()
+        self.assertTrue(lineprotocol.LineProtocolWriter(db, "den_test").write_points([]))
+        self.assertFalse(db.request.called)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -21,6 +21,223 @@ class MainTestCase(unittest.TestCase):
             __main__.main()
             record_mock.assert_called_once_with('test', 8086, False, '', 39.9528, 75.1638)
 
+    def test_propane(self):
+        with mock.patch.object(sys, "argv", "prog test propane --username u --password p".split()), \
+             mock.patch("den.propane.record", autospec=True) as record_mock:
+            __main__.main()
+            record_mock.assert_called_once_with("test", 8086, False, "u", "p")
+
+        argv = "prog test propane --username u --password p --workers 2 --no-token-cache".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("den.propane.record", autospec=True) as record_mock:
+            __main__.main()
+            record_mock.assert_called_once_with("test", 8086, False, "u", "p", workers=2, token_cache=None)
+
+    def test_gzip(self):
+        with mock.patch.object(sys, "argv", "prog test --gzip-level 3 weather".split()), \
+             mock.patch("den.weather.record", autospec=True) as record_mock:
+            __main__.main()
+            record_mock.assert_called_once_with('test', 8086, False, '', 39.9528, 75.1638, gzip_level=3)
+
+        argv = "prog test --gzip-level 9 --gzip-threshold 0 propane --username u --password p".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("den.propane.record", autospec=True) as record_mock:
+            __main__.main()
+            record_mock.assert_called_once_with("test", 8086, False, "u", "p", gzip_level=9, gzip_threshold=0)
+
+        with mock.patch("influxdb.client.InfluxDBClient", autospec=True):
+            db = __main__._get_db(__main__._get_parser().parse_args("test --gzip-level 1 replay x".split()))
+        self.assertEqual((1, 1024), (db.gzip_level, db.gzip_threshold))
+
+    def test_udp_transport(self):
+        args = __main__._get_parser().parse_args("test thermostat --transport udp --udp-port 9999".split())
+        with mock.patch("den.udp.UDPWriter", autospec=True) as writer_mock:
+            self.assertIs(writer_mock.return_value, __main__._get_db(args))
+            writer_mock.assert_called_once_with(port=9999, mtu=1500, precision="n")
+
+    def test_sinks(self):
+        args = __main__._get_parser().parse_args("test run --sink influxdb --sink stdout".split())
+        with mock.patch("influxdb.client.InfluxDBClient", autospec=True), \
+             mock.patch("den.sinks.FanOut", autospec=True) as fan_out_mock:
+            with __main__._database(args) as db:
+                self.assertIs(fan_out_mock.return_value, db)
+            db.close.assert_called_once_with()
+        db, stdout = fan_out_mock.call_args[0][0]
+        self.assertEqual("test", db.database)
+        self.assertEqual("-", stdout.path)
+
+        with mock.patch("sys.stderr"):
+            self.assertRaises(SystemExit, __main__._get_parser().parse_args, "test run --sink s3:x".split())
+
+    def test_spool_rejects_sinks(self):
+        for command in ("run", "thermostat"):
+            with mock.patch("sys.stderr"):
+                self.assertRaises(SystemExit, __main__._get_parser().parse_args,
+                                  ["test", command, "--spool-dir", "spool", "--sink", "stdout"])
+        with mock.patch.dict("os.environ", {"DEN_SPOOL_DIR": "spool"}):
+            args = __main__._get_parser().parse_args("test thermostat --access-token A --sink stdout".split())
+        with mock.patch("den.__main__.LOG") as log_mock:
+            self.assertFalse(__main__._thermostat(args))
+            self.assertFalse(__main__._run(args))
+        self.assertEqual(2, log_mock.critical.call_count)
+
+    def test_run(self):
+        argv = "prog test run --access-token TOKEN --api-key KEY --username user --password pass".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True), \
+             mock.patch("den.__main__.scheduler.Scheduler", autospec=True) as scheduler_mock, \
+             mock.patch("den.propane.get_session", autospec=True) as session_mock, \
+             mock.patch("den.weather.collect", autospec=True) as weather_mock, \
+             mock.patch("den.propane.collect", autospec=True) as propane_mock, \
+             mock.patch("den.thermostat.collect", autospec=True) as thermostat_mock:
+            thermostat_mock.side_effect = KeyboardInterrupt
+            self.assertEqual(0, __main__.main())
+            jobs = scheduler_mock.call_args[0][0]
+            self.assertEqual(["weather", "propane"], [j.name for j in jobs])
+            self.assertEqual([600, 3600], [j.interval for j in jobs])
+            scheduler_mock.return_value.start.assert_called_once_with()
+            scheduler_mock.return_value.stop.assert_called_once_with()
+            writer = thermostat_mock.call_args[0][0]
+            self.assertEqual("TOKEN", thermostat_mock.call_args[0][1])
+            for job in jobs:
+                job.func()
+            weather_mock.assert_called_once_with(writer, "KEY", 39.9528, 75.1638)
+            propane_mock.assert_called_once_with(writer, session_mock.return_value, "user", "pass")
+            session_mock.return_value.close.assert_called_once_with()
+
+    def test_stream_unexpected_error(self):
+        collect = mock.MagicMock(side_effect=[ValueError("EOF occurred in violation of protocol"), ValueError("bad")])
+        with mock.patch("den.__main__.LOG"):
+            self.assertFalse(__main__._stream(collect))
+        self.assertEqual(2, collect.call_count)
+
+    def test_stream_all_fails_when_streams_raise(self):
+        with mock.patch("den.__main__._stream", side_effect=RuntimeError("crashed")), \
+             mock.patch("threading.excepthook"):
+            self.assertFalse(__main__._stream_all([("a", None), ("b", None)]))
+        with mock.patch("den.__main__._stream", side_effect=[True, RuntimeError("crashed")]), \
+             mock.patch("threading.excepthook"):
+            self.assertFalse(__main__._stream_all([("a", None), ("b", None)]))
+        with mock.patch("den.__main__._stream", return_value=True):
+            self.assertTrue(__main__._stream_all([("a", None), ("b", None)]))
+
+    def test_thermostat_accounts(self):
+        argv = "prog test thermostat --access-tokens home=A,cabin=B".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch.dict("os.environ", clear=True), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True), \
+             mock.patch("den.thermostat.record", autospec=True) as record_mock, \
+             mock.patch("den.thermostat.collect", autospec=True) as collect_mock:
+            collect_mock.side_effect = KeyboardInterrupt
+            self.assertEqual(0, __main__.main())
+            self.assertFalse(record_mock.called)
+            calls = sorted(c[0][1:] for c in collect_mock.call_args_list)
+            self.assertEqual([("A", None, None, "home"), ("B", None, None, "cabin")], calls)
+            self.assertEqual(1, len(set(id(c[0][0]) for c in collect_mock.call_args_list)))
+
+    def test_thermostat_reconnect_keeps_connections(self):
+        from requests.exceptions import StreamConsumedError
+        argv = "prog test thermostat --access-token A".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch.dict("os.environ", clear=True), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True) as client_mock, \
+             mock.patch("den.thermostat.collect", autospec=True) as collect_mock:
+            collect_mock.side_effect = [StreamConsumedError(), KeyboardInterrupt()]
+            self.assertEqual(0, __main__.main())
+            self.assertEqual(1, client_mock.call_count)
+            (first, first_kwargs), (second, second_kwargs) = collect_mock.call_args_list
+            self.assertEqual(first, second)
+            self.assertEqual(("A", None, None, None), first[1:])
+            self.assertIs(first_kwargs["session"], second_kwargs["session"])
+
+    def test_rolled_up(self):
+        args = __main__._get_parser().parse_args(["test", "run", "--rollup-window", "300", "--api-key", "KEY"])
+        writer = mock.MagicMock()
+        with __main__._rolled_up(args, writer) as rolled_up:
+            self.assertEqual(writer, rolled_up.writer)
+            self.assertEqual(300, rolled_up.window)
+            self.assertEqual(["thermostat", "weather"], sorted(rolled_up.measurements))
+            self.assertTrue(rolled_up.raw)
+        args = __main__._get_parser().parse_args(["test", "run"])
+        with __main__._rolled_up(args, writer) as rolled_up:
+            self.assertEqual(writer, rolled_up)
+
+    def test_rollup_rejects_delta(self):
+        for command in ("run", "thermostat"):
+            with mock.patch("sys.stderr"):
+                self.assertRaises(SystemExit, __main__._get_parser().parse_args,
+                                  ["test", command, "--delta", "--rollup-window", "300"])
+
+    def test_get_accounts(self):
+        with mock.patch.dict("os.environ", clear=True):
+            args = __main__._get_parser().parse_args(["test", "run", "--access-token", "A"])
+            self.assertEqual([(None, "A")], __main__._get_accounts(args))
+        with mock.patch.dict("os.environ", {"DEN_ACCESS_TOKENS": "home=B"}, clear=True):
+            args = __main__._get_parser().parse_args(["test", "run", "--access-token", "A"])
+            accounts = __main__._get_accounts(args)
+            self.assertEqual(["A", "B"], [t for _, t in accounts])
+            self.assertEqual("home", accounts[1][0])
+            self.assertIsNotNone(accounts[0][0])
+
+    def test_replay(self):
+        argv = "prog test replay archive snapshots.ndjson --workers 2 --progress progress".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True), \
+             mock.patch("den.replay.replay", autospec=True) as replay_mock:
+            self.assertEqual(0, __main__.main())
+            _, paths, workers, batch_bytes, progress = replay_mock.call_args[0]
+            self.assertEqual(["archive", "snapshots.ndjson"], paths)
+            self.assertEqual(2, workers)
+            self.assertEqual(__main__.spool.BATCH_BYTES, batch_bytes)
+            self.assertEqual("progress", progress)
+
+    def test_export(self):
+        argv = "prog test export thermostat --start 2017-01-01 --end 2017-02-01 -o out.parquet --workers 2".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True) as client_mock, \
+             mock.patch("den.export.export", autospec=True) as export_mock:
+            self.assertEqual(0, __main__.main())
+            export_mock.assert_called_once_with(client_mock.return_value, "thermostat", 1483228800, 1485907200,
+                                                "out.parquet", "parquet", "s", 2, __main__.export.CHUNK_SIZE,
+                                                __main__.export.SHARD_SIZE)
+
+    def test_get_writer(self):
+        with mock.patch.dict("os.environ", clear=True):
+            args = __main__._get_parser().parse_args(["test", "run"])
+            with __main__._get_writer(args, mock.MagicMock()) as writer:
+                self.assertIsInstance(writer, __main__.batch.BatchWriter)
+        with mock.patch("den.spool.spooled", autospec=True) as spooled_mock:
+            args = __main__._get_parser().parse_args(["test", "run", "--spool-dir", "spool"])
+            db = mock.MagicMock()
+            self.assertEqual(spooled_mock.return_value, __main__._get_writer(args, db))
+            spooled_mock.assert_called_once_with(db, "spool", __main__.spool.MAX_SIZE)
+
+    def test_run_metrics(self):
+        argv = "prog test run --api-key KEY --metrics-port 0 --metrics-interval 60".split()
+        with mock.patch.object(sys, "argv", argv), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True), \
+             mock.patch("den.__main__.scheduler.Scheduler", autospec=True) as scheduler_mock, \
+             mock.patch("den.metrics.serve", autospec=True) as serve_mock, \
+             mock.patch("den.metrics.report", autospec=True) as report_mock:
+            serve_mock.return_value.server_address = ("127.0.0.1", 9100)
+            self.assertEqual(0, __main__.main())
+            serve_mock.assert_called_once_with(0, "127.0.0.1")
+            jobs = scheduler_mock.call_args[0][0]
+            self.assertEqual(["weather", "metrics"], [j.name for j in jobs])
+            self.assertEqual(60, jobs[1].interval)
+            jobs[1].func()
+            self.assertEqual(1, report_mock.call_count)
+
+    def test_run_without_collectors(self):
+        with mock.patch.dict("os.environ", clear=True), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True):
+            args = __main__._get_parser().parse_args(["test", "run", "--access-token", "", "--api-key", ""])
+            self.assertFalse(__main__._run(args))
+        with mock.patch.dict("os.environ", clear=True), \
+             mock.patch("influxdb.client.InfluxDBClient", autospec=True):
+            args = __main__._get_parser().parse_args(["test", "run", "--metrics-interval", "60"])
+            self.assertFalse(__main__._run(args))
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
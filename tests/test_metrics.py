@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import unittest
+
+from mock import MagicMock, patch
+import requests
+
+from den import metrics
+from den.lineprotocol import Encoder
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.counter("test_total", "Things.")
+        self.gauge = self.registry.gauge("test_bytes", "Bytes.")
+        self.histogram = self.registry.histogram("test_seconds", "Seconds.", (0.1, 1.0))
+
+    def test_render(self):
+        self.counter.inc()
+        self.counter.inc(2)
+        self.gauge.set(10)
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+        self.assertEqual(
+            b"# HELP test_total Things.\n"
+            b"# TYPE test_total counter\n"
+            b"test_total 3\n"
+            b"# HELP test_bytes Bytes.\n"
+            b"# TYPE test_bytes gauge\n"
+            b"test_bytes 10\n"
+            b"# HELP test_seconds Seconds.\n"
+            b"# TYPE test_seconds histogram\n"
+            b'test_seconds_bucket{le="0.1"} 1\n'
+            b'test_seconds_bucket{le="1.0"} 2\n'
+            b'test_seconds_bucket{le="+Inf"} 3\n'
+            b"test_seconds_sum 5.55\n"
+            b"test_seconds_count 3\n", self.registry.render())
+
+    def test_bucket_bounds_are_inclusive(self):
+        self.histogram.observe(0.1)
+        self.assertEqual([1, 0], self.histogram.counts)
+
+    @patch("den.metrics.time.time")
+    def test_time(self, time):
+        time.side_effect = [10.0, 10.5]
+        with self.histogram.time():
+            pass
+        self.assertEqual([0, 1], self.histogram.counts)
+        self.assertEqual(0.5, self.histogram.sum)
+
+    def test_points(self):
+        self.counter.inc()
+        self.histogram.observe(0.5)
+        self.assertEqual([{
+            "measurement": "den_internal",
+            "tags": {
+                "host": "a"
+            },
+            "fields": {
+                "test_total": 1,
+                "test_bytes": 0,
+                "test_seconds_count": 1,
+                "test_seconds_sum": 0.5
+            }
+        }], self.registry.points({"host": "a"}))
+
+    def test_float_counter_keeps_its_type(self):
+        counter = self.registry.counter("test_seconds_total", "Seconds.", 0.0)
+        encoder = Encoder()
+        before = encoder.encode_points(self.registry.points())
+        counter.inc(1.7)
+        counter.inc(1)
+        after = encoder.encode_points(self.registry.points())
+        self.assertIn(b"test_seconds_total=0.0", before)
+        self.assertIn(b"test_seconds_total=2.7", after)
+        self.assertIn(b"test_total=0i", after)
+
+    def test_report(self):
+        writer = MagicMock()
+        metrics.report(writer, self.registry)
+        writer.write_points.assert_called_once_with(self.registry.points(), time_precision="s")
+
+    def test_serve(self):
+        self.counter.inc()
+        server = metrics.serve(0, registry=self.registry)
+        try:
+            url = "http://127.0.0.1:%d" % server.server_address[1]
+            r = requests.get(url + "/metrics")
+            self.assertEqual(200, r.status_code)
+            self.assertTrue(r.headers["Content-Type"].startswith("text/plain"))
+            self.assertEqual(self.registry.render(), r.content)
+            self.assertEqual(404, requests.get(url + "/").status_code)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from mock import patch
+
+from den import pool
+
+
+class PoolTestCase(unittest.TestCase):
+    def test_ordered_map(self):
+        with ThreadPoolExecutor(4) as executor:
+            results = pool.ordered_map(executor, lambda i: i * i, range(20), 3)
+            self.assertEqual([i * i for i in range(20)], list(results))
+            self.assertEqual([], list(pool.ordered_map(executor, abs, [], 3)))
+
+    def test_ordered_map_window(self):
+        with ThreadPoolExecutor(2) as executor:
+            with patch.object(executor, "submit", wraps=executor.submit) as submit_mock:
+                results = pool.ordered_map(executor, abs, range(10), 3)
+                self.assertEqual(0, next(results))
+                self.assertEqual(3, submit_mock.call_count)
+                self.assertEqual(list(range(1, 10)), list(results))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
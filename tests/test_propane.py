@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
+import json
+import os
+import shutil
+import stat
+import tempfile
 import unittest
 
 import mock
 import requests
 
 from den import propane
+from den.lineprotocol import PointBatch
 
 # pylint: disable=missing-docstring
 # pylint: disable=protected-access
@@ -22,35 +28,39 @@ class PropaneTestCase(unittest.TestCase):
         actual = propane._get_api_url(token="token")
         self.assertEqual(expected, actual)
 
+    def test_get_session(self):
+        session = propane.get_session(8)
+        self.assertFalse(session.verify)
+        self.assertEqual(8, session.get_adapter("https://data.tankutility.com")._pool_maxsize)
+
     @staticmethod
     def test_get_token():
-        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock, \
-             mock.patch("den.propane.requests.get", autospec=True) as get_mock:
-            propane._get_token("user", "password")
+        session = mock.MagicMock()
+        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock:
+            propane._get_token(session, "user", "password")
             url_mock.assert_called_once_with(path="getToken")
-            get_mock.assert_called_once_with(
-                url_mock(), auth=requests.auth.HTTPBasicAuth("user", "password"), verify=False)
+            session.get.assert_called_once_with(url_mock(), auth=requests.auth.HTTPBasicAuth("user", "password"))
 
     @staticmethod
     def test_get_devices():
-        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock, \
-             mock.patch("den.propane.requests.get", autospec=True) as get_mock:
-            propane._get_devices("token")
+        session = mock.MagicMock()
+        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock:
+            propane._get_devices(session, "token")
             url_mock.assert_called_once_with(token="token", path="devices")
-            get_mock.assert_called_once_with(url_mock(), verify=False)
+            session.get.assert_called_once_with(url_mock())
 
     @staticmethod
     def test_get_data():
-        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock, \
-             mock.patch("den.propane.requests.get", autospec=True) as get_mock:
-            propane._get_data("token", "device")
+        session = mock.MagicMock()
+        with mock.patch("den.propane._get_api_url", autospec=True) as url_mock:
+            propane._get_data(session, "token", "device")
             url_mock.assert_called_once_with(token="token", path="devices/device")
-            get_mock.assert_called_once_with(url_mock(), verify=False)
+            session.get.assert_called_once_with(url_mock())
 
     def test_get_points(self):
-        with mock.patch("den.propane._get_devices", autospec=True) as devices_mock, \
-             mock.patch("den.propane._get_data", autospec=True) as data_mock:
-            devices_mock.return_value = ["54df6a066667531535371367", "54ff69057492666782350667"]
+        session = mock.MagicMock()
+        devices = ["54df6a066667531535371367", "54ff69057492666782350667"]
+        with mock.patch("den.propane._get_data", autospec=True) as data_mock:
             data_mock.return_value = {
                 "device": {
                     "name": "Sample Device",
@@ -70,7 +80,7 @@ class PropaneTestCase(unittest.TestCase):
             expected = [{
                 "measurement": "propane",
                 "tags": {
-                    "device": devices_mock.return_value[0],
+                    "device": devices[0],
                     "name": "Sample Device",
                     "fuelType": "propane",
                     "address": "6 Dane St., Somerville, MA 02143, USA",
@@ -85,7 +95,7 @@ class PropaneTestCase(unittest.TestCase):
             }, {
                 "measurement": "propane",
                 "tags": {
-                    "device": devices_mock.return_value[1],
+                    "device": devices[1],
                     "name": "Sample Device",
                     "fuelType": "propane",
                     "address": "6 Dane St., Somerville, MA 02143, USA",
@@ -98,24 +108,117 @@ class PropaneTestCase(unittest.TestCase):
                     "temperature": 72.12
                 }
             }]
-            actual = propane._get_points("token", "device")
+            actual = propane._get_points(session, "token", devices)
             self.assertEqual(expected, actual)
-            devices_mock.assert_called_once_with("token")
-            data_mock.assert_any_call("token", devices_mock.return_value[0])
-            data_mock.assert_any_call("token", devices_mock.return_value[1])
+            self.assertEqual(2, data_mock.call_count)
+            data_mock.assert_any_call(session, "token", devices[0])
+            data_mock.assert_any_call(session, "token", devices[1])
+
+    def test_get_points_into_batch(self):
+        devices = ["d0", "d1"]
+        data = {"device": {"name": "Tank", "capacity": 100, "lastReading": {"tank": 20, "time": 1}}}
+        with mock.patch("den.propane._get_data", autospec=True, return_value=data):
+            batch = PointBatch()
+            self.assertIs(batch, propane._get_points(mock.MagicMock(), "token", devices, batch=batch))
+        self.assertEqual([{"device": d, "name": "Tank"} for d in devices], [p["tags"] for p in batch])
+        self.assertEqual([{"capacity": 100.0, "tank": 20.0}] * 2, [p["fields"] for p in batch])
+
+    def test_get_points_without_devices(self):
+        self.assertEqual([], propane._get_points(mock.MagicMock(), "token", []))
 
     @staticmethod
     def test_record():
         with mock.patch("den.propane.influxdb.InfluxDBClient", autospec=True) as influx_mock, \
-             mock.patch("den.propane._get_token", autospec=True), \
+             mock.patch("den.propane.get_session", autospec=True) as session_mock, \
+             mock.patch("den.propane._get_cached_token", autospec=True) as token_mock, \
              mock.patch("den.propane._get_devices", autospec=True) as devices_mock, \
              mock.patch("den.propane._get_points", autospec=True) as points_mock:
             db = influx_mock.return_value
-            db.write_points = mock.MagicMock()
-            devices_mock.return_value = ["device"]
-            points_mock.return_value = []
+            db.request = mock.MagicMock()
+            session = session_mock.return_value
+            devices_mock.return_value = ["device0", "device1"]
+            points_mock.return_value = [
+                {"measurement": "propane", "tags": {"device": "device0"}, "fields": {"tank": 20.0}},
+                {"measurement": "propane", "tags": {"device": "device1"}, "fields": {"tank": 30.0}},
+            ]
             propane.record("database", 8083, False, "username", "password")
-            db.write_points.assert_called_once_with([], time_precision="s")
+            token_mock.assert_called_once_with(session, "username", "password", propane.TOKEN_CACHE)
+            devices_mock.assert_called_once_with(session, token_mock.return_value)
+            points_mock.assert_called_once_with(session, token_mock.return_value, ["device0", "device1"], 4)
+            db.request.assert_called_once_with(
+                url="write",
+                method="POST",
+                params={"db": "database", "precision": "s"},
+                data=b"propane,device=device0 tank=20.0\npropane,device=device1 tank=30.0\n",
+                expected_response_code=204,
+                headers={"Content-Type": "application/octet-stream"})
+            session.close.assert_called_once_with()
+
+    @staticmethod
+    def test_record_renews_rejected_token():
+        response = requests.Response()
+        response.status_code = 401
+        with mock.patch("den.propane.influxdb.InfluxDBClient", autospec=True), \
+             mock.patch("den.propane.get_session", autospec=True) as session_mock, \
+             mock.patch("den.propane._get_cached_token", autospec=True) as token_mock, \
+             mock.patch("den.propane._get_devices", autospec=True) as devices_mock, \
+             mock.patch("den.propane._get_points", autospec=True) as points_mock:
+            session = session_mock.return_value
+            token_mock.side_effect = ["expired", "renewed"]
+            devices_mock.side_effect = [requests.exceptions.HTTPError(response=response), ["device"]]
+            points_mock.return_value = []
+            propane.record("database", 8083, False, "username", "password", token_cache="cache")
+            token_mock.assert_called_with(session, "username", "password", "cache", renew=True)
+            devices_mock.assert_called_with(session, "renewed")
+            points_mock.assert_called_once_with(session, "renewed", ["device"], 4)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, "den", "tokens.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_token_cache(self):
+        propane._write_token_cache(self.cache, "user", "token", 100.0)
+        propane._write_token_cache(self.cache, "other", "other token", 200.0)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.cache).st_mode))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(os.path.dirname(self.cache)).st_mode))
+        self.assertEqual({"token": "token", "expires": 100.0}, propane._read_token_cache(self.cache, "user"))
+        self.assertEqual({"token": "other token", "expires": 200.0}, propane._read_token_cache(self.cache, "other"))
+
+    def test_read_missing_or_invalid_token_cache(self):
+        self.assertIsNone(propane._read_token_cache(self.cache, "user"))
+        os.makedirs(os.path.dirname(self.cache))
+        with open(self.cache, "w") as f:
+            f.write("not JSON")
+        self.assertIsNone(propane._read_token_cache(self.cache, "user"))
+
+    def test_get_cached_token(self):
+        session = mock.MagicMock()
+        with mock.patch("den.propane._get_token", autospec=True) as token_mock, \
+             mock.patch("den.propane.time.time", autospec=True) as time_mock:
+            token_mock.return_value = "token0"
+            time_mock.return_value = 1000.0
+            self.assertEqual("token0", propane._get_cached_token(session, "user", "password", self.cache))
+            with open(self.cache) as f:
+                self.assertEqual(1000.0 + propane.TOKEN_LIFETIME, json.load(f)["user"]["expires"])
+
+            token_mock.return_value = "token1"
+            time_mock.return_value = 1000.0 + propane.TOKEN_LIFETIME - propane.TOKEN_RENEWAL_MARGIN - 1
+            self.assertEqual("token0", propane._get_cached_token(session, "user", "password", self.cache))
+            token_mock.assert_called_once_with(session, "user", "password")
+
+            time_mock.return_value += 1
+            self.assertEqual("token1", propane._get_cached_token(session, "user", "password", self.cache))
+            self.assertEqual("token1", propane._read_token_cache(self.cache, "user")["token"])
+
+            token_mock.return_value = "token2"
+            self.assertEqual("token2", propane._get_cached_token(session, "user", "password", self.cache, renew=True))
+            self.assertEqual("token2", propane._get_cached_token(session, "user", "password", None))
+            self.assertEqual("token2", propane._read_token_cache(self.cache, "user")["token"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from den import archive
+from den import replay
+
+RESPONSES = os.path.join(os.path.dirname(__file__), "responses.txt")
+
+SNAPSHOT = {
+    "devices": {
+        "thermostats": {
+            "t1": {
+                "device_id": "t1",
+                "name": "Hall",
+                "ambient_temperature_f": 68,
+                "target_temperature_f": 70,
+                "hvac_state": "heating"
+            }
+        }
+    },
+    "structures": {
+        "s1": {
+            "structure_id": "s1",
+            "name": "Home",
+            "away": "home",
+            "thermostats": ["t1"]
+        }
+    }
+}
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = MagicMock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _lines(self):
+        return b"".join(c[0][0] for c in self.db.write.call_args_list).splitlines()
+
+    def _archive(self, times=(100.0, 200.0)):
+        with open(RESPONSES, "rb") as f:
+            stream = f.read()
+        with archive.StreamRecorder(self.directory, interval=50, compression="gzip") as recorder:
+            for t in times:
+                recorder.write(stream, t)
+
+    def _snapshots(self, n):
+        path = os.path.join(self.directory, "snapshots.ndjson")
+        with open(path, "w") as f:
+            for i in range(n):
+                f.write(json.dumps(dict(SNAPSHOT, time=1000 + i)) + "\n")
+        return path
+
+    def test_replay_archive(self):
+        self._archive()
+        count = replay.replay(self.db, [self.directory], workers=0)
+        lines = self._lines()
+        self.assertEqual(count, len(lines))
+        self.assertEqual(2, len(archive.read_index(self.directory)))
+        times = set(l.rsplit(b" ", 1)[1] for l in lines)
+        self.assertEqual(set([b"100", b"200"]), times)
+        for call in self.db.write.call_args_list:
+            self.assertEqual("s", call[0][1])
+
+    def test_replay_raw_stream(self):
+        count = replay.replay(self.db, [RESPONSES], workers=0)
+        self.assertGreater(count, 0)
+        self.assertEqual(set([str(int(os.path.getmtime(RESPONSES))).encode("ascii")]),
+                         set(l.rsplit(b" ", 1)[1] for l in self._lines()))
+
+    def test_replay_truncated_segment(self):
+        self._archive()
+        expected = replay.load(replay.get_units([self.directory])[0])[1]
+        path = archive.read_index(self.directory)[0][1]
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:-40])
+        with patch("den.replay.LOG") as log_mock:
+            _, count, data = replay.load(replay.get_units([self.directory])[0])
+        self.assertTrue(log_mock.warning.called)
+        self.assertGreater(count, 0)
+        self.assertLess(count, expected)
+        self.assertEqual(count, len(data.splitlines()))
+
+    def test_replay_snapshots(self):
+        path = self._snapshots(10)
+        self.assertEqual(20, replay.replay(self.db, [path], workers=0, shard_size=100))
+        lines = self._lines()
+        self.assertEqual(20, len(lines))
+        self.assertEqual(set(str(1000 + i).encode("ascii") for i in range(10)),
+                         set(l.rsplit(b" ", 1)[1] for l in lines))
+
+    def test_replay_process_pool(self):
+        self._archive()
+        path = self._snapshots(10)
+        expected = replay.replay(self.db, [self.directory, path], workers=0, shard_size=100)
+        lines = sorted(self._lines())
+        self.db.reset_mock()
+        self.assertEqual(expected, replay.replay(self.db, [self.directory, path], workers=2, shard_size=100))
+        self.assertEqual(lines, sorted(self._lines()))
+
+    def test_replay_batches(self):
+        path = self._snapshots(10)
+        replay.replay(self.db, [path], workers=0, batch_bytes=200)
+        self.assertGreater(self.db.write.call_count, 1)
+        for call in self.db.write.call_args_list:
+            self.assertTrue(call[0][0].endswith(b"\n"))
+        self.assertEqual(20, len(self._lines()))
+
+    def test_replay_resumes(self):
+        path = self._snapshots(10)
+        progress = os.path.join(self.directory, "progress")
+        self.db.write.side_effect = [None, IOError("down")]
+        self.assertRaises(IOError, replay.replay, self.db, [path], workers=0, shard_size=200, progress=progress)
+        self.db.reset_mock(side_effect=True)
+        self.db.write.side_effect = None
+        first = replay.get_units([path], 200)[0]
+        self.assertTrue(replay.Progress(progress).is_done(first))
+        self.assertEqual(18, replay.replay(self.db, [path], workers=0, shard_size=200, progress=progress))
+        self.assertEqual(0, replay.replay(self.db, [path], workers=0, shard_size=200, progress=progress))
+
+    def test_get_units(self):
+        path = self._snapshots(10)
+        units = replay.get_units([path], 100)
+        self.assertEqual(10, len(units))
+        self.assertEqual(0, units[0][1])
+        self.assertEqual(os.path.getsize(path), units[-1][2])
+        for (_, _, end, _), (_, start, _, _) in zip(units, units[1:]):
+            self.assertEqual(end, start)
+
+    def test_split(self):
+        data = b"a\nbb\nccc\n"
+        self.assertEqual([b"a\nbb\n", b"ccc\n"], list(replay._split(data, 6)))
+        self.assertEqual([b"a\n", b"bb\n", b"ccc\n"], list(replay._split(data, 2)))
+        self.assertEqual([data], list(replay._split(data, 100)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
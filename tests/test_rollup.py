@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from den import rollup
+
+MEASUREMENTS = {"thermostat": (["humidity", "temperature"], ["device_id"])}
+
+
+def _point(time, humidity, temperature=20.0, device_id="a", measurement="thermostat"):
+    return {
+        "measurement": measurement,
+        "tags": {
+            "device_id": device_id,
+            "hvac_state": "off"
+        },
+        "fields": {
+            "humidity": humidity,
+            "temperature": temperature,
+            "label": "x"
+        },
+        "time": time
+    }
+
+
+class RollupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.writer = MagicMock()
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, "rollup.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _written(self):
+        return [p for c in self.writer.write_points.call_args_list for p in c[0][0]]
+
+    @patch("den.rollup.now")
+    def test_window_closed_by_later_point(self, now):
+        now.return_value = 1000
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60)
+        r.write_points([_point(960, 40), _point(970, 44, 21.0)])
+        r.write_points([_point(1030, 50)])
+        rollups = [p for p in self._written() if p["measurement"] == "thermostat_rollup"]
+        self.assertEqual([{
+            "measurement": "thermostat_rollup",
+            "tags": {
+                "device_id": "a"
+            },
+            "fields": {
+                "humidity_min": 40.0,
+                "humidity_max": 44.0,
+                "humidity_mean": 42.0,
+                "humidity_last": 44.0,
+                "humidity_count": 2,
+                "temperature_min": 20.0,
+                "temperature_max": 21.0,
+                "temperature_mean": 20.5,
+                "temperature_last": 21.0,
+                "temperature_count": 2
+            },
+            "time": 960
+        }], rollups)
+        self.assertEqual(3, len([p for p in self._written() if p["measurement"] == "thermostat"]))
+
+    @patch("den.rollup.now")
+    def test_window_closed_by_time(self, now):
+        now.return_value = 1000
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60)
+        r.write_points([_point(1000, 40), _point(1000, 60, device_id="b")])
+        self.assertEqual([], [p for p in self._written() if p["measurement"] == "thermostat_rollup"])
+        now.return_value = 1080
+        r.write_points([{"measurement": "weather", "tags": {}, "fields": {"humidity": 1}}])
+        rollups = [p for p in self._written() if p["measurement"] == "thermostat_rollup"]
+        self.assertEqual(["a", "b"], sorted(p["tags"]["device_id"] for p in rollups))
+        self.assertIn("weather", [p["measurement"] for p in self._written()])
+
+    @patch("den.rollup.now")
+    def test_stamps_points_without_time(self, now):
+        now.return_value = 1000
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60)
+        point = _point(0, 40)
+        del point["time"]
+        r.write_points([point])
+        self.assertEqual(1000, point["time"])
+        self.assertEqual(960, r._windows[("thermostat", (("device_id", "a"), ))][0])
+
+    @patch("den.rollup.now")
+    def test_rollup_only(self, now):
+        now.return_value = 1000
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60, raw=False)
+        r.write_points([_point(1000, 40)])
+        self.assertFalse(self.writer.write_points.called)
+
+    @patch("den.rollup.now")
+    def test_checkpoint(self, now):
+        now.return_value = 1000
+        with rollup.Rollup(self.writer, MEASUREMENTS, 60, self.checkpoint, raw=False) as r:
+            r.write_points([_point(1000, 40)])
+        self.assertFalse(self.writer.write_points.called)
+
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60, self.checkpoint, raw=False)
+        r.write_points([_point(1010, 50)])
+        now.return_value = 1020
+        r.close()
+        now.return_value = 1100
+        r.write_points([])
+        rollup_point, = self._written()
+        self.assertEqual(2, rollup_point["fields"]["humidity_count"])
+        self.assertEqual(45.0, rollup_point["fields"]["humidity_mean"])
+
+    @patch("den.rollup.now")
+    def test_checkpoint_of_other_window_is_ignored(self, now):
+        now.return_value = 1000
+        with rollup.Rollup(self.writer, MEASUREMENTS, 60, self.checkpoint) as r:
+            r.write_points([_point(1000, 40)])
+        self.assertEqual({}, rollup.Rollup(self.writer, MEASUREMENTS, 3600, self.checkpoint)._windows)
+
+    def test_rejects_other_precisions(self):
+        r = rollup.Rollup(self.writer, MEASUREMENTS, 60)
+        self.assertRaises(ValueError, r.write_points, [], time_precision="ms")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import threading
+import unittest
+
+from mock import MagicMock
+
+from den import scheduler
+
+
+class JobTestCase(unittest.TestCase):
+    def test_start(self):
+        job = scheduler.Job("test", MagicMock(), 60)
+        job.start(100.0)
+        self.assertEqual(100.0, job.due)
+
+    def test_jitter(self):
+        job = scheduler.Job("test", MagicMock(), 60, jitter=5)
+        job.start(100.0)
+        self.assertTrue(100.0 <= job.due <= 105.0)
+        job.schedule(101.0)
+        self.assertEqual(160.0, job.tick)
+        self.assertTrue(160.0 <= job.due <= 165.0)
+
+    def test_schedule_keeps_grid(self):
+        job = scheduler.Job("test", MagicMock(), 60)
+        job.start(100.0)
+        job.schedule(110.0)
+        self.assertEqual(160.0, job.due)
+        job.schedule(165.0)
+        self.assertEqual(220.0, job.due)
+
+    def test_schedule_skips_missed_ticks(self):
+        job = scheduler.Job("test", MagicMock(), 60)
+        job.start(100.0)
+        job.schedule(290.0)
+        self.assertEqual(340.0, job.due)
+
+    def test_schedule_coalesces_missed_ticks(self):
+        job = scheduler.Job("test", MagicMock(), 60, missed=scheduler.COALESCE)
+        job.start(100.0)
+        job.schedule(290.0)
+        self.assertEqual(280.0, job.due)
+        job.schedule(291.0)
+        self.assertEqual(340.0, job.due)
+
+    def test_unknown_missed_policy(self):
+        self.assertRaises(ValueError, scheduler.Job, "test", MagicMock(), 60, missed="burst")
+
+    def test_run_logs_errors(self):
+        func = MagicMock(side_effect=ValueError("test"))
+        scheduler.Job("test", func, 60).run()
+        func.assert_called_once_with()
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_run_until_stopped(self):
+        ran = threading.Event()
+        runs = []
+
+        def func():
+            runs.append(1)
+            if len(runs) == 3:
+                ran.set()
+
+        runner = scheduler.Scheduler([scheduler.Job("test", func, 0.01)])
+        runner.start()
+        self.assertTrue(ran.wait(5))
+        runner.stop()
+        count = len(runs)
+        self.assertTrue(count >= 3)
+        ran.wait(0.05)
+        self.assertEqual(count, len(runs))
+
+    def test_stop_without_jobs(self):
+        runner = scheduler.Scheduler([])
+        runner.start()
+        runner.stop()
+        self.assertFalse(runner._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
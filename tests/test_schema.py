@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import unittest
+
+from mock import patch
+
+from den import schema
+from den.lineprotocol import PointBatch
+
+
+class SchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.schema = schema.Schema(
+            "test", ["name", "mode"], ["temperature", "mode", "humidity"],
+            renames={"mode": "is_on"},
+            converters={"mode": lambda v: 1 if v == "on" else 0},
+            nested_keys=["reading"],
+            ignore_keys=["time"])
+
+    def test_project(self):
+        data = {"name": "a", "mode": "on", "temperature": "68", "reading": {"humidity": 40, "time": 1}}
+        expected = {
+            "measurement": "test",
+            "tags": {"name": "a", "mode": "on", "device": "d"},
+            "fields": {"is_on": 1, "temperature": 68.0, "humidity": 40.0}
+        }
+        self.assertEqual(expected, self.schema.project(data, {"device": "d"}))
+
+    def test_append(self):
+        batch = PointBatch()
+        data = {"name": "a", "mode": "on", "temperature": "68", "reading": {"humidity": 40, "time": 1}}
+        tags = {"device": "d"}
+        self.schema.append(batch, data, tags, 10)
+        self.schema.append(batch, {"name": "a", "mode": "on", "temperature": "warm"}, tags, 20)
+        self.assertEqual({"device": "d"}, tags)
+        points = list(batch)
+        self.assertEqual([10, 20], [p.pop("time") for p in points])
+        self.assertEqual([self.schema.project(data, tags), {
+            "measurement": "test",
+            "tags": {"name": "a", "mode": "on", "device": "d"},
+            "fields": {"is_on": 1}
+        }], points)
+        self.assertEqual(1, len(batch._prefixes))
+
+    def test_project_does_not_modify_tags(self):
+        tags = {"device": "d"}
+        self.schema.project({"name": "a"}, tags)
+        self.assertEqual({"device": "d"}, tags)
+
+    def test_project_reports_unknown_keys(self):
+        with patch("den.schema.LOG") as log_mock:
+            point = self.schema.project({"name": "a", "summary": "Rain", "time": 1})
+            self.assertEqual({"name": "a"}, point["tags"])
+            self.assertEqual(1, log_mock.warning.call_count)
+
+    def test_project_does_not_report_unknown_keys(self):
+        quiet = schema.Schema("test", ["name"], [], report_unknown=False)
+        with patch("den.schema.LOG") as log_mock:
+            quiet.project({"name": "a", "summary": "Rain"})
+            self.assertFalse(log_mock.warning.called)
+
+    def test_project_reports_invalid_values(self):
+        with patch("den.schema.LOG") as log_mock:
+            point = self.schema.project({"temperature": "warm", "humidity": None, "reading": 1})
+            self.assertEqual({}, point["fields"])
+            self.assertEqual(3, log_mock.warning.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from influxdb.exceptions import InfluxDBClientError
+from mock import MagicMock, patch
+
+from den import sinks
+
+POINTS = [{"measurement": "thermostat", "tags": {"name": "a b"}, "fields": {"humidity": 40.0}, "time": 10}]
+
+
+class SinksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_file_sink(self):
+        path = os.path.join(self.directory, "points.lp")
+        for data in (b"a v=1 1\n", b"b v=2 2\n"):
+            sink = sinks.FileSink(path)
+            self.assertTrue(sink.write(data, "s"))
+            sink.close()
+        with open(path, "rb") as f:
+            self.assertEqual(b"a v=1 1\nb v=2 2\n", f.read())
+
+    def test_sqlite_sink(self):
+        path = os.path.join(self.directory, "points.db")
+        sink = sinks.SQLiteSink(path)
+        sink.write(b'thermostat,name=a\\ b humidity=40.0 10\nweather\\,x summary="a b"\n', "s")
+        sink.close()
+        connection = sqlite3.connect(path)
+        try:
+            rows = connection.execute("SELECT measurement, time, precision FROM points ORDER BY rowid").fetchall()
+        finally:
+            connection.close()
+        self.assertEqual([("thermostat", 10, "s"), ("weather\\,x", None, "s")], rows)
+
+    def test_open_sink(self):
+        self.assertEqual("-", sinks.open_sink("stdout").path)
+        self.assertIsInstance(sinks.open_sink("sqlite:" + os.path.join(self.directory, "a.db")), sinks.SQLiteSink)
+        self.assertRaises(ValueError, sinks.open_sink, "influxdb")
+        self.assertRaises(ValueError, sinks.open_sink, "file:")
+
+    def test_fan_out(self):
+        fast = MagicMock()
+        failing = MagicMock()
+        failing.write.side_effect = IOError("full disk")
+        with patch("den.sinks.LOG") as log_mock:
+            with sinks.FanOut([fast, failing], retries=2, retry_interval=0) as fan_out:
+                self.assertTrue(fan_out.write_points(POINTS, time_precision="s"))
+                self.assertTrue(fan_out.write_points([], time_precision="s"))
+            self.assertTrue(log_mock.exception.called)
+        fast.write.assert_called_once_with(b"thermostat,name=a\\ b humidity=40.0 10\n", "s")
+        self.assertEqual(fast.write.call_args, failing.write.call_args)
+        self.assertEqual(3, failing.write.call_count)
+        fast.close.assert_called_once_with()
+
+    def test_fan_out_retries(self):
+        flaky = MagicMock()
+        flaky.write.side_effect = [IOError("down"), True]
+        rejecting = MagicMock()
+        rejecting.write.side_effect = InfluxDBClientError("unable to parse", 400)
+        with patch("den.sinks.LOG") as log_mock:
+            with sinks.FanOut([flaky, rejecting], retry_interval=0) as fan_out:
+                fan_out.write(b"m v=1 1\n", "s")
+            self.assertTrue(log_mock.warning.called)
+            self.assertTrue(log_mock.exception.called)
+        self.assertEqual(2, flaky.write.call_count)
+        self.assertEqual(1, rejecting.write.call_count)
+
+    def test_slow_sink_does_not_block(self):
+        release = threading.Event()
+        slow = MagicMock()
+        slow.write.side_effect = lambda *args: release.wait(5)
+        fast = MagicMock()
+        fan_out = sinks.FanOut([slow, fast], queue_size=1)
+        with patch("den.sinks.LOG") as log_mock:
+            for i in range(4):
+                fan_out.write(b"m v=1 %d\n" % i, "s")
+                deadline = time.time() + 5
+                while fast.write.call_count <= i and time.time() < deadline:
+                    time.sleep(0.001)
+            self.assertTrue(log_mock.warning.called)
+        release.set()
+        fan_out.close()
+        self.assertEqual(4, fast.write.call_count)
+        self.assertLess(slow.write.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from influxdb.exceptions import InfluxDBClientError
+from mock import MagicMock, patch
+
+from den import spool
+
+
+def _points(n, start=0):
+    return [{"measurement": "test", "tags": {}, "fields": {"value": i}, "time": i} for i in range(start, start + n)]
+
+
+def _lines(n, start=0):
+    return b"".join(b"test value=%di %d\n" % (i, i) for i in range(start, start + n))
+
+
+class SpoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _drain(self, s, size=2**20):
+        data, position = s.read(s.position, size)
+        s.commit(position)
+        return data
+
+    def test_write_points(self):
+        with spool.Spool(self.directory) as s:
+            self.assertTrue(s.write_points(_points(3)))
+            self.assertEqual(_lines(3), self._drain(s))
+            self.assertEqual(b"", self._drain(s))
+
+    def test_write_points_stamps_time(self):
+        with spool.Spool(self.directory) as s:
+            s.write_points([{"measurement": "test", "tags": {}, "fields": {"value": 1}}])
+            self.assertTrue(self._drain(s).rsplit(b" ", 1)[1].strip().isdigit())
+
+    def test_write_closed(self):
+        s = spool.Spool(self.directory)
+        s.close()
+        self.assertRaises(ValueError, s.write_points, _points(1))
+
+    def test_read_complete_lines(self):
+        with spool.Spool(self.directory) as s:
+            s.write(_lines(10))
+            data, position = s.read(s.position, 30)
+            self.assertTrue(data.endswith(b"\n"))
+            self.assertTrue(_lines(10).startswith(data))
+            data, _ = s.read(position, 2**20)
+            self.assertEqual(_lines(10), _lines(10)[:position[1]] + data)
+
+    def test_read_long_line(self):
+        with spool.Spool(self.directory) as s:
+            s.write(_lines(1))
+            data, _ = s.read(s.position, 4)
+            self.assertEqual(_lines(1), data)
+
+    def test_segments(self):
+        with spool.Spool(self.directory, segment_size=40) as s:
+            for i in range(10):
+                s.write(_lines(1, i))
+            self.assertGreater(len(s._sizes), 1)
+            self.assertEqual(_lines(10), b"".join(iter(lambda: self._drain(s, 30), b"")))
+            self.assertEqual([s._path(s._segment), os.path.join(self.directory, spool.OFFSET_FILE)],
+                             sorted(os.path.join(self.directory, n) for n in os.listdir(self.directory)))
+
+    def test_resume(self):
+        with spool.Spool(self.directory, segment_size=40) as s:
+            for i in range(10):
+                s.write(_lines(1, i))
+            data = self._drain(s, 50)
+        with spool.Spool(self.directory) as s:
+            self.assertEqual(_lines(10), data + b"".join(iter(lambda: self._drain(s), b"")))
+
+    def test_resume_drops_partial_line(self):
+        with spool.Spool(self.directory) as s:
+            s.write(_lines(2))
+            s._file.write(b"test value=")
+        with spool.Spool(self.directory) as s:
+            s.write(_lines(1, 2))
+            self.assertEqual(_lines(3), b"".join(iter(lambda: self._drain(s), b"")))
+
+    def test_evict(self):
+        with spool.Spool(self.directory, max_size=100, segment_size=40) as s:
+            for i in range(10):
+                s.write(_lines(1, i))
+            self.assertLessEqual(s.size, 100)
+            self.assertGreater(s.evicted, 0)
+            data = b"".join(iter(lambda: self._drain(s), b""))
+            self.assertTrue(_lines(10).endswith(data))
+            self.assertNotEqual(_lines(10), data)
+
+
+class DrainerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = spool.Spool(self.directory)
+        self.db = MagicMock()
+
+    def tearDown(self):
+        self.spool.close()
+        shutil.rmtree(self.directory)
+
+    def _drainer(self):
+        drainer = spool.Drainer(self.spool, self.db, batch_bytes=30)
+        drainer.close()
+        self.db.reset_mock()
+        return drainer
+
+    def test_drain(self):
+        drainer = self._drainer()
+        self.spool.write(_lines(10))
+        while drainer.drain():
+            pass
+        self.assertGreater(self.db.write.call_count, 1)
+        self.assertEqual(_lines(10), b"".join(c[0][0] for c in self.db.write.call_args_list))
+        self.assertEqual("s", self.db.write.call_args[0][1])
+        self.assertEqual(0, drainer.drain())
+
+    def test_drain_failure(self):
+        drainer = self._drainer()
+        self.spool.write(_lines(10))
+        self.db.write.side_effect = IOError("down")
+        self.assertRaises(IOError, drainer.drain)
+        self.db.write.side_effect = None
+        while drainer.drain():
+            pass
+        self.assertEqual(_lines(10), b"".join(c[0][0] for c in self.db.write.call_args_list[1:]))
+
+    def test_drain_rejected(self):
+        drainer = self._drainer()
+        self.spool.write(_lines(10))
+        error = InfluxDBClientError("unable to parse", 400)
+        self.db.write.side_effect = [error, None, InfluxDBClientError("timeout", 500)]
+        with patch("den.spool.LOG"):
+            self.assertGreater(drainer.drain(), 0)
+            self.assertGreater(drainer.drain(), 0)
+            self.assertRaises(InfluxDBClientError, drainer.drain)
+        rejected = self.db.write.call_args_list[0][0][0]
+        with open(os.path.join(self.directory, spool.QUARANTINE_FILE), "rb") as f:
+            self.assertEqual(rejected, f.read())
+        self.db.write.side_effect = None
+        while drainer.drain():
+            pass
+        drained = b"".join(c[0][0] for c in self.db.write.call_args_list[1:2] + self.db.write.call_args_list[3:])
+        self.assertEqual(_lines(10), rejected + drained)
+        self.assertEqual(0, self.spool._depth())
+
+    def test_background(self):
+        self.spool.write(_lines(10))
+        with spool.Drainer(self.spool, self.db, max_latency=0.01):
+            for _ in range(1000):
+                if self.spool.read(self.spool.position, 1)[0] == b"":
+                    break
+                time.sleep(0.001)
+        self.assertEqual(_lines(10), b"".join(c[0][0] for c in self.db.write.call_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
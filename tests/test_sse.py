@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import os
+import unittest
+
+from den import sse
+
+
+class ParserTestCase(unittest.TestCase):
+    def test_feed(self):
+        parser = sse.Parser()
+        actual = parser.feed(b"event: put\ndata: {}\n\nevent: keep-alive\ndata: null\n\n")
+        self.assertEqual([sse.Event("put", b"{}"), sse.Event("keep-alive", b"null")], actual)
+
+    def test_feed_partial_chunks(self):
+        stream = b"event: patch\r\ndata: {\"a\":\r\ndata: 1}\r\n\r\n"
+        parser = sse.Parser()
+        actual = []
+        for i in range(len(stream)):
+            actual.extend(parser.feed(stream[i:i + 1]))
+        self.assertEqual([sse.Event("patch", b"{\"a\":\n1}")], actual)
+
+    def test_feed_field_formats(self):
+        parser = sse.Parser()
+        self.assertEqual([sse.Event("message", b"a")], parser.feed(b": comment\ndata:a\n\n"))
+        self.assertEqual([sse.Event("message", b"")], parser.feed(b"data\n\n"))
+        self.assertEqual([sse.Event("message", b" b")], parser.feed(b"id: 1\ndata:  b\n\n"))
+        self.assertEqual([], parser.feed(b"event: put\n\n"))
+
+    def test_event_after_data_ends_event(self):
+        parser = sse.Parser()
+        actual = parser.feed(b"event: put\ndata: 1\nevent: put\ndata: 2\n")
+        self.assertEqual([sse.Event("put", b"1")], actual)
+        self.assertEqual([sse.Event("put", b"2")], parser.close())
+
+    def test_close_partial_line(self):
+        parser = sse.Parser()
+        self.assertEqual([], parser.feed(b"event: put\ndata: 1"))
+        self.assertEqual([sse.Event("put", b"1")], parser.close())
+        self.assertEqual([], parser.close())
+
+    def test_feed_line(self):
+        parser = sse.Parser()
+        self.assertIsNone(parser.feed_line(b"event: put"))
+        self.assertIsNone(parser.feed_line(b"data: 1"))
+        self.assertEqual(sse.Event("put", b"1"), parser.feed_line(b""))
+
+    def test_feed_responses(self):
+        with open(os.path.join(os.path.dirname(__file__), "responses.txt"), "rb") as f:
+            stream = f.read()
+        parser = sse.Parser()
+        events = parser.feed(stream) + parser.close()
+        self.assertEqual(12, len(events))
+        for event in events:
+            self.assertEqual("put", event.event)
+            self.assertTrue(event.data.startswith(b"{"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
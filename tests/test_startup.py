@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ["backoff", "forecastio", "influxdb", "pkg_resources", "requests"]
+"""Modules which must not be imported before a sub-command runs."""
+
+STARTUP_BUDGET = 0.15
+"""Maximum number of seconds importing ``den.__main__`` may take."""
+
+
+def _import_times(*args):
+    """Get the cumulative import time in seconds of each module imported by running python with ``args``."""
+    process = subprocess.Popen([sys.executable, "-X", "importtime"] + list(args),
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    times = {}
+    for line in stderr.decode("utf-8").splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            try:
+                times[name.strip()] = int(cumulative) / 1e6
+            except ValueError:
+                pass
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python 3.7")
+class StartupTestCase(unittest.TestCase):
+    def test_parser_does_not_import_collectors(self):
+        times = _import_times("-c", "import den.__main__; den.__main__._get_parser().parse_args(['test', 'weather'])")
+        self.assertIn("den.__main__", times)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+        self.assertNotIn("den.weather", times)
+        self.assertLess(times["den.__main__"], STARTUP_BUDGET)
+
+    def test_version_does_not_import_collectors(self):
+        times = _import_times("-m", "den", "--version")
+        self.assertIn("den", times)
+        for module in HEAVY_MODULES + ["den.thermostat", "den.weather", "den.propane"]:
+            self.assertNotIn(module, times)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
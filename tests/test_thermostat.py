@@ -7,6 +7,8 @@
 from __future__ import absolute_import
 import json
 import os
+import shutil
+import tempfile
 import types
 import unittest
 
@@ -14,7 +16,10 @@ import requests
 import responses
 from mock import MagicMock, patch
 
+from den import archive
 from den import thermostat
+from den.lineprotocol import Encoder, PointBatch
+from den.sse import Event, Parser
 
 
 class ThermostatTestCase(unittest.TestCase):
@@ -22,6 +27,9 @@ class ThermostatTestCase(unittest.TestCase):
     def setUpClass(cls):
         with open(os.path.join(os.path.dirname(__file__), "responses.txt"), "r") as f:
             cls.responses = [l for l in f]
+        parser = Parser()
+        events = parser.feed("".join(cls.responses).encode("utf-8")) + parser.close()
+        cls.values = [v for v in (json.loads(e.data.decode("utf-8")) for e in events) if v]
 
     def test_get_api_url(self):
         expected = "https://developer-api.nest.com?auth=TEST"
@@ -32,6 +40,15 @@ class ThermostatTestCase(unittest.TestCase):
         for path in ["structures", "/structures", "/structures/", "structures/"]:
             self.assertEqual(expected, thermostat._get_api_url("TEST", path))
 
+    def test_parse_accounts(self):
+        accounts = thermostat.parse_accounts("home=TOKEN1, cabin = TOKEN2\n# comment\n\nTOKEN3\n")
+        self.assertEqual([("home", "TOKEN1"), ("cabin", "TOKEN2")], accounts[:2])
+        account, token = accounts[2]
+        self.assertEqual("TOKEN3", token)
+        self.assertEqual(8, len(account))
+        self.assertNotIn("TOKEN3", account)
+        self.assertEqual(accounts[2:], thermostat.parse_accounts("TOKEN3"))
+
     @responses.activate
     def test_get_stream(self):
         url = thermostat._get_api_url("TEST")
@@ -47,89 +64,50 @@ class ThermostatTestCase(unittest.TestCase):
         self.assertIsInstance(actual, requests.Response)
         self.assertEqual(len(self.responses), len(list(actual.iter_lines())))
 
-    def test_is_event(self):
-        self.assertTrue(thermostat._is_event("event:"))
-        self.assertFalse(thermostat._is_event("event"))
-        self.assertFalse(thermostat._is_event("data:"))
-
-    def test_is_data(self):
-        self.assertTrue(thermostat._is_data("data:"))
-        self.assertFalse(thermostat._is_data("data"))
-        self.assertFalse(thermostat._is_data("event:"))
-
-    def test_process_event_returns_none_for_invalid_line(self):
-        invalid_lines = ["", ":", "event:", "event: "]
-        for line in invalid_lines:
-            self.assertIsNone(thermostat._process_event(line))
-
-    def test_process_event_returns_none_for_keep_alive_line(self):
-        self.assertIsNone(thermostat._process_event("event: keep-alive"))
-        self.assertIsNone(thermostat._process_event("event:keep-alive"))
-
-    def test_process_event_returns_event_for_valid_line(self):
-        expected = "Test event"
-        actual = thermostat._process_event("event: " + expected)
-        self.assertEqual(expected, actual)
-        actual = thermostat._process_event("event:" + expected)
-        self.assertEqual(expected, actual)
-
-    def test_process_data_returns_none_for_invalid_line(self):
-        invalid_lines = ["", ":", "data:", "data: ", "data: not JSON"]
-        for line in invalid_lines:
-            self.assertIsNone(thermostat._process_data(line))
-
-    def test_process_data_returns_list_for_valid_line(self):
-        expected = [{"key": "val"}]
-        actual = thermostat._process_data("data: " + json.dumps(expected))
-        self.assertEqual(expected, actual)
-        actual = thermostat._process_data("data:" + json.dumps(expected))
-        self.assertEqual(expected, actual)
-
-    def test_process_returns_none_for_non_data_line(self):
-        invalid_lines = ["", ":", "event:", "event: "]
-        for line in invalid_lines:
-            self.assertIsNone(thermostat._process(line))
+    def test_handle_put_replaces_data(self):
+        state = {}
+        value = thermostat._handle(state, Event("put", b'{"path": "/", "data": {"devices": {"thermostats": {}}}}'))
+        self.assertEqual({"data": {"devices": {"thermostats": {}}}}, value)
+        value = thermostat._handle(state, Event("put", b'{"path": "/devices/thermostats/t0", "data": {"a": 1}}'))
+        self.assertEqual({"data": {"devices": {"thermostats": {"t0": {"a": 1}}}}}, value)
+        value = thermostat._handle(state, Event("put", b'{"path": "/devices/thermostats/t0", "data": {"b": 2}}'))
+        self.assertEqual({"data": {"devices": {"thermostats": {"t0": {"b": 2}}}}}, value)
 
-    def test_process_returns_none_for_invalid_data_line(self):
-        invalid_lines = ["", ":", "data:", "data: ", "data: not JSON"]
-        for line in invalid_lines:
-            self.assertIsNone(thermostat._process(line))
+    def test_handle_patch_updates_data(self):
+        state = {}
+        data = b'{"path": "/", "data": {"devices": {"thermostats": {"t0": {"a": 1}}}}}'
+        thermostat._handle(state, Event("put", data))
+        value = thermostat._handle(state, Event("patch", b'{"path": "/devices/thermostats/t0", "data": {"b": 2}}'))
+        self.assertEqual({"data": {"devices": {"thermostats": {"t0": {"a": 1, "b": 2}}}}}, value)
+        self.assertEqual([{"a": 1, "b": 2}], list(value["data"]["devices"]["thermostats"].values()))
 
-    def test_process_returns_list_for_valid_data_line(self):
-        expected = [{"key": "val"}]
-        actual = thermostat._process("data: " + json.dumps(expected))
-        self.assertEqual(expected, actual)
-        actual = thermostat._process("data:" + json.dumps(expected))
-        self.assertEqual(expected, actual)
+    def test_handle_ignores_keep_alive_error_and_unknown_events(self):
+        state = {}
+        self.assertIsNone(thermostat._handle(state, Event("keep-alive", b"null")))
+        self.assertIsNone(thermostat._handle(state, Event("error", b'{"error": "test"}')))
+        self.assertIsNone(thermostat._handle(state, Event("unknown", b"{}")))
+        self.assertIsNone(thermostat._handle(state, Event("put", b"not JSON")))
+        self.assertEqual({}, state)
 
-        for r in self.responses:
-            actual = thermostat._process(r)
-            if r.startswith("event"):
-                self.assertIsNone(actual)
-            elif r.startswith("data"):
-                try:
-                    self.assertIsInstance(actual, types.DictType)
-                except AttributeError:
-                    self.assertIsInstance(actual, dict)
+    def test_handle_auth_revoked_raises(self):
+        self.assertRaises(thermostat.AuthRevokedError, thermostat._handle, {}, Event("auth_revoked", b"revoked"))
 
     def test_get_structure_points_returns_list_for_valid_data(self):
-        for r in self.responses:
-            result = thermostat._process(r)
-            if result:
-                actual = thermostat._get_structure_points(result)
-                try:
-                    self.assertIsInstance(actual, types.ListType)
-                except AttributeError:
-                    self.assertIsInstance(actual, list)
-                self.assertEqual("structure", actual[0]["measurement"])
-                try:
-                    self.assertIsInstance(actual[0]["tags"], types.DictType)
-                except AttributeError:
-                    self.assertIsInstance(actual[0]["tags"], dict)
-                try:
-                    self.assertIsInstance(actual[0]["fields"], types.DictType)
-                except AttributeError:
-                    self.assertIsInstance(actual[0]["fields"], dict)
+        for result in self.values:
+            actual = thermostat._get_structure_points(result)
+            try:
+                self.assertIsInstance(actual, types.ListType)
+            except AttributeError:
+                self.assertIsInstance(actual, list)
+            self.assertEqual("structure", actual[0]["measurement"])
+            try:
+                self.assertIsInstance(actual[0]["tags"], types.DictType)
+            except AttributeError:
+                self.assertIsInstance(actual[0]["tags"], dict)
+            try:
+                self.assertIsInstance(actual[0]["fields"], types.DictType)
+            except AttributeError:
+                self.assertIsInstance(actual[0]["fields"], dict)
 
     def test_get_structure_points_away(self):
         data = {"data": {"structures": {"sid0": {"away": "away", "thermostats": ["tid0"]}}}}
@@ -147,24 +125,42 @@ class ThermostatTestCase(unittest.TestCase):
         actual = points[0]["fields"]["is_away"]
         self.assertEqual(0, actual)
 
+    def test_get_points_with_tags(self):
+        data = {"data": {"structures": {"sid0": {"away": "home", "thermostats": ["tid0"]}},
+                         "devices": {"thermostats": {"tid0": {"device_id": "tid0", "humidity": 40}}}}}
+        structure, = thermostat._get_structure_points(data, {"account": "home"})
+        self.assertEqual({"account": "home", "away": "home", "thermostat_id": "tid0"}, structure["tags"])
+        device, = thermostat._get_thermostat_points(data, {"account": "home"})
+        self.assertEqual({"account": "home", "device_id": "tid0"}, device["tags"])
+
+    def test_get_points_into_batch(self):
+        encoder = Encoder()
+        for value in self.values:
+            points = thermostat._get_structure_points(value) + thermostat._get_thermostat_points(value)
+            batch = PointBatch(encoder=encoder)
+            self.assertIs(batch, thermostat._get_structure_points(value, batch=batch))
+            self.assertIs(batch, thermostat._get_thermostat_points(value, batch=batch))
+            batch.stamp(1500000000)
+            for point in points:
+                point["time"] = 1500000000
+            self.assertEqual(encoder.encode_points(points), batch.encode())
+
     def test_get_thermostat_points_returns_list_for_valid_data(self):
-        for r in self.responses:
-            result = thermostat._process(r)
-            if result:
-                actual = thermostat._get_thermostat_points(result)
-                try:
-                    self.assertIsInstance(actual, types.ListType)
-                except AttributeError:
-                    self.assertIsInstance(actual, list)
-                self.assertEqual("thermostat", actual[0]["measurement"])
-                try:
-                    self.assertIsInstance(actual[0]["tags"], types.DictType)
-                except AttributeError:
-                    self.assertIsInstance(actual[0]["tags"], dict)
-                try:
-                    self.assertIsInstance(actual[0]["fields"], types.DictType)
-                except AttributeError:
-                    self.assertIsInstance(actual[0]["fields"], dict)
+        for result in self.values:
+            actual = thermostat._get_thermostat_points(result)
+            try:
+                self.assertIsInstance(actual, types.ListType)
+            except AttributeError:
+                self.assertIsInstance(actual, list)
+            self.assertEqual("thermostat", actual[0]["measurement"])
+            try:
+                self.assertIsInstance(actual[0]["tags"], types.DictType)
+            except AttributeError:
+                self.assertIsInstance(actual[0]["tags"], dict)
+            try:
+                self.assertIsInstance(actual[0]["fields"], types.DictType)
+            except AttributeError:
+                self.assertIsInstance(actual[0]["fields"], dict)
 
     @responses.activate
     def test_record_writes_points_for_valid_responses(self):
@@ -179,10 +175,86 @@ class ThermostatTestCase(unittest.TestCase):
                       match_querystring=True)
         with patch("den.thermostat.influxdb.InfluxDBClient") as db_patch:
             db = db_patch.return_value
-            db.write_points = MagicMock()
+            db.request = MagicMock()
             self.assertIsNone(thermostat.record("den_test", 8087, True, "TEST"))
-            expected = 24
-            self.assertEqual(expected, db.write_points.call_count)
+            self.assertEqual(1, db.request.call_count)
+            expected = 0
+            for result in self.values:
+                expected += len(thermostat._get_structure_points(result))
+                expected += len(thermostat._get_thermostat_points(result))
+            _, kwargs = db.request.call_args
+            self.assertEqual({"db": "den_test", "precision": "s"}, kwargs["params"])
+            actual = kwargs["data"].splitlines()
+            self.assertEqual(expected, len(actual))
+            for line in actual:
+                self.assertTrue(line.rsplit(b" ", 1)[1].isdigit())
+
+    @responses.activate
+    def test_record_writes_changed_points_with_delta(self):
+        url = thermostat._get_api_url("TEST")
+        responses.add(responses.GET,
+                      url,
+                      body="".join(self.responses),
+                      status=200,
+                      content_type="text/event-stream",
+                      stream=True,
+                      adding_headers={"Accept": "text/event-stream"},
+                      match_querystring=True)
+        with patch("den.thermostat.influxdb.InfluxDBClient") as db_patch:
+            db = db_patch.return_value
+            db.request = MagicMock()
+            self.assertIsNone(thermostat.record("den_test", 8087, True, "TEST", delta=True))
+            delta_filter = thermostat.DeltaFilter(thermostat.DELTA_SERIES_KEYS)
+            expected = 0
+            for result in self.values:
+                points = thermostat._get_structure_points(result) + thermostat._get_thermostat_points(result)
+                expected += len(delta_filter.filter(points))
+            actual = db.request.call_args[1]["data"].splitlines()
+            self.assertEqual(expected, len(actual))
+
+    def test_iter_events_marks_new_stream(self):
+        stream = MagicMock()
+        stream.iter_content.return_value = [b"event: put\ndata: 1\n\n"]
+        recorder = MagicMock()
+        self.assertEqual([Event("put", b"1")], list(thermostat._iter_events(stream, recorder)))
+        self.assertEqual(["new_stream", "write"], [c[0] for c in recorder.method_calls])
+
+    def test_collector(self):
+        writer = MagicMock()
+        with patch("den.thermostat.collect", autospec=True) as collect_mock:
+            with thermostat.Collector(writer, "TEST", account="home") as collector:
+                collector.collect()
+                collector.collect()
+                session = collector.session
+                self.assertIsInstance(session, requests.Session)
+            self.assertEqual(2, collect_mock.call_count)
+            collect_mock.assert_called_with(writer, "TEST", None, None, "home", session=session)
+
+        session = MagicMock()
+        thermostat.Collector(writer, "TEST", session=session).close()
+        self.assertFalse(session.close.called)
+
+    @responses.activate
+    def test_record_to(self):
+        url = thermostat._get_api_url("TEST")
+        responses.add(responses.GET,
+                      url,
+                      body="".join(self.responses),
+                      status=200,
+                      content_type="text/event-stream",
+                      stream=True,
+                      adding_headers={"Accept": "text/event-stream"},
+                      match_querystring=True)
+        directory = tempfile.mkdtemp()
+        try:
+            with patch("den.thermostat.influxdb.InfluxDBClient"):
+                thermostat.record("den_test", 8087, True, "TEST", record_to=directory, record_compression="gzip")
+            (_, path), = archive.read_index(directory)
+            with archive.open_segment(path) as f:
+                lines = [l for l in f.read().splitlines(True) if not l.startswith(archive.TIME_COMMENT)]
+            self.assertEqual("".join(self.responses).encode("utf-8"), b"".join(lines))
+        finally:
+            shutil.rmtree(directory)
 
 
 if __name__ == "__main__":
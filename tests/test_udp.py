@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# pylint: disable=protected-access
+# pylint: disable=too-many-public-methods
+# pylint: disable=missing-docstring
+
+from __future__ import absolute_import
+import socket
+import unittest
+
+from mock import patch
+
+from den import udp
+from den.lineprotocol import PointBatch
+
+
+class UDPTestCase(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.settimeout(1.0)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def _received(self, count):
+        return [self.listener.recv(65536) for _ in range(count)]
+
+    def test_pack(self):
+        lines = [b"a" * 4, b"b" * 4, b"c" * 12, b"d"]
+        self.assertEqual([b"aaaa\nbbbb\n", b"c" * 12 + b"\n", b"d\n"], udp.pack(lines, 10))
+        self.assertEqual([], udp.pack([], 10))
+
+    def test_write_points(self):
+        points = [{"measurement": "m", "tags": {"n": "a b"}, "fields": {"v": float(i)}, "time": i} for i in range(40)]
+        with udp.UDPWriter("127.0.0.1", self.port, mtu=228) as writer:
+            self.assertTrue(writer.write_points(points, time_precision="s"))
+            self.assertEqual(6, writer.packets)
+        packets = self._received(6)
+        self.assertTrue(all(len(p) <= 200 for p in packets))
+        lines = b"".join(packets).split(b"\n")[:-1]
+        self.assertEqual(b"m,n=a\\ b v=0.0 0", lines[0])
+        self.assertEqual(b"m,n=a\\ b v=39.0 39000000000", lines[-1])
+
+    @patch("den.udp.now", return_value=1500000000)
+    def test_write_stamps_points(self, now):
+        with udp.UDPWriter("127.0.0.1", self.port, precision="s") as writer:
+            writer.write_points([{"measurement": "m", "tags": {}, "fields": {"s": "x y"}}], time_precision="s")
+            batch = PointBatch()
+            batch.append("m", {}, {"v": 1}, 10)
+            writer.write_points(batch, time_precision="s")
+        now.assert_called_once_with("s")
+        self.assertEqual([b'm s="x y" 1500000000\n', b"m v=1i 10\n"], self._received(2))
+
+    def test_send_errors_are_dropped(self):
+        with udp.UDPWriter("127.0.0.1", self.port) as writer:
+            with patch.object(writer, "_socket") as socket_mock:
+                socket_mock.send.side_effect = socket.error(111, "Connection refused")
+                self.assertTrue(writer.write(b"m v=1 1\n", "s"))
+            self.assertEqual(0, writer.packets)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
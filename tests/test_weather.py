@@ -13,6 +13,7 @@ import responses
 from mock import MagicMock, patch
 
 from den import weather
+from den.lineprotocol import Encoder
 
 
 class WeatherTestCase(unittest.TestCase):
@@ -73,11 +74,14 @@ class WeatherTestCase(unittest.TestCase):
             get_forecast = get_forecast_patch.return_value
             get_forecast.currently.return_value = forecastio.models.ForecastioDataPoint(self.data)
             db = db_patch.return_value
-            db.write_points = MagicMock()
+            db.request = MagicMock()
             self.assertIsNone(weather.record("den_test", 8087, True, "KEY", 0.0, 0.0))
             self.assertEqual(1, get_forecast_patch.call_count)
             db_patch.assert_called_once_with(database="den_test", port=8087, ssl=True)
-            db.write_points.assert_called_once_with(weather._get_weather_points("KEY", 0.0, 0.0), time_precision="s")
+            expected = Encoder().encode_points(weather._get_weather_points("KEY", 0.0, 0.0))
+            _, kwargs = db.request.call_args
+            self.assertEqual(expected, kwargs["data"])
+            self.assertEqual({"db": "den_test", "precision": "s"}, kwargs["params"])
 
 
 if __name__ == "__main__":